@@ -0,0 +1,86 @@
+"""
+Compares the NumPy analytics snapshot with the SQL paths it replaces.
+
+    python -m benchmarks.bench_analytics --scale 10m
+
+Uses the bench_queries datasets. Times the snapshot load and an incremental
+refresh, then each reporting question three ways where they exist: the
+model method (summary tables), a plain GROUP BY over articles, and the
+snapshot. Derived snapshot arrays are computed on first use after a
+refresh, so the first ("cold") and later ("warm") calls are shown apart.
+"""
+import argparse
+import time
+from benchmarks.bench_queries import SCALES, dataset
+from lib.db import connection
+from lib.db.analytics import Snapshot
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+
+GROUP_BY = {
+    'top_authors': """
+        SELECT author_id, COUNT(*) AS count FROM articles
+        GROUP BY author_id ORDER BY count DESC, author_id LIMIT 10""",
+    'author_categories': """
+        SELECT articles.author_id, magazines.category, COUNT(*) FROM articles
+        JOIN magazines ON magazines.id = articles.magazine_id
+        GROUP BY articles.author_id, magazines.category""",
+    'magazines_with_authors': """
+        SELECT magazine_id FROM articles GROUP BY magazine_id
+        HAVING COUNT(DISTINCT author_id) >= 2""",
+}
+
+
+def timed(call, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def group_by(sql):
+    with connection.get_connection() as conn:
+        return conn.execute(sql).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default='.bench-data')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    path = dataset(args.data_dir, args.scale, args.seed)
+    connection.configure_pool(database=connection.read_only_uri(path))
+
+    start = time.perf_counter()
+    snapshot = Snapshot.load()
+    load_ms = (time.perf_counter() - start) * 1000
+    refresh_ms = timed(snapshot.refresh)
+    size = snapshot.author_ids.nbytes + snapshot.magazine_ids.nbytes
+    print(f"snapshot of {len(snapshot):,} articles ({size / 2**20:.1f} MiB): "
+          f"load {load_ms:,.0f} ms, empty refresh {refresh_ms:.2f} ms")
+
+    author = Author.most_published()
+    questions = {
+        'top_authors': (Author.most_published, lambda: snapshot.top_authors(10)),
+        'author_categories': (None, snapshot.author_categories),
+        'topic_areas (1 author)': (author.topic_areas, lambda: snapshot.topic_areas(author.id)),
+        'magazines_with_authors': (Magazine.find_with_multiple_authors,
+                                   lambda: snapshot.magazines_with_authors(2)),
+    }
+    print(f"{'question':<26}{'model ms':>10}{'GROUP BY ms':>13}{'numpy cold':>12}{'numpy warm':>12}")
+    for name, (model, vectorized) in questions.items():
+        model_ms = f"{timed(model, args.repeat):.2f}" if model else '-'
+        sql = GROUP_BY.get(name)
+        group_ms = f"{timed(lambda: group_by(sql), 1):.2f}" if sql else '-'
+        snapshot._derived.clear()
+        cold_ms = timed(vectorized)
+        warm_ms = timed(vectorized, args.repeat)
+        print(f"{name:<26}{model_ms:>10}{group_ms:>13}{cold_ms:>12.2f}{warm_ms:>12.3f}")
+    connection.close_pool()
+
+
+if __name__ == '__main__':
+    main()
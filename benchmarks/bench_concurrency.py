@@ -0,0 +1,98 @@
+"""
+Multi-process read/write stress test for the connection PRAGMA profiles.
+
+    python -m benchmarks.bench_concurrency --seconds 5 --writers 2 --readers 4
+
+Each process opens its own pool on a scratch database and hammers it with
+single-row inserts (writers) or author lookups (readers). Reports the
+operations completed and any "database is locked" errors per profile.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+
+def _worker(database, profile, role, seconds, results):
+    from lib.db import connection
+    from lib.models.article import Article
+    from lib.models.author import Author
+
+    connection.configure_pool(database=database, profile=profile, size=1)
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if role == 'writer':
+                Article("Stress", 1, 1).save()
+            else:
+                Author.find_by_id(1)
+                Author.most_published()
+            ops += 1
+        except sqlite3.OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            errors += 1
+    connection.close_pool()
+    results.put((role, ops, errors))
+
+
+def _setup(database, profile):
+    from lib.db import connection
+    from lib.db.schema import setup_schema
+    from lib.models.author import Author
+    from lib.models.magazine import Magazine
+
+    connection.configure_pool(database=database, profile=profile)
+    setup_schema()
+    Author("Stress Author").save()
+    Magazine("Stress Mag", "Stress").save()
+    connection.close_pool()
+
+
+def run_stress(database, profile, writers=2, readers=2, seconds=1.0):
+    """
+    Returns {'reads', 'writes', 'errors'} for one stress run on `database`.
+    All database work happens in child processes.
+    """
+    context = multiprocessing.get_context('spawn')
+    setup = context.Process(target=_setup, args=(database, profile))
+    setup.start()
+    setup.join()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(database, profile, role, seconds, results))
+        for role in ['writer'] * writers + ['reader'] * readers
+    ]
+    for process in processes:
+        process.start()
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    for _ in processes:
+        role, ops, errors = results.get()
+        totals['writes' if role == 'writer' else 'reads'] += ops
+        totals['errors'] += errors
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<12}{'writes/s':>12}{'reads/s':>12}{'lock errors':>14}")
+    for profile in ('default', 'concurrent'):
+        with tempfile.TemporaryDirectory() as tmp:
+            totals = run_stress(os.path.join(tmp, 'stress.db'), profile,
+                                args.writers, args.readers, args.seconds)
+        print(f"{profile:<12}{totals['writes'] / args.seconds:>12,.0f}"
+              f"{totals['reads'] / args.seconds:>12,.0f}{totals['errors']:>14}")
+
+
+if __name__ == '__main__':
+    main()
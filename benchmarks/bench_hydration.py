@@ -0,0 +1,87 @@
+"""
+Compares the cost of turning article rows into Python objects.
+
+    python -m benchmarks.bench_hydration --rows 1000000
+
+Paths measured:
+  legacy   - validated constructor on a __dict__ class (the pre-__slots__ model)
+  init     - Article(**row), validated constructor on the __slots__ model
+  from_row - Article.from_row(row), trusted hydration
+  tuples   - ArticleRow._make(row), read-only namedtuples
+"""
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+from lib.models.article import Article, ArticleRow
+
+
+class LegacyArticle:
+    def __init__(self, title, author_id, magazine_id, id=None):
+        self.id = id
+        self.title = title
+        self.author_id = author_id
+        self.magazine_id = magazine_id
+
+    @property
+    def title(self):
+        return self._title
+
+    @title.setter
+    def title(self, value):
+        if not isinstance(value, str) or not 1 <= len(value) <= 255:
+            raise ValueError("Title must be between 1-255 characters")
+        self._title = value
+
+
+PATHS = {
+    'legacy': lambda row: LegacyArticle(**row),
+    'init': lambda row: Article(**row),
+    'from_row': Article.from_row,
+    'tuples': ArticleRow._make,
+}
+
+
+def load_rows(count):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE articles (
+            id INTEGER PRIMARY KEY, title TEXT, author_id INTEGER, magazine_id INTEGER)""")
+    conn.executemany(
+        "INSERT INTO articles (title, author_id, magazine_id) VALUES (?, ?, ?)",
+        ((f"Article {i}", i % 1000 + 1, i % 100 + 1) for i in range(count)))
+    return conn.execute("SELECT * FROM articles").fetchall()
+
+
+def measure(hydrate, rows):
+    gc.collect()
+    start = time.perf_counter()
+    objects = [hydrate(row) for row in rows]
+    elapsed = time.perf_counter() - start
+    del objects
+
+    gc.collect()
+    tracemalloc.start()
+    objects = [hydrate(row) for row in rows]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return elapsed, current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    rows = load_rows(args.rows)
+    print(f"{'path':<10}{'rows/s':>14}{'MiB':>10}{'bytes/row':>12}")
+    for name, hydrate in PATHS.items():
+        elapsed, memory = measure(hydrate, rows)
+        print(f"{name:<10}{args.rows / elapsed:>14,.0f}{memory / 2**20:>10.1f}{memory / args.rows:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Measures every model query path on generated datasets of a given scale.
+
+    python -m benchmarks.bench_queries --scale 100k --output before.json
+    python -m benchmarks.bench_queries --scale 100k --compare before.json
+
+Datasets come from lib.db.generate (Zipf-skewed, seeded) and are kept in
+--data-dir, so the 10m scale is only built once. Per-entity methods are
+called on authors and magazines picked through random articles, so busy
+ones are picked as often as real traffic would pick them. For each method
+the report has ops/s, latency percentiles, SQL statements per call (from
+lib.db.statements) and the peak Python memory of one call. --output writes
+it all as JSON; --compare prints the ops/s change against such a file.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from lib.db import connection, querycache, statements
+from lib.db.generate import generate, print_progress
+from lib.db.schema import setup_schema
+from lib.models.article import Article
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+
+# scale: (authors, magazines, articles)
+SCALES = {
+    '1k': (50, 10, 1_000),
+    '100k': (2_000, 100, 100_000),
+    '10m': (100_000, 2_000, 10_000_000),
+}
+
+# name: (target kind, call); per-entity calls take an Author or Magazine.
+CASES = {
+    'Author.find_by_id': ('author_id', Author.find_by_id),
+    'Author.articles': ('author', lambda author: author.articles()),
+    'Author.magazines': ('author', lambda author: author.magazines()),
+    'Author.topic_areas': ('author', lambda author: author.topic_areas()),
+    'Author.article_count': ('author', lambda author: author.article_count()),
+    'Author.most_published': (None, Author.most_published),
+    'Magazine.find_by_id': ('magazine_id', Magazine.find_by_id),
+    'Magazine.articles': ('magazine', lambda magazine: magazine.articles()),
+    'Magazine.contributors': ('magazine', lambda magazine: magazine.contributors()),
+    'Magazine.article_titles': ('magazine', lambda magazine: magazine.article_titles()),
+    'Magazine.contributing_authors': ('magazine', lambda magazine: magazine.contributing_authors()),
+    'Magazine.article_counts': (None, Magazine.article_counts),
+    'Magazine.find_with_multiple_authors': (None, Magazine.find_with_multiple_authors),
+    'Article.find_by_id': ('article_id', Article.find_by_id),
+    'Article.search': ('word', lambda word: Article.search(word)),
+}
+
+
+def dataset(data_dir, scale, seed):
+    """
+    Returns the path of the dataset for `scale`, generating it on first use
+    and migrating it on later ones. It is built under a temporary name, so an
+    interrupted build is not reused.
+    """
+    path = os.path.join(data_dir, f"{scale}-seed{seed}.db")
+    if os.path.exists(path):
+        # Bring a dataset built by an older checkout up to the current schema.
+        connection.configure_pool(database=path)
+        setup_schema()
+        connection.close_pool()
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    building = path + '.building'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(building + suffix):
+            os.remove(building + suffix)
+    connection.configure_pool(database=building)
+    setup_schema()
+    start = time.perf_counter()
+    generate(*SCALES[scale], seed=seed, progress=print_progress(sys.stderr))
+    with connection.get_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("ANALYZE")
+    connection.close_pool()
+    os.replace(building, path)
+    print(f"built {scale} dataset in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+
+def targets(count, seed):
+    """
+    Returns {kind: [argument, ...]} with `count` arguments per target kind.
+    """
+    rng = random.Random(seed)
+    with connection.get_connection() as conn:
+        last_id = conn.execute("SELECT MAX(id) FROM articles").fetchone()[0]
+        rows = []
+        while len(rows) < count:
+            row = conn.execute("SELECT id, title, author_id, magazine_id FROM articles WHERE id >= ? "
+                               "ORDER BY id LIMIT 1", (rng.randint(1, last_id),)).fetchone()
+            rows.append(row)
+    return {
+        'author_id': [row['author_id'] for row in rows],
+        'magazine_id': [row['magazine_id'] for row in rows],
+        'article_id': [row['id'] for row in rows],
+        'author': [Author.find_by_id(row['author_id']) for row in rows],
+        'magazine': [Magazine.find_by_id(row['magazine_id']) for row in rows],
+        'word': [rng.choice(row['title'].split()) for row in rows],
+    }
+
+
+def percentile(samples, p):
+    return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+
+def measure(call, args, seconds, min_ops, memory_ops):
+    """
+    Calls `call` round-robin over `args` until `seconds` have passed and at
+    least `min_ops` calls were made, then traces `memory_ops` more calls.
+    """
+    gc.collect()
+    statements.reset_stats()
+    latencies = []
+    rows = 0
+    deadline = time.perf_counter() + seconds
+    while len(latencies) < min_ops or time.perf_counter() < deadline:
+        arg = args[len(latencies) % len(args)]
+        start = time.perf_counter()
+        result = call(*arg)
+        latencies.append(time.perf_counter() - start)
+        rows += len(result) if hasattr(result, '__len__') else result is not None
+    queries = sum(entry['calls'] for entry in statements.stats().values())
+
+    peak = 0
+    for i in range(memory_ops):
+        gc.collect()
+        tracemalloc.start()
+        result = call(*args[i % len(args)])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del result
+
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / total,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] * 1000,
+        'queries_per_op': queries / len(latencies),
+        'rows_per_op': rows / len(latencies),
+        'peak_kib': peak / 1024,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default='.bench-data')
+    parser.add_argument('--seconds', type=float, default=1.0, help="time budget per method")
+    parser.add_argument('--min-ops', type=int, default=5)
+    parser.add_argument('--memory-ops', type=int, default=3)
+    parser.add_argument('--targets', type=int, default=64, help="distinct arguments per method")
+    parser.add_argument('--only', action='append', help="benchmark only these methods")
+    parser.add_argument('--query-cache', help="query cache backend: 'memory' or 'disk:<path>'")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    path = dataset(args.data_dir, args.scale, args.seed)
+    connection.configure_pool(database=connection.read_only_uri(path))
+    querycache.configure_query_cache(args.query_cache)
+    picked = targets(args.targets, args.seed)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    print(f"{'method':<38}{'ops/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}"
+          + (f"{'change':>9}" if baseline else ''))
+    for name, (kind, call) in CASES.items():
+        if args.only and name not in args.only:
+            continue
+        call_args = [(arg,) for arg in picked[kind]] if kind else [()]
+        result = results[name] = measure(call, call_args, args.seconds, args.min_ops, args.memory_ops)
+        line = (f"{name:<38}{result['ops_per_sec']:>11,.0f}{result['p50_ms']:>9.3f}"
+                f"{result['p99_ms']:>9.3f}{result['queries_per_op']:>9.1f}{result['peak_kib']:>10.1f}")
+        if name in baseline:
+            line += f"{result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1:>+9.1%}"
+        print(line)
+    connection.close_pool()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scale': args.scale, 'rows': dict(zip(('authors', 'magazines', 'articles'),
+                                                               SCALES[args.scale])),
+                       'seed': args.seed, 'query_cache': args.query_cache, 'environment': environment(), 'results': results},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
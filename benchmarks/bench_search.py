@@ -0,0 +1,81 @@
+"""
+Compares Article.search (FTS5, bm25) with a LIKE scan over article titles.
+
+    python -m benchmarks.bench_search --rows 1000000
+
+Builds a scratch database of titles drawn from a Zipf-distributed
+pseudo-word vocabulary, then times queries on a common, a mid-frequency and
+a rare word, a prefix and a two-word query. The LIKE baseline reads every
+title and returns every match, as ranking them would require; FTS5 reads
+only the posting lists of the query terms and returns the top `--limit`.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from lib.db import connection
+from lib.db.generate import VOCABULARY, pseudo_words, zipf_weights
+from lib.db.schema import setup_schema
+from lib.models.article import Article
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+
+
+def vocabulary():
+    return pseudo_words(VOCABULARY)
+
+
+def build(rows, words, seed=0):
+    rng = random.Random(seed)
+    cum_weights = zipf_weights(len(words))
+    author = Author("Bench Author").save()
+    magazine = Magazine("Bench Mag", "Bench").save()
+    titles = (' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 8))).capitalize()
+              for _ in range(rows))
+    Article.save_many(Article(title, author.id, magazine.id) for title in titles)
+
+
+def queries(words):
+    return [words[5], words[500], words[15_000], words[800][:-1], f"{words[50]} {words[300]}"]
+
+
+def time_query(run, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = run()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.configure_pool(database=os.path.join(tmp, 'search.db'))
+        setup_schema()
+        start = time.perf_counter()
+        words = vocabulary()
+        build(args.rows, words)
+        print(f"built {args.rows:,} titles in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<22}{'LIKE ms':>10}{'FTS5 ms':>10}{'speedup':>10}")
+        for query in queries(words):
+            def like():
+                with connection.get_connection() as conn:
+                    clauses = ' AND '.join('title LIKE ?' for _ in query.split())
+                    return conn.execute(
+                        f"SELECT * FROM articles WHERE {clauses}",
+                        [f"%{word}%" for word in query.split()]).fetchall()
+
+            like_ms, _ = time_query(like, args.repeat)
+            fts_ms, _ = time_query(lambda: Article.search(query, limit=args.limit), args.repeat)
+            print(f"{query:<22}{like_ms:>10.2f}{fts_ms:>10.2f}{like_ms / fts_ms:>9.1f}x")
+        connection.close_pool()
+
+
+if __name__ == '__main__':
+    main()
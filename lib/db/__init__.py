@@ -1,5 +1,12 @@
-from .connection import get_connection
+from .connection import get_connection, get_pool, configure_pool, close_pool, stream, transaction, ConnectionPool
 from .seed import seed_data
-from .schema import setup_schema
+from .cache import identity_map, configure_cache, cache_stats
+from .dirty import skipped_writes
+from .querycache import configure_query_cache, query_cache_stats
+from .schema import setup_schema, migrate, schema_version
 
-__all__ = ['get_connection', 'seed_data', 'setup_schema']
\ No newline at end of file
+__all__ = ['get_connection', 'get_pool', 'configure_pool', 'close_pool', 'stream', 'transaction',
+           'ConnectionPool',
+           'identity_map', 'configure_cache', 'cache_stats', 'skipped_writes',
+           'configure_query_cache', 'query_cache_stats',
+           'seed_data', 'setup_schema', 'migrate', 'schema_version']
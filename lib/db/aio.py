@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from lib.db.connection import get_connection, POOL_SIZE
+
+MAX_WORKERS = int(os.environ.get('ARTICLES_DB_ASYNC_WORKERS', POOL_SIZE))
+MAX_CONCURRENCY = int(os.environ.get('ARTICLES_DB_ASYNC_CONCURRENCY', 64))
+
+
+class AsyncExecutor:
+    """
+    Runs blocking model calls on a dedicated thread pool.
+
+    Each call holds a pooled connection on its worker thread for its whole
+    duration, so nested model calls share it. At most `max_concurrency` calls
+    are admitted per event loop; the rest wait without blocking the loop.
+    Cancelling the awaiting task interrupts the SQLite statement in flight.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_concurrency=MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='articles-db')
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @staticmethod
+    def _call(state, func, args, kwargs):
+        with get_connection() as conn:
+            with state['lock']:
+                if state['cancelled']:
+                    raise asyncio.CancelledError()
+                state['conn'] = conn
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with state['lock']:
+                    state['conn'] = None
+
+    async def run(self, func, *args, **kwargs):
+        state = {'lock': threading.Lock(), 'conn': None, 'cancelled': False}
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            future = loop.run_in_executor(
+                self._executor, functools.partial(self._call, state, func, args, kwargs))
+            try:
+                return await future
+            except asyncio.CancelledError:
+                with state['lock']:
+                    state['cancelled'] = True
+                    if state['conn'] is not None:
+                        state['conn'].interrupt()
+                raise
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AsyncExecutor()
+        return _executor
+
+
+def configure_executor(max_workers=MAX_WORKERS, max_concurrency=MAX_CONCURRENCY):
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, AsyncExecutor(max_workers, max_concurrency)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _executor
+
+
+async def run(func, *args, **kwargs):
+    """
+    Awaits `func(*args, **kwargs)` on the database thread pool.
+    """
+    return await get_executor().run(func, *args, **kwargs)
+
+
+async def iterate(page, batch_size=1000):
+    """
+    Async-iterates a keyset-paginated source. `page(after_id, limit)` must
+    return an iterable of objects with an `id`, ordered by id.
+    """
+    after_id = None
+    while True:
+        items = await run(lambda: list(page(after_id, batch_size)))
+        for item in items:
+            yield item
+        if len(items) < batch_size:
+            return
+        after_id = items[-1].id
@@ -0,0 +1,181 @@
+"""
+Columnar, in-memory snapshot of the article graph for reporting queries.
+
+Needs NumPy, which the rest of lib does not. A Snapshot holds
+articles(author_id, magazine_id) as two int32 arrays plus a category code
+per magazine, and answers the aggregate questions the models ask of SQL
+(top authors, topic areas, magazines with several authors) with bincount,
+unique and argpartition. refresh() appends only articles newer than the
+last one loaded.
+"""
+import numpy as np
+from lib.db import shards, statements
+from lib.db.connection import get_connection
+
+BATCH_SIZE = 100_000
+
+
+class Snapshot:
+    """
+    Use Snapshot.load(), then refresh() to pick up new articles.
+
+    Updates and deletes of loaded articles cannot be applied incrementally.
+    refresh() finds them in the change log (see lib.db.changes) and reloads
+    everything, as it does when the entries it needs were compacted away.
+    """
+
+    def __init__(self):
+        self.author_ids = np.empty(0, dtype=np.int32)
+        self.magazine_ids = np.empty(0, dtype=np.int32)
+        self.categories = []
+        self.magazine_categories = np.empty(0, dtype=np.int32)
+        self.max_id = 0
+        self.seq = None
+        self._derived = {}
+
+    @classmethod
+    def load(cls, batch_size=BATCH_SIZE):
+        snapshot = cls()
+        snapshot.refresh(batch_size=batch_size)
+        return snapshot
+
+    def __len__(self):
+        return len(self.author_ids)
+
+    def refresh(self, full=False, batch_size=BATCH_SIZE):
+        """
+        Loads the articles added since the last refresh and reloads the
+        (small) magazines table. Returns the number of articles loaded.
+        """
+        shards.check_unsharded("Snapshot")
+        with get_connection() as conn:
+            # One read transaction, so the log position matches the rows read.
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            seq = statements.fetchone(conn, 'changes.latest')[0]
+            if not full and self.seq is not None and self._needs_reload(conn, seq):
+                full = True
+            if full or self.seq is None:
+                self.author_ids = np.empty(0, dtype=np.int32)
+                self.magazine_ids = np.empty(0, dtype=np.int32)
+                self.max_id = 0
+            authors, magazines, max_id = self._load_articles(conn, batch_size)
+            self.author_ids = np.concatenate([self.author_ids, authors])
+            self.magazine_ids = np.concatenate([self.magazine_ids, magazines])
+            self.max_id = max(self.max_id, max_id)
+            self.seq = seq
+            self._load_categories(conn)
+        self._derived.clear()
+        return len(authors)
+
+    def _needs_reload(self, conn, seq):
+        # Loaded rows changed if an article was updated, deleted or inserted
+        # below max_id since self.seq, or if those entries were compacted.
+        oldest = statements.fetchone(conn, 'changes.oldest')[0]
+        if seq > self.seq and (oldest is None or oldest > self.seq + 1):
+            return True
+        return statements.fetchone(conn, 'changes.article_edits', (self.seq, self.max_id)) is not None
+
+    def _load_articles(self, conn, batch_size):
+        cursor = statements.execute(conn, 'articles.snapshot', (self.max_id,))
+        cursor.row_factory = None  # plain tuples convert to arrays much faster than Rows
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+        if not chunks:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), self.max_id
+        columns = np.concatenate(chunks)
+        return (columns[:, 1].astype(np.int32), columns[:, 2].astype(np.int32),
+                int(columns[-1, 0]))
+
+    def _load_categories(self, conn):
+        rows = statements.fetchall(conn, 'magazines.categories')
+        ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        names, codes = np.unique(np.array([row['category'] for row in rows], dtype=object),
+                                 return_inverse=True)
+        self.categories = list(names)
+        size = max(int(ids.max(initial=0)), int(self.magazine_ids.max(initial=0))) + 1
+        self.magazine_categories = np.full(size, -1, dtype=np.int32)
+        self.magazine_categories[ids] = codes
+
+    def _cached(self, name, compute):
+        if name not in self._derived:
+            self._derived[name] = compute()
+        return self._derived[name]
+
+    def author_counts(self):
+        """
+        Articles per author, indexed by author id.
+        """
+        return self._cached('author_counts', lambda: np.bincount(self.author_ids))
+
+    def magazine_counts(self):
+        """
+        Articles per magazine, indexed by magazine id.
+        """
+        return self._cached('magazine_counts', lambda: np.bincount(
+            self.magazine_ids, minlength=len(self.magazine_categories)))
+
+    def top_authors(self, n=10):
+        """
+        Returns [(author_id, article_count)] for the `n` most published
+        authors, most first, ties broken by lower id.
+        """
+        counts = self.author_counts()
+        n = min(n, int(np.count_nonzero(counts)))
+        if n <= 0:
+            return []
+        top = np.argpartition(counts, -n)[-n:]
+        top = top[np.lexsort((top, -counts[top]))]
+        return [(int(id), int(counts[id])) for id in top]
+
+    def author_categories(self):
+        """
+        An (authors x categories) matrix of article counts, indexed by
+        author id and category code (a position in self.categories).
+        """
+        def compute():
+            width = len(self.categories)
+            codes = self.magazine_categories[self.magazine_ids]
+            counts = np.bincount(self.author_ids.astype(np.int64) * width + codes,
+                                 minlength=len(self.author_counts()) * width)
+            return counts.reshape(len(self.author_counts()), width)
+        return self._cached('author_categories', compute)
+
+    def topic_areas(self, author_id):
+        """
+        Returns {category: article count} for one author, like
+        Author.topic_areas() with the counts.
+        """
+        matrix = self.author_categories()
+        if not 0 <= author_id < len(matrix):
+            return {}
+        row = matrix[author_id]
+        return {self.categories[code]: int(row[code]) for code in np.flatnonzero(row)}
+
+    def magazine_author_counts(self):
+        """
+        Distinct authors per magazine, indexed by magazine id.
+        """
+        def compute():
+            stride = np.int64(self.author_ids.max(initial=0)) + 1
+            pairs = np.unique(self.magazine_ids.astype(np.int64) * stride + self.author_ids)
+            return np.bincount(pairs // stride, minlength=len(self.magazine_categories))
+        return self._cached('magazine_author_counts', compute)
+
+    def magazines_with_authors(self, k=2):
+        """
+        Returns the ids of magazines with at least `k` distinct authors,
+        like Magazine.find_with_multiple_authors() for k=2.
+        """
+        return [int(id) for id in np.flatnonzero(self.magazine_author_counts() >= k)]
+
+    def category_counts(self):
+        """
+        Returns {category: article count} over all articles.
+        """
+        totals = self.author_categories().sum(axis=0)
+        return {name: int(total) for name, total in zip(self.categories, totals) if total}
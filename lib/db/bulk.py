@@ -0,0 +1,180 @@
+import json
+from itertools import islice
+from lib.db import statements
+
+DEFAULT_CHUNK_SIZE = 5000
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most `size` items from `iterable`.
+    """
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def fetch_grouped(conn, name, ids, hydrate):
+    """
+    Runs a named statement that takes the ids as one JSON array and returns
+    an `owner_id` column, and groups the hydrated rows by it. Every id asked
+    for is a key of the result, with an empty list if nothing matched.
+    """
+    grouped = {id: [] for id in ids}
+    if grouped:
+        for row in statements.fetchall(conn, name, (json.dumps(list(grouped)),)):
+            grouped[row['owner_id']].append(hydrate(row))
+    return grouped
+
+def checked(cls, instances):
+    """
+    Returns `instances` as a list, raising TypeError unless all are `cls`.
+    """
+    instances = list(instances)
+    for instance in instances:
+        if not isinstance(instance, cls):
+            raise TypeError(f"Expected {cls.__name__}, got {type(instance).__name__}")
+    return instances
+
+def insert_many(conn, name, params):
+    """
+    Runs the named INSERT through executemany and returns the generated ids in order.
+
+    Must be called inside a write transaction on a table with AUTOINCREMENT
+    keys: SQLite then hands out consecutive rowids, so the ids are the
+    `len(params)` values ending at last_insert_rowid().
+    """
+    if not params:
+        return []
+    statements.executemany(conn, name, params)
+    last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last - len(params) + 1, last + 1))
+
+def save_many(cls, instances, insert, update, values, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Persists `instances` of `cls` in one transaction, inserting new rows and
+    updating ones that already have an id and unsaved changes. `insert` and
+    `update` name registered statements; `values(instance)` returns the
+    column tuple shared by both; the UPDATE takes the
+    id last and rewrites every column, since executemany needs one statement.
+    """
+    from lib.db import cache, dirty, shards
+    from lib.db.connection import get_connection, record_write
+
+    instances = checked(cls, instances)
+    updated = []
+    with get_connection() as conn:
+        for chunk in chunked(instances, chunk_size):
+            new = [i for i in chunk if not i.id]
+            existing = []
+            for instance in chunk:
+                if instance.id and instance._dirty:
+                    existing.append(instance)
+                elif instance.id:
+                    dirty.skip(instance)
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            ids = insert_many(conn, insert, [values(i) for i in new])
+            # Recorded as they happen, so a rollback unassigns these ids.
+            for instance, id in zip(new, ids):
+                instance.id = id
+                record_write(instance, None)
+            if existing:
+                for instance in existing:
+                    record_write(instance, instance.id)
+                params = [values(i) + (i.id,) for i in existing]
+                statements.executemany(conn, update, params)
+                updated.extend(params)
+    router = shards.active()
+    if router and updated:
+        router.replicate_updates(update, updated)
+    for instance in instances:
+        instance._dirty = dirty.CLEAN
+        cache.register(instance)
+    return instances
+
+def upsert_many(cls, instances, name, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes `instances` of `cls` by natural key: rows whose key already
+    exists are reused, the rest are inserted, and every instance gets the id
+    of its row. `name` is an INSERT ... ON CONFLICT ... RETURNING statement
+    taking the keys as one JSON array of arrays and returning the id and key
+    columns, so each chunk is one statement. `key(instance)` returns the key.
+    """
+    from lib.db import cache, dirty
+    from lib.db.connection import get_connection, record_write
+
+    saved = []
+    with get_connection() as conn:
+        for chunk in chunked(instances, chunk_size):
+            for instance in chunk:
+                if not isinstance(instance, cls):
+                    raise TypeError(f"Expected {cls.__name__}, got {type(instance).__name__}")
+            chunk_keys = [key(instance) for instance in chunk]
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            rows = statements.fetchall(conn, name, (json.dumps(list(dict.fromkeys(chunk_keys))),))
+            ids = {tuple(row)[1:]: row[0] for row in rows}
+            for instance, instance_key in zip(chunk, chunk_keys):
+                record_write(instance, instance.id)
+                instance.id = ids[instance_key]
+            saved.extend(chunk)
+    for instance in saved:
+        instance._dirty = dirty.CLEAN
+        cache.register(instance)
+    return saved
+
+def delete_many(cls, table, ids, cascade=()):
+    """
+    Deletes the `cls` rows with the given ids in one transaction and one
+    statement, and returns how many existed. Foreign keys cascade the delete
+    to dependent rows; cached instances of the `cascade` models are dropped
+    since their ids are not known.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return 0
+    return _delete(cls, table, (json.dumps(ids),), None, cascade)
+
+def delete_where(cls, table, columns, filters, cascade=()):
+    """
+    Like delete_many(), for the rows whose columns equal every value in
+    `filters`. At least one filter is required.
+    """
+    if not filters:
+        raise ValueError("delete_where() needs at least one filter")
+    unknown = set(filters) - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(sorted(unknown))}")
+    clauses = ' AND '.join(f"{column}=?" for column in filters)
+    text = f"DELETE FROM {table} WHERE {clauses} RETURNING id"
+    return _delete(cls, table, tuple(filters.values()), text, cascade)
+
+def _delete(cls, table, params, text, cascade):
+    from lib.db import cache, shards
+    from lib.db.connection import get_connection, transaction
+
+    router = shards.active()
+    if router and table == 'articles':
+        rows = router.delete(f'{table}.delete_many', params, text)
+    elif router:
+        with get_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            rows = statements.fetchall(conn, f'{table}.delete_many', params, text)
+        if rows:
+            # Deleting the shards' copies cascades to their articles.
+            router.delete(f'{table}.delete_many', (json.dumps([row['id'] for row in rows]),))
+    else:
+        with transaction(immediate=True) as tx:
+            rows = statements.fetchall(tx.conn, f'{table}.delete_many', params, text)
+    # Only after commit: a reader could otherwise cache a row again before it is gone.
+    for row in rows:
+        cache.invalidate(cls, row['id'])
+    if rows:
+        for model in cascade:
+            cache.invalidate_model(model)
+    return len(rows)
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+CACHE_SIZE = int(os.environ.get('ARTICLES_CACHE_SIZE', 0))
+CACHE_TTL = float(os.environ['ARTICLES_CACHE_TTL']) if os.environ.get('ARTICLES_CACHE_TTL') else None
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU mapping with optional per-entry TTL.
+    A maxsize of 0 disables the cache entirely.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_rows = LRUCache(CACHE_SIZE, CACHE_TTL)
+_local = threading.local()
+_identity_stats = {'hits': 0, 'misses': 0}
+
+
+def configure_cache(maxsize=None, ttl=None):
+    """
+    Replaces the process-wide row cache. Pass maxsize=0 to disable it.
+    """
+    global _rows
+    _rows = LRUCache(_rows.maxsize if maxsize is None else maxsize, ttl)
+    return _rows
+
+
+@contextmanager
+def identity_map():
+    """
+    Within the block, loading the same (model, id) twice on this thread
+    returns the same object. Nested blocks share the outermost map.
+    """
+    if getattr(_local, 'identities', None) is not None:
+        yield _local.identities
+        return
+    _local.identities = {}
+    try:
+        yield _local.identities
+    finally:
+        _local.identities = None
+
+
+def _identities():
+    return getattr(_local, 'identities', None)
+
+
+def find(cls, id, load):
+    """
+    Returns the `cls` instance with primary key `id`, consulting the active
+    identity map and the row cache before calling `load()` for the row.
+    """
+    key = (cls, id)
+    identities = _identities()
+    if identities is not None:
+        instance = identities.get(key)
+        if instance is not None:
+            _identity_stats['hits'] += 1
+            return instance
+        _identity_stats['misses'] += 1
+
+    row = _rows.get(key) if _rows.maxsize > 0 else None
+    if row is None:
+        row = load()
+        if row is None:
+            return None
+        row = dict(row)
+        _rows.set(key, row)
+
+    instance = cls.from_row(row)
+    if identities is not None:
+        identities[key] = instance
+    return instance
+
+
+def register(instance):
+    """
+    Records a freshly saved instance: the stale cached row is dropped and
+    the active identity map, if any, now points at this object.
+    """
+    key = (type(instance), instance.id)
+    if _rows.maxsize > 0:
+        _rows.invalidate(key)
+    identities = _identities()
+    if identities is not None:
+        identities[key] = instance
+
+
+def invalidate(cls, id):
+    key = (cls, id)
+    _rows.invalidate(key)
+    identities = _identities()
+    if identities is not None:
+        identities.pop(key, None)
+
+
+def invalidate_model(cls):
+    """
+    Drops every cached `cls` row, e.g. after a cascade deleted rows whose
+    ids are not known.
+    """
+    _rows.invalidate_where(lambda key: key[0] is cls)
+    identities = _identities()
+    if identities is not None:
+        for key in [key for key in identities if key[0] is cls]:
+            del identities[key]
+
+
+def clear():
+    _rows.clear()
+    identities = _identities()
+    if identities is not None:
+        identities.clear()
+
+
+def cache_stats():
+    return {
+        'identity_map': dict(_identity_stats),
+        'rows': _rows.stats(),
+    }
@@ -0,0 +1,218 @@
+"""
+Change feed over authors, magazines and articles.
+
+Triggers from the change-log migration append one entry per inserted,
+updated or deleted row to the changes table, numbered by a monotonic seq.
+A consumer keeps its position in change_cursors and reads the entries after
+it in batches, so syncing a cache or index costs O(changes) rather than a
+re-read of every table. compact() drops entries every consumer has seen.
+
+Delivery is at least once: ChangeFeed.batches() moves the cursor only after
+the consumer has finished a batch. Entries carry ids, not row contents;
+read the current row (or notice it is gone) with the models.
+
+With sharding on, every shard logs its own article writes and keeps its
+own cursors, so a feed tails the catalog and each shard separately; seqs
+are only ordered within one of them. A reshard shows up as each moved
+article's insert on its new shard and delete on its old one.
+"""
+from collections import namedtuple
+from lib.db import shards, statements
+from lib.db.connection import get_connection
+
+BATCH_SIZE = 1000
+COMPACT_BATCH_SIZE = 10_000
+
+# `shard` is the id of the shard whose log holds the entry, None for the catalog.
+Change = namedtuple('Change', 'seq table row_id op shard', defaults=(None,))
+
+
+def _logs():
+    """
+    Yields (shard id, connection factory, statement reading the log) for
+    the catalog and, while sharded, every shard stored elsewhere.
+    """
+    yield None, get_connection, 'changes.after'
+    router = shards.active()
+    if router:
+        for shard in list(router.shards.values()):
+            if not shard.is_catalog:
+                yield shard.id, shard.connection, 'changes.articles_after'
+
+
+def latest_seq():
+    """
+    The seq of the newest change ever logged, compacted or not.
+    """
+    with get_connection() as conn:
+        return statements.fetchone(conn, 'changes.latest')[0]
+
+
+def consumers():
+    """
+    Returns {consumer: seq} for every registered consumer.
+    """
+    with get_connection() as conn:
+        return dict(statements.fetchall(conn, 'changes.cursors'))
+
+
+def compact(batch_size=COMPACT_BATCH_SIZE):
+    """
+    Deletes the entries every registered consumer has acknowledged,
+    `batch_size` per transaction so writers are not held up, from the
+    catalog's log and every shard's. With no consumers nothing is deleted,
+    and a shard's entries are kept until every consumer has read them.
+    Returns the number of entries removed.
+    """
+    names = list(consumers())
+    removed = 0
+    for shard_id, connect, _ in _logs():
+        if shard_id is not None:
+            # Consumers that have not read this shard yet need all of it.
+            with connect() as conn:
+                statements.executemany(conn, 'changes.subscribe', [(name, 0) for name in names])
+        while True:
+            with connect() as conn:
+                deleted = statements.execute(conn, 'changes.compact', (batch_size,)).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                break
+    return removed
+
+
+def collapse(changes):
+    """
+    Returns {(table, row_id): op} with the net effect of `changes` on each
+    row: its last operation, with 'insert' kept for rows inserted and then
+    updated, and rows inserted and deleted within `changes` left out.
+    """
+    net = {}
+    for change in changes:
+        key = (change.table, change.row_id)
+        previous = net.get(key)
+        if previous == 'insert' and change.op == 'delete':
+            del net[key]
+        elif previous != 'insert' or change.op != 'update':
+            net[key] = change.op
+    return net
+
+
+class ChangeFeed:
+    """
+    A named consumer of the change log. A new consumer starts at the newest
+    change, after its own initial full sync, or with `from_start` at the
+    oldest entry still kept; an existing one resumes at its stored cursor.
+    It has a cursor in the catalog and in each shard; a shard added later
+    is read from its first entry.
+    """
+
+    def __init__(self, consumer, batch_size=BATCH_SIZE, from_start=False):
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1")
+        self.consumer = consumer
+        self.batch_size = batch_size
+        for _, connect, _ in _logs():
+            with connect() as conn:
+                start = 0 if from_start else statements.fetchone(conn, 'changes.latest')[0]
+                statements.execute(conn, 'changes.subscribe', (consumer, start))
+
+    def __repr__(self):
+        return f"<ChangeFeed {self.consumer} at {self.position}>"
+
+    @property
+    def position(self):
+        """
+        The seq of the last catalog change this consumer acknowledged.
+        """
+        with get_connection() as conn:
+            row = statements.fetchone(conn, 'changes.cursor', (self.consumer,))
+        if row is None:
+            raise LookupError(f"Consumer {self.consumer!r} is not subscribed")
+        return row['seq']
+
+    def positions(self):
+        """
+        Returns {shard id: seq} with this consumer's cursor in each log,
+        None standing for the catalog.
+        """
+        positions = {None: self.position}
+        for shard_id, connect, _ in _logs():
+            if shard_id is None:
+                continue
+            with connect() as conn:
+                row = statements.fetchone(conn, 'changes.cursor', (self.consumer,))
+                if row is None:
+                    # A shard added since this consumer subscribed.
+                    statements.execute(conn, 'changes.subscribe', (self.consumer, 0))
+                positions[shard_id] = row['seq'] if row else 0
+        return positions
+
+    def lag(self):
+        """
+        How many changes were logged after this consumer's positions.
+        """
+        positions = self.positions()
+        lag = 0
+        for shard_id, connect, _ in _logs():
+            with connect() as conn:
+                if shard_id is None:
+                    lag += statements.fetchone(conn, 'changes.latest')[0] - positions[None]
+                else:
+                    lag += statements.fetchone(conn, 'changes.articles_pending', (positions[shard_id],))[0]
+        return lag
+
+    def read(self, limit=None):
+        """
+        Returns up to `limit` (default batch_size) changes after the
+        cursors, the catalog's first and each log's oldest first, without
+        moving them.
+        """
+        limit = limit or self.batch_size
+        positions = self.positions()
+        changes = []
+        for shard_id, connect, name in _logs():
+            if len(changes) >= limit:
+                break
+            with connect() as conn:
+                rows = statements.fetchall(conn, name, (positions[shard_id], limit - len(changes)))
+            changes.extend(Change(*row, shard_id) for row in rows)
+        return changes
+
+    def ack(self, seq, shard=None):
+        """
+        Marks every change up to `seq` in the log of `shard` (by default
+        the catalog) as consumed. The cursor never moves back; use seek()
+        for that.
+        """
+        for shard_id, connect, _ in _logs():
+            if shard_id == shard:
+                with connect() as conn:
+                    statements.execute(conn, 'changes.ack', (seq, self.consumer))
+
+    def seek(self, seq):
+        # Catalog only: seqs of different logs are unrelated.
+        with get_connection() as conn:
+            statements.execute(conn, 'changes.seek', (self.consumer, seq))
+
+    def batches(self):
+        """
+        Yields lists of pending changes until the log is drained. Each batch
+        is acknowledged when the consumer asks for the next one, so a batch
+        interrupted by an error is delivered again.
+        """
+        while True:
+            batch = self.read()
+            if not batch:
+                return
+            yield batch
+            last = {change.shard: change.seq for change in batch}
+            for shard, seq in last.items():
+                self.ack(seq, shard)
+
+    def unsubscribe(self):
+        """
+        Forgets this consumer, so it no longer holds back compaction.
+        """
+        for _, connect, _ in _logs():
+            with connect() as conn:
+                statements.execute(conn, 'changes.unsubscribe', (self.consumer,))
@@ -1,6 +1,395 @@
+import atexit
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import parse_qs, quote, urlsplit
 
+# A file path, or an SQLite URI such as 'file:articles.db?mode=ro' (read-only
+# replica) or 'file:articles?mode=memory&cache=shared' (shared in-memory).
+DATABASE = os.environ.get('ARTICLES_DB', 'articles.db')
+MEMORY_DATABASE = 'file:articles?mode=memory&cache=shared'
+POOL_SIZE = int(os.environ.get('ARTICLES_DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('ARTICLES_DB_POOL_TIMEOUT', 5.0))
+
+# Named PRAGMA sets applied to every new pooled connection. Both enforce
+# foreign keys, so ON DELETE CASCADE fires; 'default' otherwise keeps SQLite's
+# own settings; 'concurrent' lets readers proceed alongside a writer and makes
+# writers wait for the lock instead of failing.
+PRAGMA_PROFILES = {
+    'default': {'foreign_keys': 'ON'},
+    'concurrent': {
+        'foreign_keys': 'ON',
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY',
+    },
+}
+# Comfortably above the number of statements in lib.db.statements plus the
+# partial-UPDATE variants, so pooled connections never evict a prepared
+# model statement.
+STATEMENT_CACHE_SIZE = int(os.environ.get('ARTICLES_DB_STATEMENT_CACHE', 256))
+PRAGMA_PROFILE = os.environ.get('ARTICLES_DB_PROFILE', 'concurrent')
+ALLOWED_PRAGMAS = ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size',
+                   'mmap_size', 'temp_store', 'foreign_keys')
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+def resolve_pragmas(profile=None, overrides=None):
+    """
+    Returns the PRAGMA settings for `profile`, updated with `overrides`.
+
+    Overrides may also come from ARTICLES_DB_PRAGMAS, e.g.
+    "busy_timeout=10000,synchronous=FULL"; explicit overrides win.
+    """
+    profile = profile or PRAGMA_PROFILE
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown PRAGMA profile: {profile}")
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    for item in filter(None, os.environ.get('ARTICLES_DB_PRAGMAS', '').split(',')):
+        name, _, value = item.partition('=')
+        pragmas[name.strip()] = value.strip()
+    pragmas.update(overrides or {})
+    for name, value in pragmas.items():
+        if name not in ALLOWED_PRAGMAS:
+            raise ValueError(f"Unsupported PRAGMA: {name}")
+        if not str(value).lstrip('-').isalnum():
+            raise ValueError(f"Invalid value for PRAGMA {name}: {value!r}")
+    return pragmas
+
+
+def read_only_uri(path):
+    """
+    Returns a URI that opens the database file at `path` read-only.
+    """
+    return f"file:{quote(path)}?mode=ro"
+
+
+def is_read_only(database):
+    if not database.startswith('file:'):
+        return False
+    return parse_qs(urlsplit(database).query).get('mode') == ['ro']
+
+
+def apply_pragmas(conn, pragmas, read_only=False):
+    # journal_mode first: it needs the database file, the rest are per-connection.
+    # A read-only connection cannot change the journal mode, so it keeps the file's.
+    for name in sorted(pragmas, key=lambda n: n != 'journal_mode'):
+        if read_only and name == 'journal_mode':
+            continue
+        conn.execute(f"PRAGMA {name}={pragmas[name]}")
+
+
+class ConnectionPool:
+    """
+    A bounded pool of reusable SQLite connections.
+
+    Connections are opened lazily up to `size` and handed out LIFO so the
+    most recently used (warmest) connection is reused first. A checkout that
+    finds an idle connection counts as a hit, one that has to open a new
+    connection counts as a miss, and one that has to wait for a release
+    counts as a wait.
+    """
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.database = database
+        self.read_only = is_read_only(database)
+        self.pragmas = resolve_pragmas() if pragmas is None else pragmas
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._all = []
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               uri=self.database.startswith('file:'))
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragmas, self.read_only)
+        return conn
+
+    def acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot acquire from a closed pool")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                    self.misses += 1
+                    return conn
+                self.waits += 1
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeout(
+                    f"No connection available after {self.timeout}s (pool size {self.size})"
+                ) from None
+        with self._lock:
+            self.hits += 1
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            conns, self._all = self._all, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in conns:
+            conn.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': len(self._all),
+                'idle': self._idle.qsize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ConnectionPool(DATABASE, POOL_SIZE, POOL_TIMEOUT)
+        return _pool
+
+
+def configure_pool(database=None, size=None, timeout=None, profile=None, pragmas=None):
+    """
+    Replaces the process-wide pool, closing the previous one. `profile`
+    names an entry of PRAGMA_PROFILES and `pragmas` overrides single settings.
+    """
+    global _pool, DATABASE, POOL_SIZE, POOL_TIMEOUT, PRAGMA_PROFILE
+    settings = resolve_pragmas(profile, pragmas)
+    with _pool_lock:
+        if profile is not None:
+            PRAGMA_PROFILE = profile
+        if database is not None:
+            DATABASE = database
+        if size is not None:
+            POOL_SIZE = size
+        if timeout is not None:
+            POOL_TIMEOUT = timeout
+        old, _pool = _pool, ConnectionPool(DATABASE, POOL_SIZE, POOL_TIMEOUT, settings)
+    if old is not None:
+        old.close()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, None
+    if old is not None:
+        old.close()
+
+
+def _forget_pool():
+    # SQLite connections must not be shared across fork(); a child process
+    # starts with an empty pool instead of the parent's open handles.
+    global _pool, _pool_lock, _local
+    _pool = None
+    _pool_lock = threading.Lock()
+    _local = threading.local()
+
+
+atexit.register(close_pool)
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def stream(sql, params=(), batch_size=1000, pool=None):
+    """
+    Yields the rows of a query lazily, fetching `batch_size` rows at a time.
+
+    Inside a `get_connection()` block the active connection is used so the
+    rows reflect its transaction; otherwise a connection is checked out for
+    the lifetime of the generator and returned when it is exhausted or closed.
+    A `pool` other than the default one (a shard's) is always checked out of.
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be at least 1")
+    conn = None if pool is not None else getattr(_local, 'conn', None)
+    if conn is None:
+        pool = pool or get_pool()
+        conn = pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+    finally:
+        if pool is not None:
+            pool.release(conn)
+
+
+@contextmanager
 def get_connection():
-    conn = sqlite3.connect('articles.db')
-    conn.row_factory = sqlite3.Row
-    return conn
\ No newline at end of file
+    """
+    Checks a connection out of the pool for the duration of a `with` block.
+
+    The block commits on success and rolls back on error. Nested calls on
+    the same thread reuse the outer connection, so the outermost block owns
+    the transaction and the pool cannot deadlock on itself.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    _local.conn = conn
+    _local.writes = []
+    try:
+        with conn:
+            yield conn
+    except BaseException:
+        _undo_writes(0)
+        raise
+    finally:
+        _local.conn = None
+        _local.writes = None
+        pool.release(conn)
+
+
+def record_write(instance, previous_id):
+    """
+    Notes that `instance`, which had `previous_id` before, was written in
+    the current get_connection() block. If the write is rolled back the
+    instance gets that id and its pending changes back, so a failed insert
+    leaves it unsaved rather than pointing at a row that does not exist.
+    """
+    writes = getattr(_local, 'writes', None)
+    if writes is not None:
+        # Saving replaces _dirty rather than clearing it, so no copy is needed.
+        writes.append((instance, previous_id, instance._dirty))
+
+
+def _undo_writes(mark):
+    writes = _local.writes
+    for instance, previous_id, changed in reversed(writes[mark:]):
+        instance.id = previous_id
+        instance._dirty = changed
+    del writes[mark:]
+
+
+class Transaction:
+    """
+    Handle yielded by `transaction()`. Instances passed to `add()` are
+    written together, one save_many() per model, when the block exits.
+    """
+
+    def __init__(self, conn, savepoint=None):
+        self.conn = conn
+        self.savepoint = savepoint
+        self.pending = []
+
+    def add(self, *instances):
+        self.pending.extend(instances)
+        return instances[0] if len(instances) == 1 else instances
+
+    def flush(self):
+        from lib.db import shards
+        shards.check_unsharded("Transaction.flush()")
+        pending, self.pending = self.pending, []
+        by_model = {}
+        for instance in pending:
+            by_model.setdefault(type(instance), []).append(instance)
+        for model, instances in by_model.items():
+            model.save_many(instances)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    Groups every model call in the block into one atomic commit.
+
+    The outermost block issues BEGIN (BEGIN IMMEDIATE with `immediate=True`
+    to take the write lock up front); nested blocks become savepoints, so an
+    exception rolls back only the innermost block it escapes, and objects
+    saved in a rolled-back block become unsaved again. Objects handed to
+    `Transaction.add()` are flushed just before the block commits.
+
+    Not available while articles are sharded: shard writes commit on their
+    own connections and could not be rolled back with the block.
+    """
+    from lib.db import cache, shards
+
+    shards.check_unsharded("transaction()")
+    with get_connection() as conn:
+        depth = getattr(_local, 'depth', 0)
+        savepoint = None
+        if depth == 0 and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        else:
+            savepoint = f"articles_sp_{depth}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+        tx = Transaction(conn, savepoint)
+        mark = len(_local.writes)
+        _local.depth = depth + 1
+        try:
+            yield tx
+            tx.flush()
+        except BaseException:
+            if savepoint:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            else:
+                conn.rollback()
+            _undo_writes(mark)
+            # Rows cached inside the block may never have been committed.
+            cache.clear()
+            raise
+        else:
+            if savepoint:
+                conn.execute(f"RELEASE {savepoint}")
+            else:
+                conn.commit()
+        finally:
+            _local.depth = depth
+
@@ -0,0 +1,47 @@
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_skipped = Counter()
+
+# Shared by every instance without changes, so hydrated rows cost no set each.
+CLEAN = frozenset()
+
+
+def mark(instance, name, value):
+    """
+    Records `name` as changed on `instance` when `value` differs from the
+    current one. Call from a property setter before storing the value.
+    Unsaved instances are inserted whole, so nothing is recorded for them.
+    """
+    if instance.id is not None and getattr(instance, '_' + name, None) != value:
+        if instance._dirty is CLEAN:
+            instance._dirty = {name}
+        else:
+            instance._dirty.add(name)
+
+
+def update_statement(table, instance, columns):
+    """
+    Returns (sql, params) for an UPDATE of only `columns` on `instance`.
+    """
+    columns = sorted(columns)
+    assignments = ', '.join(f"{column}=?" for column in columns)
+    params = tuple(getattr(instance, column) for column in columns) + (instance.id,)
+    return f"UPDATE {table} SET {assignments} WHERE id=?", params
+
+
+def skip(instance):
+    with _lock:
+        _skipped[type(instance).__name__] += 1
+
+
+def skipped_writes():
+    """
+    Returns how many save() calls were skipped because nothing had changed,
+    per model name, plus a 'total'.
+    """
+    with _lock:
+        stats = dict(_skipped)
+    stats['total'] = sum(stats.values())
+    return stats
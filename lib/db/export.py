@@ -0,0 +1,139 @@
+"""
+Parallel export of the denormalized article graph to JSONL or CSV.
+
+Articles are split into fixed-width id ranges. Each range is exported by a
+worker process with its own read-only connection, streaming rows into its
+own part file, so memory per worker stays constant. A part is written under
+a temporary name and renamed when complete, and the parent records every
+finished range in a checkpoint file; rerunning an interrupted export skips
+those ranges.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from lib.db import connection, shards, statements
+
+FORMATS = ('jsonl', 'csv')
+RANGE_SIZE = 100_000
+BATCH_SIZE = 5_000
+CHECKPOINT = 'checkpoint.jsonl'
+MANIFEST = 'manifest.json'
+COLUMNS = ('id', 'title', 'author_id', 'author_name', 'magazine_id', 'magazine_name', 'magazine_category')
+
+
+def plan(database, range_size=RANGE_SIZE):
+    """
+    Returns the [lo, hi) id ranges that cover every article.
+    """
+    if range_size < 1:
+        raise ValueError("Range size must be at least 1")
+    conn = sqlite3.connect(connection.read_only_uri(database), uri=True)
+    try:
+        lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM articles").fetchone()
+    finally:
+        conn.close()
+    if lo is None:
+        return []
+    start = lo - (lo - 1) % range_size
+    return [(first, first + range_size) for first in range(start, hi + 1, range_size)]
+
+
+def part_name(lo, hi, fmt):
+    return f"articles-{lo:012d}-{hi:012d}.{fmt}"
+
+
+def _init_worker(database):
+    connection.configure_pool(database=connection.read_only_uri(database), size=1)
+
+
+def export_range(lo, hi, path, fmt, batch_size=BATCH_SIZE):
+    """
+    Writes the articles with lo <= id < hi, joined with their author and
+    magazine, to `path`. Runs in a worker process; returns the row count.
+    """
+    tmp = path + '.tmp'
+    count = 0
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            write = writer.writerow
+        else:
+            encode = json.JSONEncoder(ensure_ascii=False, check_circular=False).encode
+            write = lambda row: f.write(encode(dict(zip(COLUMNS, row))) + '\n')
+        for row in statements.stream('articles.export_range', (lo, hi), batch_size):
+            write(row)
+            count += 1
+    os.replace(tmp, path)
+    return count
+
+
+def _load_checkpoint(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    done[(entry['lo'], entry['hi'])] = entry
+    return done
+
+
+def export(out_dir, database=None, fmt='jsonl', workers=None, range_size=RANGE_SIZE,
+           batch_size=BATCH_SIZE, progress=None):
+    """
+    Exports every article to part files in `out_dir` and writes a manifest
+    listing them. `database` is a file path (default: the configured
+    database). `progress(done_ranges, total_ranges, rows)` is called as
+    ranges finish. Returns the manifest.
+    """
+    database = database or connection.DATABASE
+    if database == connection.DATABASE:
+        shards.check_unsharded("export() of the catalog")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if database.startswith('file:'):
+        raise ValueError("Export workers need a database file path, not a URI")
+    os.makedirs(out_dir, exist_ok=True)
+
+    ranges = plan(database, range_size)
+    checkpoint_path = os.path.join(out_dir, CHECKPOINT)
+    done = {key: entry for key, entry in _load_checkpoint(checkpoint_path).items()
+            if key in set(ranges) and entry['format'] == fmt
+            and os.path.exists(os.path.join(out_dir, entry['file']))}
+    pending = [(lo, hi) for lo, hi in ranges if (lo, hi) not in done]
+    rows = sum(entry['rows'] for entry in done.values())
+
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(database,)) as pool, \
+                open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            futures = {
+                pool.submit(export_range, lo, hi, os.path.join(out_dir, part_name(lo, hi, fmt)),
+                            fmt, batch_size): (lo, hi)
+                for lo, hi in pending
+            }
+            for future in as_completed(futures):
+                lo, hi = futures[future]
+                entry = {'lo': lo, 'hi': hi, 'rows': future.result(),
+                         'file': part_name(lo, hi, fmt), 'format': fmt}
+                checkpoint.write(json.dumps(entry) + '\n')
+                checkpoint.flush()
+                done[(lo, hi)] = entry
+                rows += entry['rows']
+                if progress:
+                    progress(len(done), len(ranges), rows)
+
+    manifest = {
+        'format': fmt,
+        'columns': list(COLUMNS),
+        'rows': sum(done[key]['rows'] for key in ranges),
+        'parts': [done[key] for key in ranges],
+    }
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
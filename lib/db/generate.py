@@ -0,0 +1,188 @@
+"""
+Deterministic synthetic data at any scale. The same seed and volumes always
+produce the same rows; author productivity, magazine popularity, categories
+and title words follow Zipf distributions, so a few of each dominate the way
+they do in real data.
+"""
+import itertools
+import random
+import time
+from contextlib import nullcontext
+from lib.db import shards, statements
+from lib.db.connection import get_connection
+from lib.db.schema import deferred_maintenance
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'qua', 'bri', 'dor']
+FIRST_NAMES = ['Ada', 'Ben', 'Chen', 'Dara', 'Eli', 'Fatima', 'Goro', 'Hana', 'Ivan', 'Jo',
+               'Kemi', 'Luis', 'Mira', 'Nico', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Tara']
+LAST_NAMES = ['Abe', 'Brown', 'Costa', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito',
+              'Jensen', 'Kim', 'Lopez', 'Moreau', 'Nowak', 'Okafor', 'Park', 'Rossi', 'Singh']
+CATEGORIES = ['Technology', 'Science', 'Fashion', 'Business', 'Health', 'Travel', 'Food',
+              'Sports', 'Politics', 'Culture', 'Music', 'Film', 'Gaming', 'Design', 'Finance',
+              'Education', 'Environment', 'History', 'Automotive', 'Architecture']
+VOCABULARY = 20_000
+BATCH_SIZE = 50_000
+
+
+def pseudo_words(count):
+    """
+    Returns `count` distinct pronounceable words, the same ones every time.
+    """
+    words = []
+    for i in range(count):
+        word, n = '', i + len(SYLLABLES)
+        while n:
+            n, digit = divmod(n, len(SYLLABLES))
+            word += SYLLABLES[digit]
+        words.append(word)
+    return words
+
+
+def zipf_weights(count, exponent=1.0):
+    """
+    Cumulative weights for random.choices() that give rank r a share
+    proportional to 1 / r**exponent.
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Generator:
+    """
+    Lazily produces the insert parameters for each table. Every table has
+    its own random stream, so changing one volume leaves the others alone.
+    `author_offset` and `magazine_offset` skip names an earlier run used.
+    """
+
+    def __init__(self, authors, magazines, articles, seed=0, exponent=1.0, vocabulary=VOCABULARY,
+                 author_offset=0, magazine_offset=0):
+        if articles and min(authors, magazines) < 1:
+            raise ValueError("Articles need at least one author and one magazine")
+        self.authors = authors
+        self.magazines = magazines
+        self.articles = articles
+        self.seed = seed
+        self.exponent = exponent
+        self.vocabulary = vocabulary
+        self.author_offset = author_offset
+        self.magazine_offset = magazine_offset
+
+    def author_rows(self):
+        for i in range(self.author_offset, self.author_offset + self.authors):
+            first = FIRST_NAMES[i % len(FIRST_NAMES)]
+            last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+            yield (f"{first} {last} {i + 1}",)
+
+    def magazine_rows(self):
+        rng = random.Random(f"{self.seed}:magazines")
+        names = pseudo_words(self.magazine_offset + self.magazines)[self.magazine_offset:]
+        weights = zipf_weights(len(CATEGORIES), self.exponent)
+        for name in names:
+            category = rng.choices(CATEGORIES, cum_weights=weights)[0]
+            yield (f"{name.capitalize()} {category}", category)
+
+    def article_rows(self, author_ids, magazine_ids):
+        rng = random.Random(f"{self.seed}:articles")
+        words = pseudo_words(self.vocabulary)
+        word_weights = zipf_weights(len(words), self.exponent)
+        # Shuffle which ids hold the popular ranks so skew is not tied to id order.
+        author_ids = sorted(author_ids)
+        magazine_ids = sorted(magazine_ids)
+        rng.shuffle(author_ids)
+        rng.shuffle(magazine_ids)
+        author_weights = zipf_weights(len(author_ids), self.exponent)
+        magazine_weights = zipf_weights(len(magazine_ids), self.exponent)
+        # Draw in chunks: one choices() call per column per chunk instead of per row.
+        remaining = self.articles
+        while remaining:
+            n = min(remaining, 1000)
+            remaining -= n
+            lengths = rng.choices(range(3, 9), k=n)
+            title_words = iter(rng.choices(words, cum_weights=word_weights, k=sum(lengths)))
+            authors = rng.choices(author_ids, cum_weights=author_weights, k=n)
+            magazines = rng.choices(magazine_ids, cum_weights=magazine_weights, k=n)
+            for length, author_id, magazine_id in zip(lengths, authors, magazines):
+                title = ' '.join(itertools.islice(title_words, length))
+                yield (title.capitalize(), author_id, magazine_id)
+
+
+def _load(conn, name, rows, total, batch_size, progress, commit):
+    table, done = name.partition('.')[0], 0
+    if progress:
+        progress(table, done, total)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        statements.executemany(conn, name, batch)
+        if commit:
+            conn.commit()
+        done += len(batch)
+        if progress:
+            progress(table, done, total)
+
+
+def _largest_id(conn, table):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+
+def _newest_ids(conn, table, count):
+    rows = conn.execute(f"SELECT id FROM {table} ORDER BY id DESC LIMIT ?", (count,))
+    return [row[0] for row in rows]
+
+
+def generate(authors, magazines, articles, seed=0, exponent=1.0,
+             batch_size=BATCH_SIZE, defer_maintenance=True, progress=None):
+    """
+    Appends synthetic authors, magazines and articles to the database and
+    returns the number of rows written per table.
+
+    Rows are streamed to executemany() `batch_size` at a time, so memory stays
+    flat at any volume. With `defer_maintenance` the load is one transaction
+    with the article triggers suspended (see schema.deferred_maintenance());
+    otherwise each batch commits on its own and the triggers run per row.
+    `progress(table, done, total)` is called after every batch.
+
+    New names continue after the largest existing author and magazine ids,
+    which no earlier run's names go beyond, so repeated runs never collide
+    on the unique author name.
+    """
+    shards.check_unsharded("generate()")
+    with get_connection() as conn:
+        generator = Generator(authors, magazines, articles, seed, exponent,
+                              author_offset=_largest_id(conn, 'authors'),
+                              magazine_offset=_largest_id(conn, 'magazines'))
+        if defer_maintenance:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            maintenance = deferred_maintenance(conn)
+        else:
+            maintenance = nullcontext()
+        commit = not defer_maintenance
+        with maintenance:
+            _load(conn, 'authors.insert', generator.author_rows(),
+                  authors, batch_size, progress, commit)
+            _load(conn, 'magazines.insert', generator.magazine_rows(),
+                  magazines, batch_size, progress, commit)
+            author_ids = _newest_ids(conn, 'authors', authors)
+            magazine_ids = _newest_ids(conn, 'magazines', magazines)
+            _load(conn, 'articles.insert', generator.article_rows(author_ids, magazine_ids),
+                  articles, batch_size, progress, commit)
+    return {'authors': authors, 'magazines': magazines, 'articles': articles}
+
+
+def print_progress(stream):
+    """
+    Returns a progress callback that keeps one status line per table on
+    `stream`, with the rows/s rate since that table started.
+    """
+    started = {}
+
+    def report(table, done, total):
+        start = started.setdefault(table, time.perf_counter())
+        rate = done / max(time.perf_counter() - start, 1e-9)
+        stream.write(f"\r{table}: {done:,}/{total:,} ({done / max(total, 1):.0%}) {rate:,.0f} rows/s")
+        if done >= total:
+            stream.write("\n")
+        stream.flush()
+
+    return report
@@ -0,0 +1,205 @@
+"""
+Read-through cache for the results of named model queries.
+
+A result is stored under its database's identity, statement name,
+parameters and the current version of every table it reads (see the
+table_versions migration), so any write to one of those tables, from any
+process, makes the entry unreachable.
+A hit costs one primary-key read of table_versions instead of the query.
+Results computed inside an open transaction are never stored: they may
+contain writes that are later rolled back.
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+from lib.db import statements
+from lib.db.cache import LRUCache
+
+QUERY_CACHE = os.environ.get('ARTICLES_QUERY_CACHE', '')
+QUERY_CACHE_SIZE = int(os.environ.get('ARTICLES_QUERY_CACHE_SIZE', 1024))
+
+# Statements whose results may be cached, with the tables they read.
+DEPENDENCIES = {
+    'authors.magazines': ('articles', 'magazines'),
+    'authors.topic_areas': ('articles', 'magazines'),
+    'magazines.contributors': ('articles', 'authors'),
+    'magazines.contributing_authors': ('articles', 'authors'),
+    'magazines.article_counts': ('articles', 'magazines'),
+    'magazines.find_with_multiple_authors': ('articles', 'magazines'),
+}
+
+
+class DiskCache:
+    """
+    A query cache in an SQLite file, shared by every process that opens the
+    same path. Once it holds more than `maxsize` entries the oldest are
+    dropped.
+    """
+
+    def __init__(self, path, maxsize=QUERY_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._pid = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._sets = 0
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            # Never reuse a connection inherited across fork().
+            self._local, self._pid = threading.local(), os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM query_cache WHERE key=?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO query_cache (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        with self._lock:
+            self._sets += 1
+            trim = self._sets % 100 == 0
+        if trim:
+            conn.execute("""
+                DELETE FROM query_cache WHERE rowid <= (SELECT MAX(rowid) FROM query_cache) - ?""",
+                (self.maxsize,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM query_cache")
+
+    def stats(self):
+        size = self._conn().execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+        with self._lock:
+            return {'size': size, 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+@functools.lru_cache(maxsize=None)
+def _row_type(columns):
+    """
+    A tuple subclass that, like sqlite3.Row, can be indexed by column name.
+    """
+    index = {name: i for i, name in enumerate(columns)}
+
+    class CachedRow(tuple):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            return tuple.__getitem__(self, index[key] if isinstance(key, str) else key)
+
+        def keys(self):
+            return list(columns)
+
+    return CachedRow
+
+
+def _make_backend(spec):
+    if spec is None or spec == '':
+        return None
+    if spec == 'memory':
+        return LRUCache(QUERY_CACHE_SIZE)
+    if isinstance(spec, str) and spec.startswith('disk:'):
+        return DiskCache(spec[len('disk:'):])
+    if isinstance(spec, str):
+        raise ValueError(f"Unknown query cache backend: {spec}")
+    return spec
+
+
+_backend = _make_backend(QUERY_CACHE)
+_lock = threading.Lock()
+_stats = {}
+
+
+def configure_query_cache(backend=None):
+    """
+    Sets the query cache backend: 'memory' for a per-process LRU,
+    'disk:<path>' for a cache shared through an SQLite file, any object with
+    get/set/clear/stats, or None to turn caching off.
+    """
+    global _backend
+    _backend = _make_backend(backend)
+    reset_stats()
+    return _backend
+
+
+def _count(name, hit):
+    with _lock:
+        entry = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+        entry['hits' if hit else 'misses'] += 1
+
+
+def fetchall(conn, name, params=()):
+    """
+    statements.fetchall() through the query cache, for statements listed in
+    DEPENDENCIES. Other statements, or any statement while caching is off,
+    go straight to the database.
+    """
+    backend = _backend
+    tables = DEPENDENCIES.get(name)
+    if backend is None or tables is None:
+        return statements.fetchall(conn, name, params)
+
+    # Read the versions before the query: if a write lands in between, the
+    # entry is stored under versions that are already out of date.
+    versions = dict(statements.fetchall(conn, 'table_versions.all'))
+    key = json.dumps([versions.get('database'), name, list(params), [versions[table] for table in tables]])
+    cached = backend.get(key)
+    if cached is not None:
+        _count(name, True)
+        columns, values = cached
+        row_type = _row_type(tuple(columns))
+        return [row_type(value) for value in values]
+
+    _count(name, False)
+    rows = statements.fetchall(conn, name, params)
+    if not conn.in_transaction:
+        columns = rows[0].keys() if rows else []
+        backend.set(key, [columns, [tuple(row) for row in rows]])
+    return rows
+
+
+def clear():
+    if _backend is not None:
+        _backend.clear()
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def query_cache_stats():
+    """
+    Returns hits, misses and hit rate overall and per statement, plus the
+    backend's own figures.
+    """
+    with _lock:
+        per_statement = {name: dict(entry) for name, entry in _stats.items()}
+    for entry in per_statement.values():
+        entry['hit_rate'] = entry['hits'] / (entry['hits'] + entry['misses'])
+    hits = sum(entry['hits'] for entry in per_statement.values())
+    misses = sum(entry['misses'] for entry in per_statement.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'statements': per_statement,
+        'backend': _backend.stats() if _backend is not None else None,
+    }
@@ -1,41 +1,345 @@
 import sqlite3
+from contextlib import contextmanager
 from lib.db.connection import get_connection
 
-def setup_schema():
+# Per-article bookkeeping for the summary tables, written once for the NEW
+# row (count an article in) and once for the OLD row (count it out).
+def _count_in(row):
+    return f"""
+        INSERT INTO author_stats (author_id, article_count) VALUES ({row}.author_id, 1)
+            ON CONFLICT (author_id) DO UPDATE SET article_count = article_count + 1;
+        INSERT INTO magazine_authors (magazine_id, author_id, article_count)
+            VALUES ({row}.magazine_id, {row}.author_id, 1)
+            ON CONFLICT (magazine_id, author_id) DO UPDATE SET article_count = article_count + 1;
+        INSERT INTO magazine_stats (magazine_id, article_count, author_count)
+            VALUES ({row}.magazine_id, 1, 1)
+            ON CONFLICT (magazine_id) DO UPDATE SET
+                article_count = article_count + 1,
+                author_count = author_count + ((
+                    SELECT article_count FROM magazine_authors
+                    WHERE magazine_id = {row}.magazine_id AND author_id = {row}.author_id) = 1);"""
+
+def _count_out(row):
+    return f"""
+        UPDATE author_stats SET article_count = article_count - 1
+            WHERE author_id = {row}.author_id;
+        DELETE FROM author_stats WHERE author_id = {row}.author_id AND article_count <= 0;
+        UPDATE magazine_authors SET article_count = article_count - 1
+            WHERE magazine_id = {row}.magazine_id AND author_id = {row}.author_id;
+        UPDATE magazine_stats SET
+                article_count = article_count - 1,
+                author_count = author_count - ((
+                    SELECT article_count FROM magazine_authors
+                    WHERE magazine_id = {row}.magazine_id AND author_id = {row}.author_id) = 0)
+            WHERE magazine_id = {row}.magazine_id;
+        DELETE FROM magazine_authors
+            WHERE magazine_id = {row}.magazine_id AND author_id = {row}.author_id AND article_count <= 0;"""
+
+VERSIONED_TABLES = {
+    'authors': ('id', 'name'),
+    'magazines': ('id', 'name', 'category'),
+    'articles': ('id', 'title', 'author_id', 'magazine_id'),
+}
+
+# Recomputes every summary table from articles; used by migration 3 and
+# rebuild_aggregates() to repair drift.
+REBUILD_AGGREGATES = [
+    "DELETE FROM author_stats",
+    "DELETE FROM magazine_authors",
+    "DELETE FROM magazine_stats",
+    """INSERT INTO author_stats (author_id, article_count)
+        SELECT author_id, COUNT(*) FROM articles GROUP BY author_id""",
+    """INSERT INTO magazine_authors (magazine_id, author_id, article_count)
+        SELECT magazine_id, author_id, COUNT(*) FROM articles GROUP BY magazine_id, author_id""",
+    """INSERT INTO magazine_stats (magazine_id, article_count, author_count)
+        SELECT magazine_id, SUM(article_count), COUNT(*) FROM magazine_authors GROUP BY magazine_id""",
+]
+
+# Ordered (version, statements) pairs. Each migration runs in its own
+# transaction and bumps PRAGMA user_version, so it is applied exactly once.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_articles_author_magazine ON articles (author_id, magazine_id)",
+        "CREATE INDEX IF NOT EXISTS idx_articles_magazine_author ON articles (magazine_id, author_id)",
+        "CREATE INDEX IF NOT EXISTS idx_magazines_category ON magazines (category)",
+    ]),
+    # Keyset pagination walks one parent's articles in id order.
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_articles_author_id ON articles (author_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_articles_magazine_id ON articles (magazine_id, id)",
+    ]),
+    # Article counters kept current by triggers, so the dashboard aggregates
+    # read a summary row instead of grouping all of articles.
+    (3, [
+        """CREATE TABLE IF NOT EXISTS author_stats (
+            author_id INTEGER PRIMARY KEY,
+            article_count INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS magazine_stats (
+            magazine_id INTEGER PRIMARY KEY,
+            article_count INTEGER NOT NULL,
+            author_count INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS magazine_authors (
+            magazine_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            article_count INTEGER NOT NULL,
+            PRIMARY KEY (magazine_id, author_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_author_stats_count ON author_stats (article_count)",
+        "CREATE INDEX IF NOT EXISTS idx_magazine_stats_authors ON magazine_stats (author_count)",
+        f"""CREATE TRIGGER IF NOT EXISTS articles_stats_insert AFTER INSERT ON articles
+        BEGIN {_count_in('NEW')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS articles_stats_delete AFTER DELETE ON articles
+        BEGIN {_count_out('OLD')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS articles_stats_update
+        AFTER UPDATE OF author_id, magazine_id ON articles
+        WHEN OLD.author_id != NEW.author_id OR OLD.magazine_id != NEW.magazine_id
+        BEGIN {_count_out('OLD')} {_count_in('NEW')}
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS magazines_stats_delete AFTER DELETE ON magazines
+        BEGIN
+            DELETE FROM magazine_stats WHERE magazine_id = OLD.id;
+        END""",
+        *REBUILD_AGGREGATES,
+    ]),
+    # Full-text index over article titles. External content: the text lives
+    # in articles, the triggers keep the index in step with it.
+    (4, [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5 (
+            title,
+            content='articles', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles
+        BEGIN
+            INSERT INTO articles_fts (rowid, title) VALUES (NEW.id, NEW.title);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF title ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            INSERT INTO articles_fts (rowid, title) VALUES (NEW.id, NEW.title);
+        END""",
+        "INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')",
+    ]),
+    # A counter per table, bumped by every write to it (including cascades),
+    # so cached query results can tell whether their inputs changed.
+    (5, [
+        """CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        *(f"INSERT OR IGNORE INTO table_versions (name) VALUES ('{table}')" for table in VERSIONED_TABLES),
+        *(f"""CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END""" for table in VERSIONED_TABLES for event in ('INSERT', 'UPDATE', 'DELETE')),
+    ]),
+    # An UPDATE that rewrites the same values (an upsert hitting an existing
+    # row) leaves the version alone, so it does not invalidate cached results.
+    (6, [
+        *(f"DROP TRIGGER IF EXISTS {table}_version_update" for table in VERSIONED_TABLES),
+        *(f"""CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table}
+        WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END""" for table, columns in VERSIONED_TABLES.items()),
+    ]),
+    # An append-only change log for downstream consumers (see lib.db.changes).
+    # AUTOINCREMENT keeps seq growing after compaction; SQLite's single
+    # writer means entries commit in seq order.
+    (7, [
+        """CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete'))
+        )""",
+        """CREATE TABLE IF NOT EXISTS change_cursors (
+            consumer TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        *(f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_{op} AFTER {op.upper()} ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {row}.id, '{op}');
+        END""" for table in VERSIONED_TABLES for op, row in (('insert', 'NEW'), ('delete', 'OLD'))),
+        *(f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_update AFTER UPDATE ON {table}
+        WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)}
+        BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', NEW.id, 'update');
+        END""" for table, columns in VERSIONED_TABLES.items()),
+    ]),
+    # A random identity for this database file, kept beside the table
+    # versions: versions start at 0 everywhere, so caches shared between
+    # databases (a disk cache, or the in-process one across configure_pool())
+    # key on it too. A copied file keeps its identity.
+    (8, [
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('database', random())",
+    ]),
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
     """
-    Sets up the database schema by creating the necessary tables.
+    Applies every migration newer than the database's user_version.
+    Returns the resulting schema version.
     """
-    with get_connection() as conn:
-        cursor = conn.cursor()
-
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS authors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS magazines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS articles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author_id INTEGER NOT NULL,
-                magazine_id INTEGER NOT NULL,
-                FOREIGN KEY (author_id) REFERENCES authors(id) ON DELETE CASCADE,
-                FOREIGN KEY (magazine_id) REFERENCES magazines(id) ON DELETE CASCADE
-            )
-        ''')
-        
+    version = schema_version(conn)
+    for target, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        conn.commit()
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+        except Exception:
+            conn.rollback()
+            raise
         conn.commit()
+        version = target
+    return version
+
+def rebuild_aggregates():
+    """
+    Recomputes the summary tables from articles in one transaction.
+    Returns the (author_stats, magazine_stats) row counts.
+    """
+    with get_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        for statement in REBUILD_AGGREGATES:
+            conn.execute(statement)
+        return (conn.execute("SELECT COUNT(*) FROM author_stats").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM magazine_stats").fetchone()[0])
+
+@contextmanager
+def deferred_maintenance(conn):
+    """
+    Suspends the triggers on articles for a bulk load, then recreates them,
+    rebuilds the summary tables and FTS index in one pass, logs the new
+    articles as changes and bumps the articles version. Use inside a single
+    transaction so a failed load rolls back to the original triggers.
+    """
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name='articles'").fetchall()
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM articles").fetchone()[0]
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    yield
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='changes'").fetchone():
+        conn.execute("""
+            INSERT INTO changes (table_name, row_id, op)
+            SELECT 'articles', id, 'insert' FROM articles WHERE id > ? ORDER BY id""", (last_id,))
+    for _, sql in triggers:
+        conn.execute(sql)
+    for statement in REBUILD_AGGREGATES:
+        conn.execute(statement)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='articles_fts'").fetchone():
+        conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='table_versions'").fetchone():
+        conn.execute("UPDATE table_versions SET version = version + 1 WHERE name = 'articles'")
+
+def create_magazine_key():
+    """
+    Makes (name, category) a unique key of magazines, which Magazine.upsert()
+    and upsert_many() match on. Optional, since existing data may repeat a
+    pair: those rows must be merged first, or this raises IntegrityError.
+    """
+    with get_connection() as conn:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_magazines_name_category ON magazines (name, category)")
+
+def aggregate_drift():
+    """
+    Returns the summary rows that disagree with a fresh count from articles,
+    as (table, key, stored, actual) tuples. Empty when everything matches.
+    """
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT 'author_stats', a.author_id, s.article_count, a.count
+            FROM (SELECT author_id, COUNT(*) AS count FROM articles GROUP BY author_id) a
+            LEFT JOIN author_stats s ON s.author_id = a.author_id
+            WHERE s.article_count IS NOT a.count
+            UNION ALL
+            SELECT 'author_stats', s.author_id, s.article_count, 0
+            FROM author_stats s
+            WHERE NOT EXISTS (SELECT 1 FROM articles WHERE author_id = s.author_id)
+            UNION ALL
+            SELECT 'magazine_stats', m.magazine_id, s.article_count || '/' || s.author_count,
+                   m.count || '/' || m.authors
+            FROM (SELECT magazine_id, COUNT(*) AS count, COUNT(DISTINCT author_id) AS authors
+                  FROM articles GROUP BY magazine_id) m
+            LEFT JOIN magazine_stats s ON s.magazine_id = m.magazine_id
+            WHERE s.article_count IS NOT m.count OR s.author_count IS NOT m.authors
+            UNION ALL
+            SELECT 'magazine_stats', s.magazine_id, s.article_count || '/' || s.author_count, '0/0'
+            FROM magazine_stats s
+            WHERE NOT EXISTS (SELECT 1 FROM articles WHERE magazine_id = s.magazine_id)
+              AND (s.article_count != 0 OR s.author_count != 0)
+            UNION ALL
+            SELECT 'magazine_authors', p.magazine_id || '/' || p.author_id, s.article_count, p.count
+            FROM (SELECT magazine_id, author_id, COUNT(*) AS count FROM articles
+                  GROUP BY magazine_id, author_id) p
+            LEFT JOIN magazine_authors s
+                ON s.magazine_id = p.magazine_id AND s.author_id = p.author_id
+            WHERE s.article_count IS NOT p.count
+            UNION ALL
+            SELECT 'magazine_authors', s.magazine_id || '/' || s.author_id, s.article_count, 0
+            FROM magazine_authors s
+            WHERE NOT EXISTS (SELECT 1 FROM articles
+                              WHERE magazine_id = s.magazine_id AND author_id = s.author_id)
+        """).fetchall()
+        return [tuple(row) for row in rows]
+
+def setup_schema(conn=None):
+    """
+    Sets up the database schema by creating the necessary tables
+    and applying any pending migrations. `conn` defaults to a pooled
+    connection; lib.db.shards passes one to a shard file.
+    """
+    if conn is None:
+        with get_connection() as conn:
+            return setup_schema(conn)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS authors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS magazines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author_id INTEGER NOT NULL,
+            magazine_id INTEGER NOT NULL,
+            FOREIGN KEY (author_id) REFERENCES authors(id) ON DELETE CASCADE,
+            FOREIGN KEY (magazine_id) REFERENCES magazines(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.commit()
+    migrate(conn)
 
 if __name__ == '__main__':
     setup_schema()
\ No newline at end of file
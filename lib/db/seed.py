@@ -16,20 +16,25 @@ def seed_data():
         cursor.execute("DELETE FROM magazines")
         conn.commit()
 
-        author1 = Author("John Doe").save()
-        author2 = Author("Jane Smith").save()
-
-        magazine1 = Magazine("Tech Weekly", "Technology").save()
-        magazine2 = Magazine("Fashion Monthly", "Fashion").save()
-        magazine3 = Magazine("Science Today", "Science").save()
-
-        Article("The Future of AI", author1.id, magazine1.id).save()
-        Article("Winter Fashion Trends", author2.id, magazine2.id).save()
-        Article("Exploring the Cosmos", author1.id, magazine3.id).save()
-        Article("New Innovations in Robotics", author1.id, magazine1.id).save()
-        Article("Sustainable Living", author2.id, magazine3.id).save()
-        Article("Advanced Python Techniques", author1.id, magazine1.id).save()
-
+        author1, author2 = Author.save_many([
+            Author("John Doe"),
+            Author("Jane Smith"),
+        ])
+
+        magazine1, magazine2, magazine3 = Magazine.save_many([
+            Magazine("Tech Weekly", "Technology"),
+            Magazine("Fashion Monthly", "Fashion"),
+            Magazine("Science Today", "Science"),
+        ])
+
+        Article.save_many([
+            Article("The Future of AI", author1.id, magazine1.id),
+            Article("Winter Fashion Trends", author2.id, magazine2.id),
+            Article("Exploring the Cosmos", author1.id, magazine3.id),
+            Article("New Innovations in Robotics", author1.id, magazine1.id),
+            Article("Sustainable Living", author2.id, magazine3.id),
+            Article("Advanced Python Techniques", author1.id, magazine1.id),
+        ])
 
 if __name__ == '__main__':
     seed_data()
\ No newline at end of file
@@ -0,0 +1,537 @@
+"""
+Horizontal sharding of articles by author.
+
+Authors and magazines live in the catalog, the configured database.
+Articles are spread over shard files by a hash of author_id: the hash picks
+one of BUCKETS buckets and the catalog's shard_buckets table maps every
+bucket to a shard. A shard is a complete database with the usual schema,
+holding its articles plus copies of the author and magazine rows they
+reference, so foreign keys, summary tables and FTS work inside it.
+
+All of an author's articles share a shard, so per-author queries read one
+file, while per-magazine queries and dashboard aggregates run on every
+shard in parallel and are merged. Article ids come from a sequence in the
+catalog, so they are unique across shards and survive a move. reshard()
+moves buckets between shards while the router keeps serving.
+
+setup_catalog() registers the catalog itself as the only shard, so an
+existing single-file database is split by resharding it onto new files.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from lib.db import connection, querycache, statements
+from lib.db.schema import setup_schema
+
+BUCKETS = 256
+ID_BLOCK = 1000
+SHARD_POOL_SIZE = 2
+
+CATALOG_TABLES = [
+    "CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)",
+    """CREATE TABLE IF NOT EXISTS shard_buckets (
+        bucket INTEGER PRIMARY KEY,
+        shard_id INTEGER NOT NULL REFERENCES shards (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS shard_sequence (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        next_id INTEGER NOT NULL
+    )""",
+    # Bumped by every bucket move, so readers of several shards can tell
+    # that a bucket may have left one shard before they read the other.
+    """CREATE TABLE IF NOT EXISTS shard_epoch (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        epoch INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO shard_epoch (id, epoch) VALUES (0, 0)",
+    """CREATE TRIGGER IF NOT EXISTS shard_buckets_epoch AFTER UPDATE ON shard_buckets
+    BEGIN UPDATE shard_epoch SET epoch = epoch + 1; END""",
+]
+
+
+def bucket_of(author_id):
+    # Multiplicative hashing spreads consecutive ids over the buckets.
+    return author_id * 2654435761 % 2**32 % BUCKETS
+
+
+def setup_catalog():
+    """
+    Creates the shard map in the configured database. On first use every
+    bucket is assigned to the catalog itself and the article id sequence
+    starts after the largest id used so far.
+    """
+    with connection.get_connection() as conn:
+        for statement in CATALOG_TABLES:
+            conn.execute(statement)
+        if conn.execute("SELECT 1 FROM shards").fetchone():
+            return
+        shard_id = statements.fetchall(conn, 'shards.register', (connection.DATABASE,))[0]['id']
+        conn.executemany("INSERT INTO shard_buckets (bucket, shard_id) VALUES (?, ?)",
+                         [(bucket, shard_id) for bucket in range(BUCKETS)])
+        last_id = conn.execute("""
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM articles), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'articles'), 0))
+        """).fetchone()[0]
+        conn.execute("INSERT INTO shard_sequence (id, next_id) VALUES (0, ?)", (last_id + 1,))
+
+
+class Shard:
+    """
+    One shard file and its own connection pool.
+    """
+
+    def __init__(self, id, path, pool_size=SHARD_POOL_SIZE):
+        self.id = id
+        self.path = path
+        self.pool = connection.ConnectionPool(path, pool_size)
+
+    def __repr__(self):
+        return f"<Shard {self.id} {self.path}>"
+
+    @property
+    def is_catalog(self):
+        return self.path == connection.DATABASE
+
+    @contextmanager
+    def connection(self):
+        """
+        Like get_connection() for this shard: commits on success, rolls
+        back on error. Not shared with nested calls.
+        """
+        conn = self.pool.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.pool.release(conn)
+
+    def fetchall(self, name, params=(), text=None):
+        with self.connection() as conn:
+            if text is None:
+                # Each shard has its own table versions to key cached results on.
+                return querycache.fetchall(conn, name, params)
+            return statements.fetchall(conn, name, params, text)
+
+
+class ShardRouter:
+    """
+    Routes article reads and writes to shards using the catalog's map.
+
+    Writes lock their shard and then re-read the bucket's owner, so a write
+    racing a move either lands before the move copies the bucket or is
+    retried on the new shard. Save authors and magazines before their
+    articles, and outside an open catalog transaction: shards copy those
+    rows from the committed catalog, and edits to them are copied on by
+    replicate_updates().
+    """
+
+    def __init__(self, pool_size=SHARD_POOL_SIZE):
+        self.pool_size = pool_size
+        self.shards = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._next_id = self._last_id = 0
+        self._executor = None
+        self._retired_shards = []
+        self._retired_executors = []
+        self._epoch = None
+        self.reload()
+
+    def reload(self):
+        """
+        Picks up shards added to or removed from the catalog.
+
+        Readers use `shards` and the executor without a lock, so both are
+        replaced rather than changed: a new shard is migrated before it is
+        published, and a removed shard's pool and an old executor stay
+        usable by reads that started before, until close().
+        """
+        with connection.get_connection() as conn:
+            epoch = statements.fetchone(conn, 'shards.epoch')[0]
+            rows = statements.fetchall(conn, 'shards.all')
+        with self._reload_lock:
+            shards = {}
+            for row in rows:
+                shard = self.shards.get(row['id'])
+                if shard is None:
+                    shard = Shard(row['id'], row['path'], self.pool_size)
+                    with shard.connection() as conn:
+                        setup_schema(conn)
+                shards[shard.id] = shard
+            self._retired_shards.extend(shard for id, shard in self.shards.items() if id not in shards)
+            if len(shards) != len(self.shards) or self._executor is None:
+                if self._executor is not None:
+                    self._retired_executors.append(self._executor)
+                self._executor = ThreadPoolExecutor(len(shards), thread_name_prefix='articles-shard')
+            self.shards = shards
+            self._epoch = epoch
+
+    def close(self):
+        with self._reload_lock:
+            shards = [*self.shards.values(), *self._retired_shards]
+            executors = [self._executor, *self._retired_executors]
+            self.shards, self._executor = {}, None
+            self._retired_shards, self._retired_executors = [], []
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown()
+        for shard in shards:
+            shard.pool.close()
+
+    def shard_for(self, author_id):
+        with connection.get_connection() as conn:
+            shard_id = statements.fetchone(conn, 'shards.for_bucket', (bucket_of(author_id),))['shard_id']
+        if shard_id not in self.shards:
+            self.reload()
+        return self.shards[shard_id]
+
+    def shards_for(self, author_ids):
+        """
+        Returns {author_id: Shard} with one catalog query.
+        """
+        buckets = {id: bucket_of(id) for id in author_ids}
+        if not buckets:
+            return {}
+        with connection.get_connection() as conn:
+            owners = dict(statements.fetchall(
+                conn, 'shards.for_buckets', (json.dumps(sorted(set(buckets.values()))),)))
+        if not set(owners.values()) <= set(self.shards):
+            self.reload()
+        return {id: self.shards[owners[bucket]] for id, bucket in buckets.items()}
+
+    @contextmanager
+    def connection_for(self, author_id):
+        """
+        A connection to the shard holding `author_id`'s articles.
+        """
+        with self.shard_for(author_id).connection() as conn:
+            yield conn
+
+    def epoch(self):
+        """
+        The catalog's count of bucket moves.
+        """
+        with connection.get_connection() as conn:
+            return statements.fetchone(conn, 'shards.epoch')[0]
+
+    def fan_out(self, name, params=(), text=None):
+        """
+        Runs a named query on every shard in parallel. Returns one row list
+        per shard.
+
+        Shards are read at slightly different times, so a bucket moving
+        meanwhile could be read on neither; the query is then run again.
+        """
+        while True:
+            epoch = self.epoch()
+            if epoch != self._epoch:
+                self.reload()
+            shards = list(self.shards.values())
+            results = list(self._executor.map(lambda shard: shard.fetchall(name, params, text), shards))
+            if self.epoch() == epoch:
+                return results
+
+    def fetch_grouped(self, name, ids, hydrate):
+        """
+        bulk.fetch_grouped() over every shard. Rows found on two shards (a
+        bucket being moved) are kept once.
+        """
+        grouped = {id: {} for id in ids}
+        if grouped:
+            for rows in self.fan_out(name, (json.dumps(list(grouped)),)):
+                for row in rows:
+                    grouped[row['owner_id']].setdefault(tuple(row), hydrate(row))
+        return {id: list(rows.values()) for id, rows in grouped.items()}
+
+    def merged(self, name, params=()):
+        """
+        The rows of a query that returns an id first, from every shard, in
+        id order and without duplicates.
+        """
+        merged = {}
+        for rows in self.fan_out(name, params):
+            for row in rows:
+                # A bucket being moved is briefly on both shards.
+                merged[row[0]] = row
+        return [merged[id] for id in sorted(merged)]
+
+    def iterate(self, name, params, batch_size=1000, after_id=None, limit=None):
+        """
+        Like statements.stream() for a keyset-paginated query over every
+        shard: `params(after_id, count)` builds its parameters, and each
+        page is the first `batch_size` ids of the shards' merged pages.
+        """
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1")
+        after_id = after_id or 0
+        while limit is None or limit > 0:
+            count = batch_size if limit is None else min(batch_size, limit)
+            page = self.merged(name, params(after_id, count))[:count]
+            yield from page
+            if len(page) < count:
+                return
+            after_id = page[-1][0]
+            if limit is not None:
+                limit -= len(page)
+
+    def next_id(self):
+        """
+        Returns a new article id, reserving ID_BLOCK ids from the catalog
+        at a time; ids reserved by a process that exits are skipped.
+        """
+        with self._lock:
+            if self._next_id >= self._last_id:
+                with connection.get_connection() as conn:
+                    end = statements.fetchall(conn, 'shards.reserve_ids', (ID_BLOCK,))[0]['next_id']
+                self._next_id, self._last_id = end - ID_BLOCK, end
+            self._next_id += 1
+            return self._next_id - 1
+
+    def _write(self, author_id, work):
+        while True:
+            shard = self.shard_for(author_id)
+            with shard.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # A move holds this lock until the bucket has left; see reshard().
+                if self.shard_for(author_id) is shard:
+                    return work(conn)
+                conn.rollback()
+
+    @staticmethod
+    def _replicate(conn, author_ids, magazine_ids):
+        # Copies the catalog rows the shard's foreign keys need.
+        with connection.get_connection() as catalog:
+            authors = statements.fetchall(catalog, 'authors.find_by_ids', (json.dumps(list(author_ids)),))
+            magazines = statements.fetchall(catalog, 'magazines.find_by_ids', (json.dumps(list(magazine_ids)),))
+        statements.executemany(conn, 'shards.replicate_author', [tuple(row) for row in authors])
+        statements.executemany(conn, 'shards.replicate_magazine', [tuple(row) for row in magazines])
+
+    def save_article(self, article):
+        """
+        Inserts or updates `article` on its author's shard. An article whose
+        author moved to another shard is re-inserted there under its id.
+        """
+        if article.id is None:
+            article.id = self.next_id()
+            inserted = True
+        else:
+            inserted = False
+        row = (article.id, article.title, article.author_id, article.magazine_id)
+
+        def work(conn):
+            if not inserted:
+                cursor = statements.execute(conn, 'articles.update', row[1:] + row[:1])
+                if cursor.rowcount:
+                    return False
+            self._replicate(conn, [article.author_id], [article.magazine_id])
+            statements.execute(conn, 'articles.insert_with_id', row)
+            return not inserted
+
+        moved = self._write(article.author_id, work)
+        if moved:
+            target = self.shard_for(article.author_id)
+            for shard in self.shards.values():
+                if shard is not target:
+                    with shard.connection() as conn:
+                        statements.fetchall(conn, 'articles.delete_many', (json.dumps([article.id]),))
+        return article
+
+    def insert_articles(self, articles):
+        """
+        Inserts new articles with ids from the sequence, in one transaction
+        per shard. Articles whose author's bucket moves meanwhile are
+        retried on the new shard.
+        """
+        for article in articles:
+            article.id = self.next_id()
+        pending = list(articles)
+        while pending:
+            owners = self.shards_for({article.author_id for article in pending})
+            groups = {}
+            for article in pending:
+                groups.setdefault(owners[article.author_id], []).append(article)
+            pending = []
+            for shard, group in groups.items():
+                with shard.connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    current = self.shards_for({article.author_id for article in group})
+                    here = [article for article in group if current[article.author_id] is shard]
+                    pending.extend(article for article in group if current[article.author_id] is not shard)
+                    if here:
+                        self._replicate(conn, {a.author_id for a in here}, {a.magazine_id for a in here})
+                        statements.executemany(conn, 'articles.insert_with_id', [
+                            (a.id, a.title, a.author_id, a.magazine_id) for a in here])
+        return articles
+
+    def replicate_updates(self, name, params):
+        """
+        Runs an `authors.update` or `magazines.update` statement on every
+        shard, for rows edited in the catalog. Shards without a copy of a
+        row are unaffected.
+        """
+        for shard in list(self.shards.values()):
+            if not shard.is_catalog:
+                with shard.connection() as conn:
+                    statements.executemany(conn, name, params)
+
+    def delete(self, name, params, text=None):
+        """
+        Runs a `*.delete_many` statement on every shard and returns the
+        deleted rows. Deleting an author or magazine copy cascades to the
+        shard's articles.
+        """
+        rows = []
+        for shard in list(self.shards.values()):
+            with shard.connection() as conn:
+                rows.extend(statements.fetchall(conn, name, params, text))
+        return rows
+
+    def find_article(self, id):
+        for rows in self.fan_out('articles.find_by_id', (id,)):
+            if rows:
+                return rows[0]
+        return None
+
+    def magazine_articles(self, magazine_id):
+        """
+        The rows of a magazine's articles from every shard, in id order.
+        """
+        return self.merged('magazines.articles', (magazine_id,))
+
+    def magazine_stats(self):
+        """
+        Returns {magazine_id: (article_count, author_count)} summed over
+        the shards; an author's articles share a shard, so authors are
+        counted once.
+        """
+        stats = {}
+        for rows in self.fan_out('shards.magazine_stats'):
+            for magazine_id, articles, authors in rows:
+                total = stats.get(magazine_id, (0, 0))
+                stats[magazine_id] = (total[0] + articles, total[1] + authors)
+        return stats
+
+    def article_counts(self):
+        """
+        Returns {magazine name: article count}, like Magazine.article_counts().
+        """
+        stats = self.magazine_stats()
+        with connection.get_connection() as conn:
+            names = statements.fetchall(conn, 'magazines.names')
+        return {name: stats.get(id, (0, 0))[0] for id, name in names}
+
+    def search(self, params, limit):
+        """
+        Runs `articles.search` on every shard and keeps the best `limit`
+        hits. bm25 weighs terms by each shard's own statistics, so ranks
+        from different shards are close to, not exactly, comparable.
+        """
+        hits = {}
+        for rows in self.fan_out('articles.search', params):
+            for row in rows:
+                hits[row['id']] = row
+        return sorted(hits.values(), key=lambda row: row['rank'])[:limit]
+
+    def most_published_id(self):
+        """
+        Returns the id of the author with the most articles. An author's
+        articles share a shard, so each shard's leader is a candidate.
+        """
+        leaders = [rows[0] for rows in self.fan_out('shards.top_author') if rows]
+        if not leaders:
+            return None
+        return max(leaders, key=lambda row: (row['article_count'], -row['author_id']))['author_id']
+
+    def reshard(self, paths, progress=None):
+        """
+        Spreads the buckets evenly over the shard files in `paths`, moving
+        as few as possible, and drops shards left without buckets from the
+        catalog (their files are kept). Each bucket moves in its own short
+        lock of the source shard. `progress(moved_buckets, total, articles)`
+        is called after each move. Returns the number of articles moved.
+        """
+        if not paths:
+            raise ValueError("reshard() needs at least one shard")
+        with connection.get_connection() as conn:
+            targets = [statements.fetchall(conn, 'shards.register', (path,))[0]['id']
+                       for path in dict.fromkeys(paths)]
+            owners = dict(statements.fetchall(conn, 'shards.buckets'))
+        self.reload()
+
+        quota = {id: BUCKETS // len(targets) + (i < BUCKETS % len(targets)) for i, id in enumerate(targets)}
+        kept = {}
+        moves = []
+        for bucket, owner in owners.items():
+            if owner in quota and kept.get(owner, 0) < quota[owner]:
+                kept[owner] = kept.get(owner, 0) + 1
+            else:
+                moves.append(bucket)
+        free = [id for id in targets for _ in range(quota[id] - kept.get(id, 0))]
+
+        moved = 0
+        for done, (bucket, target) in enumerate(zip(moves, free), 1):
+            moved += self._move(bucket, self.shards[owners[bucket]], self.shards[target])
+            if progress:
+                progress(done, len(moves), moved)
+        with connection.get_connection() as conn:
+            statements.execute(conn, 'shards.unregister_empty')
+        self.reload()
+        return moved
+
+    def _move(self, bucket, source, target):
+        with source.connection() as src:
+            # Held until the bucket is gone from the source: writers to it
+            # wait, then see the new owner and retry there.
+            src.execute("BEGIN IMMEDIATE")
+            author_ids = [row[0] for row in statements.fetchall(src, 'shards.bucket_authors', (BUCKETS, bucket))]
+            ids = json.dumps(author_ids)
+            rows = [tuple(row) for row in statements.fetchall(src, 'articles.for_authors', (ids,))]
+            if rows:
+                with target.connection() as dst:
+                    dst.execute("BEGIN IMMEDIATE")
+                    self._replicate(dst, author_ids, {row[3] for row in rows})
+                    statements.executemany(dst, 'articles.insert_with_id', rows)
+            if source.is_catalog:
+                statements.execute(src, 'shards.assign', (target.id, bucket))
+            else:
+                with connection.get_connection() as conn:
+                    statements.execute(conn, 'shards.assign', (target.id, bucket))
+            statements.execute(src, 'articles.delete_for_authors', (ids,))
+        return len(rows)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def active():
+    """
+    The configured ShardRouter, or None when articles are not sharded.
+    """
+    return _router
+
+
+def check_unsharded(what):
+    """
+    Raises RuntimeError while articles are sharded: `what` works on the
+    catalog's database alone, so it would miss or misplace article rows.
+    """
+    if _router is not None:
+        raise RuntimeError(f"{what} cannot be used while articles are sharded")
+
+
+def configure_shards(enabled=True, pool_size=SHARD_POOL_SIZE):
+    """
+    Turns routing of article queries through the catalog's shard map on or
+    off. Returns the new router, or None.
+    """
+    global _router
+    with _router_lock:
+        old, _router = _router, None
+        if enabled:
+            setup_catalog()
+            _router = ShardRouter(pool_size)
+    if old is not None:
+        old.close()
+    return _router
@@ -0,0 +1,338 @@
+"""
+Named SQL statements for lib.models. Running every model query through
+these helpers records per-statement call counts, latency percentiles and
+row counts, and logs statements slower than SLOW_QUERY_MS.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ['ARTICLES_DB_SLOW_QUERY_MS']) if os.environ.get('ARTICLES_DB_SLOW_QUERY_MS') else None
+SAMPLE_SIZE = 1024
+
+STATEMENTS = {
+    'authors.insert': "INSERT INTO authors (name) VALUES (?)",
+    'authors.update': "UPDATE authors SET name=? WHERE id=?",
+    'authors.upsert': """
+        INSERT INTO authors (name) VALUES (?)
+        ON CONFLICT (name) DO UPDATE SET name = excluded.name
+        RETURNING id""",
+    'authors.upsert_many': """
+        INSERT INTO authors (name)
+        SELECT json_extract(value, '$[0]') FROM json_each(?) WHERE true
+        ON CONFLICT (name) DO UPDATE SET name = excluded.name
+        RETURNING id, name""",
+    'authors.delete_many': "DELETE FROM authors WHERE id IN (SELECT value FROM json_each(?)) RETURNING id",
+    'authors.find_by_id': "SELECT * FROM authors WHERE id=?",
+    'authors.find_by_ids': "SELECT * FROM authors WHERE id IN (SELECT value FROM json_each(?))",
+    'authors.find_by_name': "SELECT * FROM authors WHERE name=?",
+    'authors.articles': "SELECT * FROM articles WHERE author_id=?",
+    'authors.iter_articles': """
+        SELECT * FROM articles WHERE author_id=? AND id>?
+        ORDER BY id LIMIT ?""",
+    'authors.magazines': """
+        SELECT DISTINCT magazines.* FROM magazines
+        JOIN articles ON magazines.id = articles.magazine_id
+        WHERE articles.author_id=?""",
+    'authors.topic_areas': """
+        SELECT DISTINCT category FROM magazines
+        JOIN articles ON magazines.id = articles.magazine_id
+        WHERE articles.author_id=?""",
+    'authors.magazines_for': """
+        SELECT DISTINCT articles.author_id AS owner_id, magazines.* FROM articles
+        JOIN magazines ON magazines.id = articles.magazine_id
+        WHERE articles.author_id IN (SELECT value FROM json_each(?))""",
+    'authors.topic_areas_for': """
+        SELECT DISTINCT articles.author_id AS owner_id, magazines.category FROM articles
+        JOIN magazines ON magazines.id = articles.magazine_id
+        WHERE articles.author_id IN (SELECT value FROM json_each(?))""",
+    'authors.article_count': "SELECT article_count FROM author_stats WHERE author_id=?",
+    'authors.article_counts_for': """
+        SELECT author_id AS owner_id, article_count FROM author_stats
+        WHERE author_id IN (SELECT value FROM json_each(?))""",
+    'authors.most_published': """
+        SELECT authors.* FROM author_stats
+        JOIN authors ON authors.id = author_stats.author_id
+        ORDER BY author_stats.article_count DESC, author_stats.author_id LIMIT 1""",
+
+    'magazines.categories': "SELECT id, category FROM magazines",
+    'magazines.names': "SELECT id, name FROM magazines",
+    'magazines.insert': "INSERT INTO magazines (name, category) VALUES (?, ?)",
+    'magazines.update': "UPDATE magazines SET name=?, category=? WHERE id=?",
+    'magazines.upsert': """
+        INSERT INTO magazines (name, category) VALUES (?, ?)
+        ON CONFLICT (name, category) DO UPDATE SET name = excluded.name
+        RETURNING id""",
+    'magazines.upsert_many': """
+        INSERT INTO magazines (name, category)
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?) WHERE true
+        ON CONFLICT (name, category) DO UPDATE SET name = excluded.name
+        RETURNING id, name, category""",
+    'magazines.delete_many': "DELETE FROM magazines WHERE id IN (SELECT value FROM json_each(?)) RETURNING id",
+    'magazines.find_by_id': "SELECT * FROM magazines WHERE id=?",
+    'magazines.find_by_ids': "SELECT * FROM magazines WHERE id IN (SELECT value FROM json_each(?))",
+    'magazines.articles': "SELECT * FROM articles WHERE magazine_id=?",
+    'magazines.iter_articles': """
+        SELECT * FROM articles WHERE magazine_id=? AND id>?
+        ORDER BY id LIMIT ?""",
+    'magazines.contributors': """
+        SELECT DISTINCT authors.* FROM authors
+        JOIN articles ON authors.id = articles.author_id
+        WHERE articles.magazine_id=?""",
+    'magazines.contributors_for': """
+        SELECT DISTINCT articles.magazine_id AS owner_id, authors.* FROM articles
+        JOIN authors ON authors.id = articles.author_id
+        WHERE articles.magazine_id IN (SELECT value FROM json_each(?))""",
+    'magazines.iter_contributors': """
+        SELECT * FROM authors WHERE id>? AND id IN (
+            SELECT author_id FROM articles WHERE magazine_id=?)
+        ORDER BY id LIMIT ?""",
+    'magazines.article_titles': "SELECT title FROM articles WHERE magazine_id=?",
+    'magazines.contributing_authors': """
+        SELECT authors.* FROM magazine_authors
+        JOIN authors ON authors.id = magazine_authors.author_id
+        WHERE magazine_authors.magazine_id=? AND magazine_authors.article_count > 2""",
+    'magazines.contributing_authors_for': """
+        SELECT magazine_authors.magazine_id AS owner_id, authors.* FROM magazine_authors
+        JOIN authors ON authors.id = magazine_authors.author_id
+        WHERE magazine_authors.magazine_id IN (SELECT value FROM json_each(?))
+          AND magazine_authors.article_count > 2""",
+    'magazines.stats': """
+        SELECT article_count, author_count FROM magazine_stats WHERE magazine_id=?""",
+    'magazines.article_counts': """
+        SELECT magazines.name, COALESCE(magazine_stats.article_count, 0) as count
+        FROM magazines LEFT JOIN magazine_stats
+        ON magazine_stats.magazine_id = magazines.id""",
+    'magazines.find_with_multiple_authors': """
+        SELECT magazines.* FROM magazine_stats
+        JOIN magazines ON magazines.id = magazine_stats.magazine_id
+        WHERE magazine_stats.author_count >= 2""",
+    'magazines.iter_with_multiple_authors': """
+        SELECT magazines.* FROM magazines
+        JOIN magazine_stats ON magazine_stats.magazine_id = magazines.id
+        WHERE magazines.id>? AND magazine_stats.author_count >= 2
+        ORDER BY magazines.id LIMIT ?""",
+
+    'articles.snapshot': "SELECT id, author_id, magazine_id FROM articles WHERE id > ? ORDER BY id",
+    'articles.export_range': """
+        SELECT articles.id, articles.title,
+               articles.author_id, authors.name,
+               articles.magazine_id, magazines.name, magazines.category
+        FROM articles
+        JOIN authors ON authors.id = articles.author_id
+        JOIN magazines ON magazines.id = articles.magazine_id
+        WHERE articles.id >= ? AND articles.id < ?
+        ORDER BY articles.id""",
+
+    'table_versions.all': "SELECT name, version FROM table_versions",
+
+    'articles.insert': "INSERT INTO articles (title, author_id, magazine_id) VALUES (?, ?, ?)",
+    'articles.update': "UPDATE articles SET title=?, author_id=?, magazine_id=? WHERE id=?",
+    'articles.delete_many': "DELETE FROM articles WHERE id IN (SELECT value FROM json_each(?)) RETURNING id",
+    'articles.find_by_id': "SELECT * FROM articles WHERE id=?",
+    'articles.insert_with_id': "INSERT INTO articles (id, title, author_id, magazine_id) VALUES (?, ?, ?, ?)",
+    'articles.for_authors': "SELECT * FROM articles WHERE author_id IN (SELECT value FROM json_each(?))",
+    'articles.delete_for_authors': "DELETE FROM articles WHERE author_id IN (SELECT value FROM json_each(?))",
+    'articles.search': """
+        SELECT articles.*,
+               snippet(articles_fts, 0, ?, ?, '…', 12) AS snippet,
+               bm25(articles_fts) AS rank
+        FROM articles_fts JOIN articles ON articles.id = articles_fts.rowid
+        WHERE articles_fts MATCH ?
+          AND (? IS NULL OR articles.magazine_id = ?)
+          AND (? IS NULL OR articles.author_id = ?)
+        ORDER BY rank LIMIT ?""",
+
+    'changes.after': """
+        SELECT seq, table_name, row_id, op FROM changes
+        WHERE seq > ? ORDER BY seq LIMIT ?""",
+    # A shard's own log: its author and magazine rows are copies.
+    'changes.articles_after': """
+        SELECT seq, table_name, row_id, op FROM changes
+        WHERE seq > ? AND table_name = 'articles' ORDER BY seq LIMIT ?""",
+    'changes.articles_pending': "SELECT COUNT(*) FROM changes WHERE seq > ? AND table_name = 'articles'",
+    'changes.oldest': "SELECT MIN(seq) FROM changes",
+    'changes.article_edits': """
+        SELECT 1 FROM changes
+        WHERE seq > ? AND table_name = 'articles' AND (op != 'insert' OR row_id <= ?)
+        LIMIT 1""",
+    'changes.latest': "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0)",
+    'changes.cursor': "SELECT seq FROM change_cursors WHERE consumer=?",
+    'changes.cursors': "SELECT consumer, seq FROM change_cursors ORDER BY consumer",
+    'changes.subscribe': """
+        INSERT INTO change_cursors (consumer, seq) VALUES (?, ?)
+        ON CONFLICT (consumer) DO NOTHING""",
+    'changes.seek': """
+        INSERT INTO change_cursors (consumer, seq) VALUES (?, ?)
+        ON CONFLICT (consumer) DO UPDATE SET seq = excluded.seq""",
+    'changes.ack': "UPDATE change_cursors SET seq = MAX(seq, ?) WHERE consumer=?",
+    'changes.unsubscribe': "DELETE FROM change_cursors WHERE consumer=?",
+    'changes.compact': """
+        DELETE FROM changes WHERE seq IN (
+            SELECT seq FROM changes WHERE seq <= (SELECT MIN(seq) FROM change_cursors)
+            ORDER BY seq LIMIT ?)""",
+
+    # lib.db.shards: the catalog's shard map and id sequence, and the
+    # per-shard queries whose results the router merges.
+    'shards.all': "SELECT id, path FROM shards ORDER BY id",
+    'shards.register': """
+        INSERT INTO shards (path) VALUES (?)
+        ON CONFLICT (path) DO UPDATE SET path = excluded.path
+        RETURNING id""",
+    'shards.unregister_empty': "DELETE FROM shards WHERE id NOT IN (SELECT shard_id FROM shard_buckets)",
+    'shards.buckets': "SELECT bucket, shard_id FROM shard_buckets ORDER BY bucket",
+    'shards.for_bucket': "SELECT shard_id FROM shard_buckets WHERE bucket=?",
+    'shards.for_buckets': """
+        SELECT bucket, shard_id FROM shard_buckets
+        WHERE bucket IN (SELECT value FROM json_each(?))""",
+    'shards.assign': "UPDATE shard_buckets SET shard_id=? WHERE bucket=?",
+    'shards.epoch': "SELECT epoch FROM shard_epoch",
+    'shards.reserve_ids': "UPDATE shard_sequence SET next_id = next_id + ? RETURNING next_id",
+    # The same hash as shards.bucket_of().
+    'shards.bucket_authors': """
+        SELECT author_id FROM author_stats
+        WHERE (author_id * 2654435761) % 4294967296 % ? = ?""",
+    'shards.replicate_author': """
+        INSERT INTO authors (id, name) VALUES (?, ?)
+        ON CONFLICT (id) DO UPDATE SET name = excluded.name""",
+    'shards.replicate_magazine': """
+        INSERT INTO magazines (id, name, category) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET name = excluded.name, category = excluded.category""",
+    'shards.magazine_stats': "SELECT magazine_id, article_count, author_count FROM magazine_stats",
+    'shards.top_author': """
+        SELECT author_id, article_count FROM author_stats
+        ORDER BY article_count DESC, author_id LIMIT 1""",
+}
+
+
+class StatementStats:
+    __slots__ = ('calls', 'total', 'rows', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {
+            'calls': self.calls,
+            'rows': self.rows,
+            'total_ms': self.total * 1000,
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99),
+        }
+
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def sql(name):
+    return STATEMENTS[name]
+
+
+def record(name, elapsed, rows, text=None):
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = StatementStats()
+        entry.calls += 1
+        entry.total += elapsed
+        entry.rows += max(rows, 0)
+        entry.samples.append(elapsed)
+    if SLOW_QUERY_MS is not None and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow query %s took %.1f ms: %s", name, elapsed * 1000,
+                       ' '.join((text or STATEMENTS.get(name, '')).split()))
+
+
+def fetchone(conn, name, params=()):
+    start = time.perf_counter()
+    row = conn.execute(STATEMENTS[name], params).fetchone()
+    record(name, time.perf_counter() - start, int(row is not None))
+    return row
+
+
+def fetchall(conn, name, params=(), text=None):
+    start = time.perf_counter()
+    rows = conn.execute(text or STATEMENTS[name], params).fetchall()
+    record(name, time.perf_counter() - start, len(rows), text)
+    return rows
+
+
+def execute(conn, name, params=(), text=None):
+    """
+    Runs a write statement and records the rows it changed. `text` replaces
+    the registered SQL for variants such as partial UPDATEs, which are
+    still accounted under `name`.
+    """
+    start = time.perf_counter()
+    cursor = conn.execute(text or STATEMENTS[name], params)
+    record(name, time.perf_counter() - start, cursor.rowcount, text)
+    return cursor
+
+
+def executemany(conn, name, seq):
+    start = time.perf_counter()
+    cursor = conn.executemany(STATEMENTS[name], seq)
+    record(name, time.perf_counter() - start, cursor.rowcount)
+    return cursor
+
+
+def stream(name, params=(), batch_size=1000, pool=None):
+    """
+    Like lib.db.connection.stream() for a named statement. The latency
+    recorded is the time spent inside SQLite, not in the consumer.
+    """
+    from lib.db.connection import stream as stream_rows
+    rows = stream_rows(STATEMENTS[name], params, batch_size, pool)
+    count = 0
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            count += 1
+            yield row
+    finally:
+        rows.close()
+        record(name, elapsed, count)
+
+
+def stats():
+    """
+    Returns {name: {'calls', 'rows', 'total_ms', 'p50_ms', 'p99_ms'}},
+    busiest statements first.
+    """
+    with _lock:
+        snapshot = {name: entry.snapshot() for name, entry in _stats.items()}
+    return dict(sorted(snapshot.items(), key=lambda item: -item[1]['total_ms']))
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def configure(slow_query_ms=None):
+    """
+    Sets the slow-query log threshold in milliseconds; None disables it.
+    """
+    global SLOW_QUERY_MS
+    SLOW_QUERY_MS = slow_query_ms
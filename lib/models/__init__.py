@@ -1,5 +1,5 @@
-from .author import Author
-from .article import Article
-from .magazine import Magazine
+from .author import Author, AuthorRow
+from .article import Article, ArticleRow, SearchHit
+from .magazine import Magazine, MagazineRow
 
-__all__ = ['Author', 'Article', 'Magazine']
+__all__ = ['Author', 'Article', 'Magazine', 'AuthorRow', 'ArticleRow', 'MagazineRow', 'SearchHit']
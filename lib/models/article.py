@@ -1,11 +1,37 @@
-from lib.db.connection import get_connection
+import json
+from collections import namedtuple
+from lib.db.connection import get_connection, record_write
+from lib.db import aio, bulk, cache, dirty, shards, statements
+
+ArticleRow = namedtuple('ArticleRow', 'id title author_id magazine_id')
+SearchHit = namedtuple('SearchHit', 'article snippet rank')
 
 class Article:
+    __slots__ = ('id', '_title', '_author_id', '_magazine_id', '_author', '_magazine', '_dirty')
+
     def __init__(self, title, author_id, magazine_id, id=None):
         self.id = id
+        self._dirty = dirty.CLEAN
         self.title = title
         self.author_id = author_id
         self.magazine_id = magazine_id
+        self._author = None
+        self._magazine = None
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an article from a stored row, skipping setter validation.
+        """
+        article = cls.__new__(cls)
+        article.id = row['id']
+        article._title = row['title']
+        article._author_id = row['author_id']
+        article._magazine_id = row['magazine_id']
+        article._author = None
+        article._magazine = None
+        article._dirty = dirty.CLEAN
+        return article
 
     def __repr__(self):
         return f"<Article {self.title}>"
@@ -18,32 +44,190 @@ class Article:
     def title(self, value):
         if not isinstance(value, str) or not 1 <= len(value) <= 255:
             raise ValueError("Title must be between 1-255 characters")
+        dirty.mark(self, 'title', value)
         self._title = value
 
+    @property
+    def author_id(self):
+        return self._author_id
+
+    @author_id.setter
+    def author_id(self, value):
+        dirty.mark(self, 'author_id', value)
+        self._author_id = value
+
+    @property
+    def magazine_id(self):
+        return self._magazine_id
+
+    @magazine_id.setter
+    def magazine_id(self, value):
+        dirty.mark(self, 'magazine_id', value)
+        self._magazine_id = value
+
     def save(self):
-        with get_connection() as conn:
-            cur = conn.cursor()
-            if self.id:
-                cur.execute("""
-                    UPDATE articles SET title=?, author_id=?, magazine_id=?
-                    WHERE id=?""", (self.title, self.author_id, self.magazine_id, self.id))
-            else:
-                cur.execute("""
-                    INSERT INTO articles (title, author_id, magazine_id)
-                    VALUES (?, ?, ?)""", (self.title, self.author_id, self.magazine_id))
-                self.id = cur.lastrowid
+        if self.id and not self._dirty:
+            dirty.skip(self)
             return self
+        previous_id = self.id
+        router = shards.active()
+        if router:
+            router.save_article(self)
+        else:
+            with get_connection() as conn:
+                if self.id:
+                    text, params = dirty.update_statement('articles', self, self._dirty)
+                    statements.execute(conn, 'articles.update', params, text)
+                else:
+                    cur = statements.execute(conn, 'articles.insert',
+                                             (self.title, self.author_id, self.magazine_id))
+                    self.id = cur.lastrowid
+        record_write(self, previous_id)
+        self._dirty = dirty.CLEAN
+        cache.register(self)
+        return self
+
+    @classmethod
+    def save_many(cls, articles, chunk_size=bulk.DEFAULT_CHUNK_SIZE):
+        router = shards.active()
+        if router:
+            articles = bulk.checked(cls, articles)
+            new = [article for article in articles if not article.id]
+            for article in articles:
+                if article.id:
+                    article.save()
+            # Ids come from the shard sequence, not each shard's AUTOINCREMENT.
+            router.insert_articles(new)
+            for article in new:
+                record_write(article, None)
+                article._dirty = dirty.CLEAN
+                cache.register(article)
+            return articles
+        return bulk.save_many(
+            cls, articles, 'articles.insert', 'articles.update',
+            lambda a: (a.title, a.author_id, a.magazine_id),
+            chunk_size)
+
+    def delete(self):
+        """
+        Deletes this article. Returns whether the row existed; the instance
+        becomes unsaved.
+        """
+        deleted = self.delete_many([self.id]) if self.id else 0
+        self.id = None
+        return bool(deleted)
+
+    @classmethod
+    def delete_many(cls, ids):
+        return bulk.delete_many(cls, 'articles', ids)
+
+    @classmethod
+    def delete_where(cls, **filters):
+        return bulk.delete_where(cls, 'articles', ('id', 'title', 'author_id', 'magazine_id'), filters)
 
     @classmethod
     def find_by_id(cls, id):
+        def load():
+            router = shards.active()
+            if router:
+                return router.find_article(id)
+            with get_connection() as conn:
+                return statements.fetchone(conn, 'articles.find_by_id', (id,))
+        return cache.find(cls, id, load)
+
+    @staticmethod
+    def match_expression(query, prefix=True):
+        """
+        Turns free text into an FTS5 query: every word must match, and with
+        `prefix` the last word also matches as a prefix ("pyth" -> python).
+        """
+        terms = [term.replace('"', '') for term in query.split()]
+        terms = [f'"{term}"' for term in terms if term]
+        if not terms:
+            raise ValueError("Search query must contain at least one word")
+        if prefix:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    @classmethod
+    def search(cls, query, limit=20, magazine_id=None, author_id=None, prefix=True, highlight=('[', ']')):
+        """
+        Full-text search over titles, best bm25 match first. Returns
+        SearchHit(article, snippet, rank) tuples; the snippet wraps matched
+        words in the `highlight` markers.
+        """
+        start, end = highlight
+        params = (start, end, cls.match_expression(query, prefix),
+                  magazine_id, magazine_id, author_id, author_id, limit)
+        router = shards.active()
+        if router and author_id is not None:
+            with router.connection_for(author_id) as conn:
+                rows = statements.fetchall(conn, 'articles.search', params)
+        elif router:
+            rows = router.search(params, limit)
+        else:
+            with get_connection() as conn:
+                rows = statements.fetchall(conn, 'articles.search', params)
+        return [SearchHit(cls.from_row(row), row['snippet'], row['rank']) for row in rows]
+
+    @classmethod
+    def preload(cls, articles, include):
+        """
+        Attaches the related rows named in `include` ('author', 'magazine')
+        to every article, with one query per relation. Authors and magazines
+        are read from the catalog, also when articles are sharded.
+        """
+        from .author import Author
+        from .magazine import Magazine
+        relations = {
+            'author': (Author, 'authors', 'author_id', '_author'),
+            'magazine': (Magazine, 'magazines', 'magazine_id', '_magazine'),
+        }
+        unknown = set(include) - set(relations)
+        if unknown:
+            raise ValueError(f"Unknown relation(s): {', '.join(sorted(unknown))}")
         with get_connection() as conn:
-            row = conn.execute("SELECT * FROM articles WHERE id=?", (id,)).fetchone()
-            return cls(**row) if row else None
+            for name in include:
+                model, table, key, attr = relations[name]
+                ids = sorted({getattr(a, key) for a in articles})
+                if not ids:
+                    continue
+                rows = statements.fetchall(conn, f'{table}.find_by_ids', (json.dumps(ids),))
+                related = {row['id']: model.from_row(row) for row in rows}
+                for article in articles:
+                    setattr(article, attr, related.get(getattr(article, key)))
+        return articles
 
     def author(self):
         from .author import Author
+        if self._author is not None and self._author.id == self.author_id:
+            return self._author
         return Author.find_by_id(self.author_id)
 
     def magazine(self):
         from .magazine import Magazine
-        return Magazine.find_by_id(self.magazine_id)
\ No newline at end of file
+        if self._magazine is not None and self._magazine.id == self.magazine_id:
+            return self._magazine
+        return Magazine.find_by_id(self.magazine_id)
+
+    # Async facade: the same queries, run on the database thread pool.
+
+    async def asave(self):
+        return await aio.run(self.save)
+
+    async def adelete(self):
+        return await aio.run(self.delete)
+
+    @classmethod
+    async def adelete_many(cls, ids):
+        return await aio.run(cls.delete_many, ids)
+
+    @classmethod
+    async def afind_by_id(cls, id):
+        return await aio.run(cls.find_by_id, id)
+
+    async def aauthor(self):
+        return await aio.run(self.author)
+
+    async def amagazine(self):
+        return await aio.run(self.magazine)
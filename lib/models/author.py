@@ -1,10 +1,28 @@
-from lib.db.connection import get_connection
+from collections import namedtuple
+from lib.db.connection import get_connection, record_write
+from lib.db import aio, bulk, cache, dirty, querycache, shards, statements
+
+AuthorRow = namedtuple('AuthorRow', 'id name')
 
 class Author:
+    __slots__ = ('id', '_name', '_dirty')
+
     def __init__(self, name, id=None):
         self.id = id
+        self._dirty = dirty.CLEAN
         self.name = name
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an author from a stored row, skipping setter validation.
+        """
+        author = cls.__new__(cls)
+        author.id = row['id']
+        author._name = row['name']
+        author._dirty = dirty.CLEAN
+        return author
+
     def __repr__(self):
         return f"<Author {self.name}>"
 
@@ -16,64 +34,247 @@ class Author:
     def name(self, value):
         if not isinstance(value, str) or not value.strip():
             raise ValueError("Name must be a non-empty string")
+        dirty.mark(self, 'name', value.strip())
         self._name = value.strip()
 
     def save(self):
+        if self.id and not self._dirty:
+            dirty.skip(self)
+            return self
+        previous_id = self.id
         with get_connection() as conn:
-            cur = conn.cursor()
             if self.id:
-                cur.execute("UPDATE authors SET name=? WHERE id=?", 
-                          (self.name, self.id))
+                text, params = dirty.update_statement('authors', self, self._dirty)
+                statements.execute(conn, 'authors.update', params, text)
             else:
-                cur.execute("INSERT INTO authors (name) VALUES (?)", 
-                          (self.name,))
+                cur = statements.execute(conn, 'authors.insert', (self.name,))
                 self.id = cur.lastrowid
-            return self
+        router = shards.active()
+        if router and previous_id:
+            router.replicate_updates('authors.update', [(self.name, self.id)])
+        record_write(self, previous_id)
+        self._dirty = dirty.CLEAN
+        cache.register(self)
+        return self
 
     @classmethod
-    def find_by_id(cls, id):
+    def save_many(cls, authors, chunk_size=bulk.DEFAULT_CHUNK_SIZE):
+        return bulk.save_many(
+            cls, authors, 'authors.insert', 'authors.update',
+            lambda a: (a.name,),
+            chunk_size)
+
+    def upsert(self):
+        """
+        Saves this author by name: if the name exists, this instance takes
+        that row's id instead of inserting a duplicate. One statement, safe
+        against concurrent writers.
+        """
+        previous_id = self.id
         with get_connection() as conn:
-            row = conn.execute("SELECT * FROM authors WHERE id=?", (id,)).fetchone()
-            return cls(**row) if row else None
+            self.id = statements.fetchall(conn, 'authors.upsert', (self.name,))[0]['id']
+        record_write(self, previous_id)
+        self._dirty = dirty.CLEAN
+        cache.register(self)
+        return self
 
     @classmethod
-    def find_by_name(cls, name):
-        with get_connection() as conn:
-            row = conn.execute("SELECT * FROM authors WHERE name=?", (name,)).fetchone()
-            return cls(**row) if row else None
+    def find_or_create(cls, name):
+        return cls(name).upsert()
+
+    @classmethod
+    def upsert_many(cls, authors, chunk_size=bulk.DEFAULT_CHUNK_SIZE):
+        """
+        upsert() for many authors, one statement per chunk. Repeated names
+        share a row.
+        """
+        return bulk.upsert_many(cls, authors, 'authors.upsert_many', lambda a: (a.name,), chunk_size)
+
+    def delete(self):
+        """
+        Deletes this author and, through the foreign key, all their articles.
+        Returns whether the row existed; the instance becomes unsaved.
+        """
+        deleted = self.delete_many([self.id]) if self.id else 0
+        self.id = None
+        return bool(deleted)
+
+    @classmethod
+    def delete_many(cls, ids):
+        from .article import Article
+        return bulk.delete_many(cls, 'authors', ids, cascade=(Article,))
 
-    def articles(self):
+    @classmethod
+    def delete_where(cls, **filters):
         from .article import Article
+        return bulk.delete_where(cls, 'authors', ('id', 'name'), filters, cascade=(Article,))
+
+    @classmethod
+    def find_by_id(cls, id):
+        def load():
+            with get_connection() as conn:
+                return statements.fetchone(conn, 'authors.find_by_id', (id,))
+        return cache.find(cls, id, load)
+
+    @classmethod
+    def find_by_name(cls, name):
         with get_connection() as conn:
-            rows = conn.execute("SELECT * FROM articles WHERE author_id=?", (self.id,)).fetchall()
-            return [Article(**row) for row in rows]
+            row = statements.fetchone(conn, 'authors.find_by_name', (name,))
+            return cls.from_row(row) if row else None
 
-    def magazines(self):
-        from .magazine import Magazine
+    def articles(self, include=(), tuples=False):
+        from .article import Article, ArticleRow
+        if include and tuples:
+            raise ValueError("include cannot be combined with tuples")
+        router = shards.active()
+        with (router.connection_for(self.id) if router else get_connection()) as conn:
+            rows = statements.fetchall(conn, 'authors.articles', (self.id,))
+            if tuples:
+                return [ArticleRow._make(row) for row in rows]
+            articles = [Article.from_row(row) for row in rows]
+        return Article.preload(articles, include) if include else articles
+
+    def iter_articles(self, batch_size=1000, after_id=None, limit=None, tuples=False):
+        """
+        Lazily yields this author's articles in id order. Pass the last seen
+        id as `after_id` to resume from there (keyset pagination).
+        """
+        from .article import Article, ArticleRow
+        hydrate = ArticleRow._make if tuples else Article.from_row
+        router = shards.active()
+        rows = statements.stream(
+            'authors.iter_articles', (self.id, after_id or 0, -1 if limit is None else limit), batch_size,
+            router.shard_for(self.id).pool if router else None)
+        for row in rows:
+            yield hydrate(row)
+
+    def magazines(self, tuples=False):
+        from .magazine import Magazine, MagazineRow
+        hydrate = MagazineRow._make if tuples else Magazine.from_row
+        router = shards.active()
+        with (router.connection_for(self.id) if router else get_connection()) as conn:
+            rows = querycache.fetchall(conn, 'authors.magazines', (self.id,))
+            return [hydrate(row) for row in rows]
+
+    @classmethod
+    def magazines_for(cls, ids, tuples=False):
+        """
+        Returns {author_id: [Magazine, ...]} for many authors in one query.
+        """
+        from .magazine import Magazine, MagazineRow
+        hydrate = (lambda row: MagazineRow._make(row[1:])) if tuples else Magazine.from_row
+        router = shards.active()
+        if router:
+            return router.fetch_grouped('authors.magazines_for', ids, hydrate)
         with get_connection() as conn:
-            rows = conn.execute("""
-                SELECT DISTINCT magazines.* FROM magazines
-                JOIN articles ON magazines.id = articles.magazine_id
-                WHERE articles.author_id=?""", (self.id,)).fetchall()
-            return [Magazine(**row) for row in rows]
+            return bulk.fetch_grouped(conn, 'authors.magazines_for', ids, hydrate)
 
     def add_article(self, magazine, title):
         from .article import Article
         return Article(title, self.id, magazine.id).save()
 
     def topic_areas(self):
-        with get_connection() as conn:
-            rows = conn.execute("""
-                SELECT DISTINCT category FROM magazines
-                JOIN articles ON magazines.id = articles.magazine_id
-                WHERE articles.author_id=?""", (self.id,)).fetchall()
+        router = shards.active()
+        with (router.connection_for(self.id) if router else get_connection()) as conn:
+            rows = querycache.fetchall(conn, 'authors.topic_areas', (self.id,))
             return [row['category'] for row in rows]
 
+    @classmethod
+    def topic_areas_for(cls, ids):
+        """
+        Returns {author_id: [category, ...]} for many authors in one query.
+        """
+        router = shards.active()
+        if router:
+            return router.fetch_grouped('authors.topic_areas_for', ids, lambda row: row['category'])
+        with get_connection() as conn:
+            return bulk.fetch_grouped(conn, 'authors.topic_areas_for', ids, lambda row: row['category'])
+
+    def article_count(self):
+        router = shards.active()
+        with (router.connection_for(self.id) if router else get_connection()) as conn:
+            row = statements.fetchone(conn, 'authors.article_count', (self.id,))
+            return row['article_count'] if row else 0
+
+    @classmethod
+    def article_counts_for(cls, ids):
+        """
+        Returns {author_id: article count} for many authors in one query.
+        """
+        router = shards.active()
+        if router:
+            grouped = router.fetch_grouped('authors.article_counts_for', ids, lambda row: row['article_count'])
+        else:
+            with get_connection() as conn:
+                grouped = bulk.fetch_grouped(conn, 'authors.article_counts_for', ids,
+                                             lambda row: row['article_count'])
+        return {id: sum(counts) for id, counts in grouped.items()}
+
     @classmethod
     def most_published(cls):
+        router = shards.active()
+        if router:
+            id = router.most_published_id()
+            return cls.find_by_id(id) if id is not None else None
         with get_connection() as conn:
-            row = conn.execute("""
-                SELECT author_id, COUNT(*) as count FROM articles
-                GROUP BY author_id ORDER BY count DESC LIMIT 1
-            """).fetchone()
-            return cls.find_by_id(row['author_id']) if row else None
\ No newline at end of file
+            row = statements.fetchone(conn, 'authors.most_published')
+            return cls.from_row(row) if row else None
+
+    # Async facade: the same queries, run on the database thread pool.
+
+    async def asave(self):
+        return await aio.run(self.save)
+
+    async def aupsert(self):
+        return await aio.run(self.upsert)
+
+    @classmethod
+    async def afind_or_create(cls, name):
+        return await aio.run(cls.find_or_create, name)
+
+    async def adelete(self):
+        return await aio.run(self.delete)
+
+    @classmethod
+    async def adelete_many(cls, ids):
+        return await aio.run(cls.delete_many, ids)
+
+    @classmethod
+    async def afind_by_id(cls, id):
+        return await aio.run(cls.find_by_id, id)
+
+    @classmethod
+    async def afind_by_name(cls, name):
+        return await aio.run(cls.find_by_name, name)
+
+    async def aarticles(self, include=(), tuples=False):
+        return await aio.run(self.articles, include, tuples)
+
+    def aiter_articles(self, batch_size=1000):
+        return aio.iterate(
+            lambda after_id, limit: self.iter_articles(batch_size, after_id, limit), batch_size)
+
+    async def amagazines(self, tuples=False):
+        return await aio.run(self.magazines, tuples)
+
+    async def aadd_article(self, magazine, title):
+        return await aio.run(self.add_article, magazine, title)
+
+    async def atopic_areas(self):
+        return await aio.run(self.topic_areas)
+
+    @classmethod
+    async def amagazines_for(cls, ids, tuples=False):
+        return await aio.run(cls.magazines_for, ids, tuples)
+
+    @classmethod
+    async def atopic_areas_for(cls, ids):
+        return await aio.run(cls.topic_areas_for, ids)
+
+    @classmethod
+    async def aarticle_counts_for(cls, ids):
+        return await aio.run(cls.article_counts_for, ids)
+
+    @classmethod
+    async def amost_published(cls):
+        return await aio.run(cls.most_published)
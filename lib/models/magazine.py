@@ -1,11 +1,31 @@
-from lib.db.connection import get_connection
+import json
+from collections import namedtuple
+from lib.db.connection import get_connection, record_write
+from lib.db import aio, bulk, cache, dirty, querycache, shards, statements
+
+MagazineRow = namedtuple('MagazineRow', 'id name category')
 
 class Magazine:
+    __slots__ = ('id', '_name', '_category', '_dirty')
+
     def __init__(self, name, category, id=None):
         self.id = id
+        self._dirty = dirty.CLEAN
         self.name = name
         self.category = category
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a magazine from a stored row, skipping setter validation.
+        """
+        magazine = cls.__new__(cls)
+        magazine.id = row['id']
+        magazine._name = row['name']
+        magazine._category = row['category']
+        magazine._dirty = dirty.CLEAN
+        return magazine
+
     def __repr__(self):
         return f"<Magazine {self.name} ({self.category})>"
 
@@ -17,6 +37,7 @@ class Magazine:
     def name(self, value):
         if not isinstance(value, str) or not 1 <= len(value) <= 255:
             raise ValueError("Name must be between 1-255 characters")
+        dirty.mark(self, 'name', value)
         self._name = value
 
     @property
@@ -27,72 +48,291 @@ class Magazine:
     def category(self, value):
         if not isinstance(value, str) or not 1 <= len(value) <= 255:
             raise ValueError("Category must be between 1-255 characters")
+        dirty.mark(self, 'category', value)
         self._category = value
 
     def save(self):
+        if self.id and not self._dirty:
+            dirty.skip(self)
+            return self
+        previous_id = self.id
         with get_connection() as conn:
-            cur = conn.cursor()
             if self.id:
-                cur.execute("UPDATE magazines SET name=?, category=? WHERE id=?", 
-                          (self.name, self.category, self.id))
+                text, params = dirty.update_statement('magazines', self, self._dirty)
+                statements.execute(conn, 'magazines.update', params, text)
             else:
-                cur.execute("INSERT INTO magazines (name, category) VALUES (?, ?)", 
-                          (self.name, self.category))
+                cur = statements.execute(conn, 'magazines.insert', (self.name, self.category))
                 self.id = cur.lastrowid
-            return self
+        router = shards.active()
+        if router and previous_id:
+            router.replicate_updates('magazines.update', [(self.name, self.category, self.id)])
+        record_write(self, previous_id)
+        self._dirty = dirty.CLEAN
+        cache.register(self)
+        return self
 
     @classmethod
-    def find_by_id(cls, id):
+    def save_many(cls, magazines, chunk_size=bulk.DEFAULT_CHUNK_SIZE):
+        return bulk.save_many(
+            cls, magazines, 'magazines.insert', 'magazines.update',
+            lambda m: (m.name, m.category),
+            chunk_size)
+
+    def upsert(self):
+        """
+        Saves this magazine by (name, category), reusing an existing row's
+        id. Needs the key from schema.create_magazine_key().
+        """
+        previous_id = self.id
         with get_connection() as conn:
-            row = conn.execute("SELECT * FROM magazines WHERE id=?", (id,)).fetchone()
-            return cls(**row) if row else None
+            self.id = statements.fetchall(conn, 'magazines.upsert', (self.name, self.category))[0]['id']
+        record_write(self, previous_id)
+        self._dirty = dirty.CLEAN
+        cache.register(self)
+        return self
+
+    @classmethod
+    def find_or_create(cls, name, category):
+        return cls(name, category).upsert()
+
+    @classmethod
+    def upsert_many(cls, magazines, chunk_size=bulk.DEFAULT_CHUNK_SIZE):
+        return bulk.upsert_many(
+            cls, magazines, 'magazines.upsert_many', lambda m: (m.name, m.category), chunk_size)
+
+    def delete(self):
+        """
+        Deletes this magazine and, through the foreign key, all its articles.
+        Returns whether the row existed; the instance becomes unsaved.
+        """
+        deleted = self.delete_many([self.id]) if self.id else 0
+        self.id = None
+        return bool(deleted)
+
+    @classmethod
+    def delete_many(cls, ids):
+        from .article import Article
+        return bulk.delete_many(cls, 'magazines', ids, cascade=(Article,))
 
-    def articles(self):
+    @classmethod
+    def delete_where(cls, **filters):
         from .article import Article
+        return bulk.delete_where(cls, 'magazines', ('id', 'name', 'category'), filters, cascade=(Article,))
+
+    @classmethod
+    def find_by_id(cls, id):
+        def load():
+            with get_connection() as conn:
+                return statements.fetchone(conn, 'magazines.find_by_id', (id,))
+        return cache.find(cls, id, load)
+
+    def articles(self, include=(), tuples=False):
+        from .article import Article, ArticleRow
+        if include and tuples:
+            raise ValueError("include cannot be combined with tuples")
+        router = shards.active()
+        if router:
+            rows = router.magazine_articles(self.id)
+        else:
+            with get_connection() as conn:
+                rows = statements.fetchall(conn, 'magazines.articles', (self.id,))
+        if tuples:
+            return [ArticleRow._make(row) for row in rows]
+        articles = [Article.from_row(row) for row in rows]
+        return Article.preload(articles, include) if include else articles
+
+    def iter_articles(self, batch_size=1000, after_id=None, limit=None, tuples=False):
+        """
+        Lazily yields this magazine's articles in id order. Pass the last seen
+        id as `after_id` to resume from there (keyset pagination).
+        """
+        from .article import Article, ArticleRow
+        hydrate = ArticleRow._make if tuples else Article.from_row
+        router = shards.active()
+        if router:
+            rows = router.iterate('magazines.iter_articles', lambda after, count: (self.id, after, count),
+                                  batch_size, after_id, limit)
+        else:
+            rows = statements.stream(
+                'magazines.iter_articles', (self.id, after_id or 0, -1 if limit is None else limit), batch_size)
+        for row in rows:
+            yield hydrate(row)
+
+    def contributors(self, tuples=False):
+        from .author import Author, AuthorRow
+        hydrate = AuthorRow._make if tuples else Author.from_row
+        router = shards.active()
+        if router:
+            return [hydrate(row) for row in router.merged('magazines.contributors', (self.id,))]
         with get_connection() as conn:
-            rows = conn.execute("SELECT * FROM articles WHERE magazine_id=?", (self.id,)).fetchall()
-            return [Article(**row) for row in rows]
+            rows = querycache.fetchall(conn, 'magazines.contributors', (self.id,))
+            return [hydrate(row) for row in rows]
 
-    def contributors(self):
-        from .author import Author
+    @classmethod
+    def contributors_for(cls, ids, tuples=False):
+        """
+        Returns {magazine_id: [Author, ...]} for many magazines in one query.
+        """
+        from .author import Author, AuthorRow
+        hydrate = (lambda row: AuthorRow._make(row[1:])) if tuples else Author.from_row
+        router = shards.active()
+        if router:
+            return router.fetch_grouped('magazines.contributors_for', ids, hydrate)
         with get_connection() as conn:
-            rows = conn.execute("""
-                SELECT DISTINCT authors.* FROM authors
-                JOIN articles ON authors.id = articles.author_id
-                WHERE articles.magazine_id=?""", (self.id,)).fetchall()
-            return [Author(**row) for row in rows]
+            return bulk.fetch_grouped(conn, 'magazines.contributors_for', ids, hydrate)
+
+    def iter_contributors(self, batch_size=1000, after_id=None, limit=None, tuples=False):
+        from .author import Author, AuthorRow
+        hydrate = AuthorRow._make if tuples else Author.from_row
+        router = shards.active()
+        if router:
+            rows = router.iterate('magazines.iter_contributors', lambda after, count: (after, self.id, count),
+                                  batch_size, after_id, limit)
+        else:
+            rows = statements.stream(
+                'magazines.iter_contributors', (after_id or 0, self.id, -1 if limit is None else limit), batch_size)
+        for row in rows:
+            yield hydrate(row)
 
     def article_titles(self):
-        return [article.title for article in self.articles()]
+        router = shards.active()
+        if router:
+            return [row['title'] for row in router.magazine_articles(self.id)]
+        with get_connection() as conn:
+            rows = statements.fetchall(conn, 'magazines.article_titles', (self.id,))
+            return [row['title'] for row in rows]
 
     def contributing_authors(self):
         from .author import Author
+        router = shards.active()
+        if router:
+            return [Author.from_row(row) for row in router.merged('magazines.contributing_authors', (self.id,))]
         with get_connection() as conn:
-            rows = conn.execute("""
-                SELECT authors.* FROM authors
-                JOIN articles ON authors.id = articles.author_id
-                WHERE articles.magazine_id=?
-                GROUP BY authors.id HAVING COUNT(articles.id) > 2
-            """, (self.id,)).fetchall()
-            return [Author(**row) for row in rows]
+            rows = querycache.fetchall(conn, 'magazines.contributing_authors', (self.id,))
+            return [Author.from_row(row) for row in rows]
+
+    @classmethod
+    def contributing_authors_for(cls, ids):
+        """
+        Returns {magazine_id: [Author, ...]} of authors with more than two
+        articles in each magazine, for many magazines in one query.
+        """
+        from .author import Author
+        router = shards.active()
+        if router:
+            return router.fetch_grouped('magazines.contributing_authors_for', ids, Author.from_row)
+        with get_connection() as conn:
+            return bulk.fetch_grouped(conn, 'magazines.contributing_authors_for', ids, Author.from_row)
+
+    def _stats(self):
+        router = shards.active()
+        if router:
+            rows = [row for rows in router.fan_out('magazines.stats', (self.id,)) for row in rows]
+        else:
+            with get_connection() as conn:
+                rows = statements.fetchall(conn, 'magazines.stats', (self.id,))
+        # Shards hold disjoint sets of authors, so both counts add up.
+        return sum(row['article_count'] for row in rows), sum(row['author_count'] for row in rows)
+
+    def article_count(self):
+        return self._stats()[0]
+
+    def author_count(self):
+        return self._stats()[1]
 
     @classmethod
     def article_counts(cls):
+        router = shards.active()
+        if router:
+            return router.article_counts()
+        with get_connection() as conn:
+            rows = querycache.fetchall(conn, 'magazines.article_counts')
+            return {row['name']: row['count'] for row in rows}
+
+    @classmethod
+    def _with_multiple_authors(cls, router):
+        # Author counts only add up across shards, so the filter runs here.
+        ids = sorted(id for id, (_, authors) in router.magazine_stats().items() if authors >= 2)
         with get_connection() as conn:
-            return {row['name']: row['count'] for row in conn.execute("""
-                SELECT magazines.name, COUNT(articles.id) as count
-                FROM magazines LEFT JOIN articles
-                ON magazines.id = articles.magazine_id
-                GROUP BY magazines.id
-            """)}
+            rows = statements.fetchall(conn, 'magazines.find_by_ids', (json.dumps(ids),))
+        return sorted(rows, key=lambda row: row['id'])
 
     @classmethod
     def find_with_multiple_authors(cls):
+        router = shards.active()
+        if router:
+            return [cls.from_row(row) for row in cls._with_multiple_authors(router)]
         with get_connection() as conn:
-            rows = conn.execute("""
-                SELECT magazines.* FROM magazines
-                JOIN articles ON magazines.id = articles.magazine_id
-                GROUP BY magazines.id
-                HAVING COUNT(DISTINCT articles.author_id) >= 2
-            """).fetchall()
-            return [cls(**row) for row in rows]
\ No newline at end of file
+            rows = querycache.fetchall(conn, 'magazines.find_with_multiple_authors')
+            return [cls.from_row(row) for row in rows]
+
+    @classmethod
+    def iter_with_multiple_authors(cls, batch_size=1000, after_id=None, limit=None):
+        router = shards.active()
+        if router:
+            rows = [row for row in cls._with_multiple_authors(router) if row['id'] > (after_id or 0)]
+            rows = rows[:limit]
+        else:
+            rows = statements.stream(
+                'magazines.iter_with_multiple_authors', (after_id or 0, -1 if limit is None else limit), batch_size)
+        for row in rows:
+            yield cls.from_row(row)
+
+    # Async facade: the same queries, run on the database thread pool.
+
+    async def asave(self):
+        return await aio.run(self.save)
+
+    async def aupsert(self):
+        return await aio.run(self.upsert)
+
+    @classmethod
+    async def afind_or_create(cls, name, category):
+        return await aio.run(cls.find_or_create, name, category)
+
+    async def adelete(self):
+        return await aio.run(self.delete)
+
+    @classmethod
+    async def adelete_many(cls, ids):
+        return await aio.run(cls.delete_many, ids)
+
+    @classmethod
+    async def afind_by_id(cls, id):
+        return await aio.run(cls.find_by_id, id)
+
+    async def aarticles(self, include=(), tuples=False):
+        return await aio.run(self.articles, include, tuples)
+
+    def aiter_articles(self, batch_size=1000):
+        return aio.iterate(
+            lambda after_id, limit: self.iter_articles(batch_size, after_id, limit), batch_size)
+
+    async def acontributors(self, tuples=False):
+        return await aio.run(self.contributors, tuples)
+
+    def aiter_contributors(self, batch_size=1000):
+        return aio.iterate(
+            lambda after_id, limit: self.iter_contributors(batch_size, after_id, limit), batch_size)
+
+    async def aarticle_titles(self):
+        return await aio.run(self.article_titles)
+
+    async def acontributing_authors(self):
+        return await aio.run(self.contributing_authors)
+
+    @classmethod
+    async def acontributors_for(cls, ids, tuples=False):
+        return await aio.run(cls.contributors_for, ids, tuples)
+
+    @classmethod
+    async def acontributing_authors_for(cls, ids):
+        return await aio.run(cls.contributing_authors_for, ids)
+
+    @classmethod
+    async def aarticle_counts(cls):
+        return await aio.run(cls.article_counts)
+
+    @classmethod
+    async def afind_with_multiple_authors(cls):
+        return await aio.run(cls.find_with_multiple_authors)
@@ -0,0 +1,27 @@
+import argparse
+import sys
+from lib.db import connection
+from lib.db.export import export, FORMATS, RANGE_SIZE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Exports articles with their author and magazine as JSONL or CSV part files.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--database', default=connection.DATABASE)
+    parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--range-size', type=int, default=RANGE_SIZE, help="article ids per part file")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, rows):
+        sys.stderr.write(f"\r{done}/{total} ranges, {rows:,} rows")
+        sys.stderr.flush()
+
+    manifest = export(args.out_dir, args.database, args.format, args.workers, args.range_size,
+                      progress=progress)
+    sys.stderr.write("\n")
+    print(f"Exported {manifest['rows']:,} articles in {len(manifest['parts'])} parts to {args.out_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
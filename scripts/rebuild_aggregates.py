@@ -0,0 +1,19 @@
+import sys
+from lib.db.schema import setup_schema, rebuild_aggregates, aggregate_drift
+
+def main():
+    setup_schema()
+
+    drift = aggregate_drift()
+    for table, key, stored, actual in drift:
+        print(f"- {table} {key}: stored {stored}, actual {actual}")
+    if '--check' in sys.argv:
+        print(f"{len(drift)} summary rows out of date")
+        return 1 if drift else 0
+
+    authors, magazines = rebuild_aggregates()
+    print(f"Rebuilt stats for {authors} authors and {magazines} magazines")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
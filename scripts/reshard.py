@@ -0,0 +1,29 @@
+import argparse
+import sys
+from lib.db import connection
+from lib.db.shards import configure_shards
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Moves articles onto the given shard files while the database stays in use.")
+    parser.add_argument('shards', nargs='+', help="shard database files; pass the catalog itself to unshard")
+    parser.add_argument('--database', default=connection.DATABASE, help="the catalog database")
+    args = parser.parse_args(argv)
+
+    connection.configure_pool(database=args.database)
+    router = configure_shards()
+
+    def progress(done, total, moved):
+        sys.stderr.write(f"\r{done}/{total} buckets, {moved:,} articles moved")
+        sys.stderr.flush()
+
+    moved = router.reshard(args.shards, progress)
+    sys.stderr.write("\n")
+    for shard in router.shards.values():
+        print(f"shard {shard.id}: {shard.path}")
+    print(f"Moved {moved:,} articles")
+    configure_shards(False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,8 @@
-from lib.db.connection import get_connection
+from lib.db.schema import setup_schema
 
 def setup_database():
-    with get_connection() as conn:
-        with open('lib/db/schema.sql') as f:
-            conn.executescript(f.read())
-        conn.commit()
+    setup_schema()
 
 if __name__ == "__main__":
     setup_database()
-    print("Database tables created")
\ No newline at end of file
+    print("Database tables created")
@@ -0,0 +1,19 @@
+import pytest
+from lib.db import connection
+from lib.db.schema import setup_schema
+
+@pytest.fixture(scope="session", autouse=True)
+def setup_database_file_and_schema():
+    """
+    Points the connection pool at a shared in-memory database for the
+    entire test session, so no test touches articles.db on disk.
+    """
+    previous = connection.DATABASE
+    connection.configure_pool(database=connection.MEMORY_DATABASE)
+
+    setup_schema()
+
+    yield
+
+    connection.configure_pool(database=previous)
+    connection.close_pool()
@@ -0,0 +1,93 @@
+import asyncio
+import time
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db import aio
+from lib.db.connection import get_connection, get_pool
+from lib.db.schema import setup_schema
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+def test_async_queries():
+    author = Author("Async Author").save()
+    magazine = Magazine("Async Mag", "Async").save()
+    Article.save_many([Article(f"Async {i}", author.id, magazine.id) for i in range(5)])
+
+    async def scenario():
+        found, articles, most = await asyncio.gather(
+            Author.afind_by_id(author.id),
+            magazine.aarticles(),
+            Author.amost_published(),
+        )
+        streamed = [a.title async for a in magazine.aiter_articles(batch_size=2)]
+        return found, articles, most, streamed
+
+    found, articles, most, streamed = asyncio.run(scenario())
+    assert found.name == "Async Author"
+    assert len(articles) == 5
+    assert most.id == author.id
+    assert streamed == [f"Async {i}" for i in range(5)]
+
+def test_async_save():
+    async def scenario():
+        author = await Author("Saved Async").asave()
+        return await Author.afind_by_name("Saved Async"), author
+
+    found, author = asyncio.run(scenario())
+    assert found.id == author.id
+
+def test_concurrency_limit():
+    executor = aio.configure_executor(max_workers=4, max_concurrency=2)
+    active = []
+    peak = []
+
+    def work():
+        active.append(1)
+        peak.append(len(active))
+        with get_connection() as conn:
+            conn.execute("SELECT 1").fetchone()
+        time.sleep(0.02)
+        active.pop()
+
+    async def scenario():
+        await asyncio.gather(*(executor.run(work) for _ in range(8)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        aio.configure_executor()
+    assert max(peak) <= 2
+
+def test_cancellation_interrupts_query():
+    slow = """
+        WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n)
+        SELECT COUNT(*) FROM n"""
+
+    def run_forever():
+        with get_connection() as conn:
+            return conn.execute(slow).fetchone()
+
+    async def scenario():
+        task = asyncio.create_task(aio.run(run_forever))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    deadline = time.monotonic() + 2
+    while get_pool().stats()['idle'] < get_pool().stats()['open']:
+        assert time.monotonic() < deadline, "interrupted query never released its connection"
+        time.sleep(0.01)
+    assert asyncio.run(aio.run(lambda: 42)) == 42
@@ -0,0 +1,100 @@
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db import changes
+from lib.db.changes import ChangeFeed, compact
+from lib.db.connection import get_connection
+from lib.db.generate import generate
+from lib.db.schema import setup_schema
+
+np = pytest.importorskip("numpy")
+from lib.db.analytics import Snapshot
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.execute("DELETE FROM change_cursors")
+        conn.commit()
+    yield
+
+def sql_author_counts():
+    with get_connection() as conn:
+        return dict(conn.execute("SELECT author_id, COUNT(*) FROM articles GROUP BY author_id").fetchall())
+
+def test_snapshot_matches_model_queries():
+    generate(40, 8, 600, seed=2)
+    snapshot = Snapshot.load()
+    assert len(snapshot) == 600
+
+    counts = sql_author_counts()
+    top = snapshot.top_authors(5)
+    assert [count for _, count in top] == sorted(counts.values(), reverse=True)[:5]
+    assert all(counts[id] == count for id, count in top)
+    assert top[0][0] == Author.most_published().id
+
+    for author_id in list(counts)[:10]:
+        assert set(snapshot.topic_areas(author_id)) == set(Author.find_by_id(author_id).topic_areas())
+    assert sorted(snapshot.magazines_with_authors(2)) == sorted(
+        m.id for m in Magazine.find_with_multiple_authors())
+    assert sum(snapshot.category_counts().values()) == 600
+
+def test_refresh_loads_only_new_articles():
+    author = Author("Snap").save()
+    tech, art = Magazine.save_many([Magazine("Snap Tech", "Tech"), Magazine("Snap Art", "Art")])
+    Article.save_many([Article(f"T{i}", author.id, tech.id) for i in range(3)])
+    snapshot = Snapshot.load()
+    assert snapshot.topic_areas(author.id) == {"Tech": 3}
+
+    other = Author("Late").save()
+    Article("A1", other.id, art.id).save()
+    assert snapshot.refresh() == 1
+    assert snapshot.topic_areas(other.id) == {"Art": 1}
+    assert snapshot.magazines_with_authors(1) == sorted([tech.id, art.id])
+    assert snapshot.refresh() == 0
+
+def test_refresh_reloads_after_deletes():
+    author = Author("Snap").save()
+    magazine = Magazine("Snap Mag", "Tech").save()
+    articles = Article.save_many([Article(f"T{i}", author.id, magazine.id) for i in range(3)])
+    snapshot = Snapshot.load()
+
+    articles[0].delete()
+    Article("New", author.id, magazine.id).save()
+    snapshot.refresh()
+    assert len(snapshot) == 3
+    assert snapshot.top_authors(1) == [(author.id, 3)]
+
+def test_refresh_sees_deletes_during_bulk_loads():
+    generate(5, 1, 50, seed=3)
+    snapshot = Snapshot.load()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles WHERE id = (SELECT MIN(id) FROM articles)")
+    generate(5, 1, 30, seed=4)
+    snapshot.refresh()
+    assert len(snapshot) == 79
+    assert snapshot.author_counts().sum() == 79
+
+def test_refresh_reloads_when_the_log_was_compacted():
+    author = Author("Snap").save()
+    magazine = Magazine("Snap Mag", "Tech").save()
+    article = Article("Gone", author.id, magazine.id).save()
+    snapshot = Snapshot.load()
+    article.delete()
+    feed = ChangeFeed('analytics', from_start=True)
+    feed.ack(changes.latest_seq())
+    compact()
+    feed.unsubscribe()
+    assert snapshot.refresh() == 0
+    assert len(snapshot) == 0
+
+def test_empty_snapshot():
+    snapshot = Snapshot.load()
+    assert snapshot.top_authors() == []
+    assert snapshot.magazines_with_authors() == []
+    assert snapshot.topic_areas(1) == {}
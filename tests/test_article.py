@@ -1,7 +1,10 @@
+import sqlite3
+import tracemalloc
 import pytest
 from lib.models.author import Author
 from lib.models.magazine import Magazine
 from lib.models.article import Article
+from lib.db import dirty
 from lib.db.connection import get_connection
 from lib.db.schema import setup_schema
 
@@ -65,4 +68,137 @@ def test_save_update():
     
     found = Article.find_by_id(article.id)
     assert found.title == "Updated Title"
-    assert updated_article.title == "Updated Title"
\ No newline at end of file
+    assert updated_article.title == "Updated Title"
+
+def test_save_many_assigns_ids():
+    author = Author("Bulk Author").save()
+    magazine = Magazine("Bulk Mag", "Bulk").save()
+    articles = [Article(f"Bulk {i}", author.id, magazine.id) for i in range(25)]
+
+    saved = Article.save_many(articles, chunk_size=10)
+
+    assert saved == articles
+    assert len({a.id for a in articles}) == 25
+    for article in articles:
+        assert Article.find_by_id(article.id).title == article.title
+
+def test_save_many_updates_existing():
+    author = Author("Bulk Author").save()
+    magazine = Magazine("Bulk Mag", "Bulk").save()
+    existing = Article("Before", author.id, magazine.id).save()
+    existing.title = "After"
+
+    Article.save_many([existing, Article("New", author.id, magazine.id)])
+
+    assert Article.find_by_id(existing.id).title == "After"
+    assert len(magazine.articles()) == 2
+
+def test_save_many_is_atomic():
+    author = Author("Bulk Author").save()
+    magazine = Magazine("Bulk Mag", "Bulk").save()
+
+    kept = Article("Kept?", author.id, magazine.id)
+    with pytest.raises(TypeError):
+        Article.save_many([kept, "not an article"], chunk_size=1)
+    assert magazine.articles() == []
+    assert kept.id is None
+
+def test_save_many_unassigns_ids_on_rollback():
+    author = Author("Bulk Author").save()
+    magazine = Magazine("Bulk Mag", "Bulk").save()
+    first = Article("First", author.id, magazine.id)
+    orphan = Article("Orphan", author.id, 999_999)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        Article.save_many([first, orphan], chunk_size=1)
+    assert first.id is None and orphan.id is None
+    first.save()
+    assert Article.find_by_id(first.id).title == "First"
+
+def test_articles_use_slots(sample_article):
+    assert not hasattr(sample_article, '__dict__')
+    with pytest.raises(AttributeError):
+        sample_article.subtitle = "nope"
+
+def test_from_row_skips_validation():
+    article = Article.from_row({'id': 7, 'title': "", 'author_id': 1, 'magazine_id': 2})
+    assert article.id == 7
+    assert article.title == ""
+    assert article.author_id == 1
+
+def test_hydrated_articles_share_the_clean_dirty_set():
+    # A set per instance tripled the memory of from_row() (bench_hydration).
+    rows = [{'id': i, 'title': "T", 'author_id': 1, 'magazine_id': 2} for i in range(1, 1001)]
+    tracemalloc.start()
+    try:
+        articles = [Article.from_row(row) for row in rows]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert all(article._dirty is dirty.CLEAN for article in articles)
+    assert size / len(rows) < 128
+
+    articles[0].title = "Changed"
+    assert articles[0]._dirty == {'title'}
+    assert articles[1]._dirty is dirty.CLEAN
+
+def test_save_writes_only_changed_columns(sample_article):
+    statements = []
+    with get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            sample_article.title = "Retitled"
+            sample_article.save()
+        finally:
+            conn.set_trace_callback(None)
+    # Triggers re-report the statement that fired them, hence the set.
+    updates = list({s for s in statements if s.lstrip().startswith('UPDATE')})
+    assert len(updates) == 1
+    assert 'title=' in updates[0]
+    assert 'author_id' not in updates[0]
+    assert Article.find_by_id(sample_article.id).title == "Retitled"
+
+def test_save_skips_unchanged(sample_article):
+    before = dirty.skipped_writes().get('Article', 0)
+    found = Article.find_by_id(sample_article.id)
+    found.title = found.title
+    found.save()
+    sample_article.save()
+    assert dirty.skipped_writes()['Article'] == before + 2
+
+def test_search_ranks_and_highlights():
+    author = Author("Searcher").save()
+    other = Author("Other Searcher").save()
+    magazine = Magazine("Search Mag", "Search").save()
+    Article.save_many([
+        Article("Python tips for data pipelines", author.id, magazine.id),
+        Article("Python, python everywhere", author.id, magazine.id),
+        Article("Gardening in winter", author.id, magazine.id),
+        Article("Pythonic idioms", other.id, magazine.id),
+    ])
+
+    hits = Article.search("python")
+    assert [h.article.title for h in hits][:1] == ["Python, python everywhere"]
+    assert len(hits) == 3
+    assert "[Python]" in hits[0].snippet
+
+    assert [h.article.title for h in Article.search("python", author_id=other.id)] == ["Pythonic idioms"]
+    assert len(Article.search("python", prefix=False)) == 2
+    assert Article.search("garden", limit=1)[0].article.title == "Gardening in winter"
+
+def test_search_index_follows_updates(sample_article):
+    sample_article.title = "Renamed Headline"
+    sample_article.save()
+    assert Article.search("Test", prefix=False) == []
+    assert Article.search("headline")[0].article.id == sample_article.id
+
+def test_search_rejects_empty_query():
+    with pytest.raises(ValueError):
+        Article.search('  "" ')
+
+def test_delete_many_removes_rows_and_search_entries(sample_article):
+    other = Article("Another headline", sample_article.author_id, sample_article.magazine_id).save()
+    assert Article.delete_many([sample_article.id, other.id, 10**9]) == 2
+    assert Article.find_by_id(other.id) is None
+    assert Article.search("headline") == []
+    assert Article.delete_where(author_id=sample_article.author_id) == 0
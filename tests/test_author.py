@@ -1,7 +1,9 @@
+import sqlite3
 import pytest
 from lib.models.author import Author
-from lib.models.magazine import Magazine
+from lib.models.magazine import Magazine, MagazineRow
 from lib.models.article import Article
+from lib.db import dirty, statements
 from lib.db.connection import get_connection
 from lib.db.schema import setup_schema 
 
@@ -121,4 +123,110 @@ def test_most_published():
     with get_connection() as conn:
         conn.execute("DELETE FROM articles")
         conn.commit()
-    assert Author.most_published() is None
\ No newline at end of file
+    assert Author.most_published() is None
+
+def test_save_many():
+    authors = Author.save_many([Author("Bulk One"), Author("Bulk Two")])
+    assert [a.name for a in authors] == ["Bulk One", "Bulk Two"]
+    assert Author.find_by_name("Bulk Two").id == authors[1].id
+
+def test_articles_include_magazine(sample_author):
+    magazine = Magazine("Eager Mag", "Eager").save()
+    sample_author.add_article(magazine, "Carrie")
+    articles = sample_author.articles(include=['magazine'])
+    assert articles[0]._magazine is not None
+    assert articles[0].magazine().name == "Eager Mag"
+
+def test_iter_articles(sample_author):
+    magazine = Magazine("Stream Mag", "Stream").save()
+    for title in ["Misery", "Cujo", "Firestarter"]:
+        sample_author.add_article(magazine, title)
+    titles = [a.title for a in sample_author.iter_articles(batch_size=2)]
+    assert titles == ["Misery", "Cujo", "Firestarter"]
+
+def test_save_many_skips_clean_instances(sample_author):
+    before = dirty.skipped_writes()['total']
+    other = Author("Renamed Soon").save()
+    other.name = "Renamed"
+    Author.save_many([sample_author, other])
+    assert dirty.skipped_writes()['total'] == before + 1
+    assert Author.find_by_id(other.id).name == "Renamed"
+
+def test_batch_relationships_match_single_queries():
+    authors = Author.save_many([Author(f"Batch {i}") for i in range(3)])
+    tech, science = Magazine.save_many([Magazine("Batch Tech", "Technology"),
+                                        Magazine("Batch Science", "Science")])
+    Article.save_many([
+        Article("B1", authors[0].id, tech.id),
+        Article("B2", authors[0].id, tech.id),
+        Article("B3", authors[0].id, science.id),
+        Article("B4", authors[1].id, science.id),
+    ])
+    ids = [a.id for a in authors]
+
+    statements.reset_stats()
+    magazines = Author.magazines_for(ids)
+    topics = Author.topic_areas_for(ids)
+    counts = Author.article_counts_for(ids)
+    assert sum(s['calls'] for s in statements.stats().values()) == 3
+
+    for author in authors:
+        assert sorted(m.id for m in magazines[author.id]) == sorted(m.id for m in author.magazines())
+        assert sorted(topics[author.id]) == sorted(author.topic_areas())
+        assert counts[author.id] == author.article_count()
+    assert magazines[authors[2].id] == [] and counts[authors[2].id] == 0
+    assert sorted(Author.magazines_for(ids[:1], tuples=True)[ids[0]]) == [
+        MagazineRow(tech.id, "Batch Tech", "Technology"),
+        MagazineRow(science.id, "Batch Science", "Science"),
+    ]
+    assert Author.topic_areas_for([]) == {}
+
+def test_delete_cascades_to_articles(sample_author):
+    magazine = Magazine("Spam Weekly", "Spam").save()
+    Article.save_many([Article(f"Spam {i}", sample_author.id, magazine.id) for i in range(5)])
+    other = Author("Keeper").save()
+    kept = other.add_article(magazine, "Kept")
+
+    author_id = sample_author.id
+    assert sample_author.delete() is True
+    assert sample_author.id is None
+    assert Author.find_by_id(author_id) is None
+    assert [a.id for a in magazine.articles()] == [kept.id]
+    assert magazine.article_count() == 1
+    assert Author.delete_many([author_id]) == 0
+
+    with pytest.raises(sqlite3.IntegrityError):
+        Article("Orphan", author_id, magazine.id).save()
+
+def test_delete_where_requires_known_filters():
+    Author.save_many([Author("Gone"), Author("Stays")])
+    with pytest.raises(ValueError):
+        Author.delete_where()
+    with pytest.raises(ValueError, match="Unknown column"):
+        Author.delete_where(email="x")
+    assert Author.delete_where(name="Gone") == 1
+    assert Author.find_by_name("Gone") is None
+    assert Author.find_by_name("Stays") is not None
+
+def test_upsert_reuses_existing_row(sample_author):
+    again = Author("Stephen King").upsert()
+    assert again.id == sample_author.id
+    assert Author.find_or_create("Stephen King").id == sample_author.id
+    created = Author.find_or_create("Octavia Butler")
+    assert created.id and created.id != sample_author.id
+    assert Author.find_by_name("Octavia Butler").id == created.id
+
+def test_upsert_many_is_one_statement_per_chunk(sample_author):
+    statements.reset_stats()
+    authors = Author.upsert_many([Author("New A"), Author("Stephen King"), Author("New A"), Author("New B")])
+    assert statements.stats()['authors.upsert_many']['calls'] == 1
+    assert authors[1].id == sample_author.id
+    assert authors[0].id == authors[2].id
+    assert len({a.id for a in authors}) == 3
+
+    with get_connection() as conn:
+        before = conn.execute("SELECT version FROM table_versions WHERE name='authors'").fetchone()[0]
+        Author.upsert_many([Author("New A"), Author("New B")], chunk_size=1)
+        after = conn.execute("SELECT version FROM table_versions WHERE name='authors'").fetchone()[0]
+        assert conn.execute("SELECT COUNT(*) FROM authors").fetchone()[0] == 3
+    assert after == before
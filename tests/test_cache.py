@@ -0,0 +1,95 @@
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db import cache
+from lib.db.cache import LRUCache, identity_map
+from lib.db.connection import get_connection
+from lib.db.schema import setup_schema
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+@pytest.fixture
+def row_cache():
+    previous = cache._rows
+    yield cache.configure_cache(maxsize=10)
+    cache._rows = previous
+
+def count_selects(call):
+    statements = []
+    with get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            result = call()
+        finally:
+            conn.set_trace_callback(None)
+    return result, sum(s.lstrip().upper().startswith('SELECT') for s in statements)
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.stats()['evictions'] == 1
+
+def test_lru_ttl_expires_entries():
+    now = [0.0]
+    lru = LRUCache(maxsize=2, ttl=5, clock=lambda: now[0])
+    lru.set('a', 1)
+    now[0] = 4.9
+    assert lru.get('a') == 1
+    now[0] = 5.1
+    assert lru.get('a') is None
+
+def test_identity_map_returns_same_object():
+    author = Author("Mapped").save()
+    with identity_map():
+        first = Author.find_by_id(author.id)
+        second, selects = count_selects(lambda: Author.find_by_id(author.id))
+        assert second is first
+        assert selects == 0
+    assert Author.find_by_id(author.id) is not first
+
+def test_row_cache_avoids_queries(row_cache):
+    author = Author("Cached").save()
+    magazine = Magazine("Cached Mag", "Cache").save()
+    article = Article("Cached Article", author.id, magazine.id).save()
+
+    article.author()
+    found, selects = count_selects(article.author)
+    assert found.name == "Cached"
+    assert selects == 0
+    assert row_cache.stats()['hits'] >= 1
+
+def test_save_invalidates_cached_row(row_cache):
+    author = Author("Before").save()
+    Author.find_by_id(author.id)
+    author.name = "After"
+    author.save()
+    assert Author.find_by_id(author.id).name == "After"
+
+def test_delete_invalidates_cached_rows(row_cache):
+    author = Author("Cached").save()
+    magazine = Magazine("Cached Mag", "C").save()
+    article = author.add_article(magazine, "Cached article")
+    assert Author.find_by_id(author.id) is not None
+    assert Article.find_by_id(article.id) is not None
+
+    with identity_map():
+        Article.find_by_id(article.id)
+        author.delete()
+        assert Article.find_by_id(article.id) is None
+    assert Author.find_by_id(author.id) is None
+    assert row_cache.stats()['size'] == 0
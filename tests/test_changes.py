@@ -0,0 +1,114 @@
+import pytest
+from lib.db import changes
+from lib.db.changes import Change, ChangeFeed, collapse, compact
+from lib.db.connection import get_connection, transaction
+from lib.db.generate import generate
+from lib.db.schema import setup_schema
+from lib.models.article import Article
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.execute("DELETE FROM change_cursors")
+        conn.execute("DELETE FROM changes")
+        conn.commit()
+    yield
+
+def test_writes_are_logged_in_order():
+    feed = ChangeFeed('search')
+    start = feed.position
+    author = Author("Alice").save()
+    magazine = Magazine("Tech Today", "Technology").save()
+    article = Article("First", author.id, magazine.id).save()
+    article.title = "First, revised"
+    article.save()
+    author.save()  # nothing changed: no update is logged
+    author_id = author.id
+    author.delete()
+
+    entries = feed.read()
+    assert [entry.seq for entry in entries] == list(range(start + 1, start + 7))
+    assert [entry[1:4] for entry in entries] == [
+        ('authors', author_id, 'insert'),
+        ('magazines', magazine.id, 'insert'),
+        ('articles', article.id, 'insert'),
+        ('articles', article.id, 'update'),
+        ('articles', article.id, 'delete'),
+        ('authors', author_id, 'delete'),
+    ]
+
+def test_rolled_back_writes_are_not_logged():
+    feed = ChangeFeed('cache')
+    with pytest.raises(RuntimeError):
+        with transaction():
+            Author("Ghost").save()
+            raise RuntimeError
+    assert feed.read() == []
+    assert feed.lag() == 0
+
+def test_batches_resume_from_the_stored_cursor():
+    feed = ChangeFeed('index', batch_size=4)
+    Author.save_many([Author(f"Author {i}") for i in range(10)])
+
+    seen = []
+    for batch in feed.batches():
+        seen.extend(batch)
+        if len(seen) == 8:
+            break
+    # The interrupted batch was not acknowledged, so it comes back.
+    resumed = ChangeFeed('index', batch_size=4)
+    assert resumed.position == seen[3].seq
+    again = [change for batch in resumed.batches() for change in batch]
+    assert [change.seq for change in again] == [change.seq for change in seen[4:]] + \
+        [seen[-1].seq + 1, seen[-1].seq + 2]
+    assert resumed.lag() == 0
+
+def test_new_consumers_start_at_the_newest_change():
+    Author("Before").save()
+    assert ChangeFeed('late').read() == []
+    assert [change.op for change in ChangeFeed('replay', from_start=True).read()] == ['insert']
+
+def test_bulk_loads_are_logged():
+    feed = ChangeFeed('bulk')
+    generate(5, 2, 30, seed=1)
+    logged = [change for batch in feed.batches() for change in batch]
+    with get_connection() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM articles ORDER BY id")]
+    assert [change.row_id for change in logged if change.table == 'articles'] == ids
+    assert sum(change.table == 'authors' for change in logged) == 5
+
+def test_compact_keeps_what_a_consumer_still_needs():
+    fast = ChangeFeed('fast')
+    slow = ChangeFeed('slow')
+    Author.save_many([Author(f"Author {i}") for i in range(6)])
+    for _ in fast.batches():
+        pass
+    slow.ack(slow.read(2)[-1].seq)
+
+    assert compact(batch_size=1) == 2
+    assert len(slow.read()) == 4
+    assert changes.consumers() == {'fast': fast.position, 'slow': slow.position}
+
+    slow.unsubscribe()
+    assert compact() == 4
+    assert changes.latest_seq() == fast.position
+    with pytest.raises(LookupError):
+        slow.position
+
+def test_collapse_keeps_the_net_effect():
+    log = [
+        Change(1, 'authors', 1, 'insert'),
+        Change(2, 'authors', 1, 'update'),
+        Change(3, 'articles', 7, 'insert'),
+        Change(4, 'articles', 7, 'delete'),
+        Change(5, 'authors', 2, 'update'),
+        Change(6, 'authors', 2, 'delete'),
+    ]
+    assert collapse(log) == {('authors', 1): 'insert', ('authors', 2): 'delete'}
@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+import pytest
+from lib.db.connection import (
+    ConnectionPool, PoolTimeout, get_connection, get_pool, read_only_uri, resolve_pragmas,
+)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=0.1)
+    yield pool
+    pool.close()
+
+
+def test_pool_reuses_connections(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['open'] == 1
+
+
+def test_pool_is_bounded(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['waits'] == 1
+
+
+def test_pool_release_wakes_waiter(pool):
+    first = pool.acquire()
+    pool.acquire()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.acquire()))
+    waiter.start()
+    pool.release(first)
+    waiter.join()
+    assert result == [first]
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_close_closes_connections(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.close()
+    assert pool.stats()['open'] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_nested_get_connection_reuses_checkout():
+    with get_connection() as outer:
+        with get_connection() as inner:
+            assert inner is outer
+    with get_connection() as again:
+        assert again is outer
+    assert get_pool().stats()['hits'] >= 1
+
+
+def test_pragma_profile_applied(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'wal.db'), pragmas=resolve_pragmas('concurrent', {'busy_timeout': 1234}))
+    conn = pool.acquire()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    finally:
+        pool.release(conn)
+        pool.close()
+
+
+def test_resolve_pragmas_rejects_unknown():
+    with pytest.raises(ValueError, match="Unknown PRAGMA profile"):
+        resolve_pragmas('turbo')
+    with pytest.raises(ValueError, match="Unsupported PRAGMA"):
+        resolve_pragmas('default', {'writable_schema': 1})
+    with pytest.raises(ValueError, match="Invalid value"):
+        resolve_pragmas('default', {'synchronous': 'OFF; DROP TABLE authors'})
+
+
+def test_pragmas_from_environment(monkeypatch):
+    monkeypatch.setenv('ARTICLES_DB_PRAGMAS', 'busy_timeout=10,synchronous=FULL')
+    pragmas = resolve_pragmas('concurrent')
+    assert pragmas['busy_timeout'] == '10'
+    assert pragmas['synchronous'] == 'FULL'
+    assert pragmas['journal_mode'] == 'WAL'
+
+
+def test_concurrent_profile_stress(tmp_path):
+    from benchmarks.bench_concurrency import run_stress
+    totals = run_stress(str(tmp_path / 'stress.db'), 'concurrent', writers=2, readers=2, seconds=0.5)
+    assert totals['errors'] == 0
+    assert totals['writes'] > 0
+    assert totals['reads'] > 0
+
+
+def test_read_only_uri(tmp_path):
+    path = str(tmp_path / 'replica.db')
+    writer = ConnectionPool(path, size=1)
+    conn = writer.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    writer.release(conn)
+
+    replica = ConnectionPool(read_only_uri(path), size=1)
+    conn = replica.acquire()
+    try:
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("INSERT INTO t VALUES (2)")
+    finally:
+        replica.release(conn)
+        replica.close()
+        writer.close()
+
+
+def test_shared_memory_database():
+    pool = ConnectionPool('file:shared_test?mode=memory&cache=shared', size=2)
+    first, second = pool.acquire(), pool.acquire()
+    try:
+        first.execute("CREATE TABLE t (x INTEGER)")
+        first.execute("INSERT INTO t VALUES (1)")
+        first.commit()
+        assert second.execute("SELECT x FROM t").fetchone()[0] == 1
+    finally:
+        pool.release(first)
+        pool.release(second)
+        pool.close()
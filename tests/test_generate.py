@@ -0,0 +1,88 @@
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db.connection import get_connection
+from lib.db.generate import Generator, generate, zipf_weights
+from lib.db.schema import setup_schema, aggregate_drift
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+def table_rows(table):
+    with get_connection() as conn:
+        return [tuple(row) for row in conn.execute(f"SELECT * FROM {table} ORDER BY id")]
+
+def triggers():
+    with get_connection() as conn:
+        return sorted(row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name='articles'"))
+
+def test_same_seed_produces_same_rows():
+    first = Generator(20, 5, 200, seed=7)
+    second = Generator(20, 5, 200, seed=7)
+    ids = range(1, 21), range(1, 6)
+    assert list(first.magazine_rows()) == list(second.magazine_rows())
+    assert list(first.article_rows(*ids)) == list(second.article_rows(*ids))
+    assert list(first.article_rows(*ids)) != list(Generator(20, 5, 200, seed=8).article_rows(*ids))
+
+def test_zipf_skews_articles_towards_few_authors():
+    rows = list(Generator(100, 10, 5000, seed=1).article_rows(range(1, 101), range(1, 11)))
+    counts = sorted((sum(1 for row in rows if row[1] == id) for id in range(1, 101)), reverse=True)
+    assert counts[0] > 10 * counts[-1]
+    assert zipf_weights(3, exponent=0) == [1, 2, 3]
+
+def test_articles_need_authors_and_magazines():
+    with pytest.raises(ValueError):
+        Generator(0, 1, 10)
+
+@pytest.mark.parametrize("defer_maintenance", [True, False])
+def test_generate_keeps_summaries_and_search_consistent(defer_maintenance):
+    before = triggers()
+    reports = []
+    counts = generate(30, 6, 500, seed=3, batch_size=128, defer_maintenance=defer_maintenance,
+                      progress=lambda *report: reports.append(report))
+
+    assert counts == {'authors': 30, 'magazines': 6, 'articles': 500}
+    assert len(table_rows('articles')) == 500
+    assert triggers() == before
+    assert aggregate_drift() == []
+    assert reports[-1] == ('articles', 500, 500)
+    assert [r[1] for r in reports if r[0] == 'articles'] == [0, 128, 256, 384, 500]
+
+    title = table_rows('articles')[0][1]
+    assert Article.search(title.split()[0])
+
+def test_generate_appends_to_existing_rows():
+    author = Author("Existing").save()
+    magazine = Magazine("Existing Mag", "Existing").save()
+    Article("Kept", author.id, magazine.id).save()
+
+    generate(10, 3, 100, seed=5)
+
+    articles = table_rows('articles')
+    author_ids = {row[0] for row in table_rows('authors')}
+    magazine_ids = {row[0] for row in table_rows('magazines')}
+    assert len(articles) == 101
+    assert all(row[2] in author_ids and row[3] in magazine_ids for row in articles)
+    assert not any(row[2] == author.id for row in articles[1:])
+    assert aggregate_drift() == []
+
+def test_generate_runs_repeatedly():
+    generate(10, 3, 50, seed=5)
+    generate(10, 3, 50, seed=5)
+
+    authors = table_rows('authors')
+    magazines = table_rows('magazines')
+    assert len(authors) == len({row[1] for row in authors}) == 20
+    assert len({row[1] for row in magazines}) == 6
+    assert len(table_rows('articles')) == 100
+    assert aggregate_drift() == []
@@ -1,9 +1,10 @@
+import sqlite3
 import pytest
-from lib.models.author import Author
+from lib.models.author import Author, AuthorRow
 from lib.models.magazine import Magazine
-from lib.models.article import Article
+from lib.models.article import Article, ArticleRow
 from lib.db.connection import get_connection
-from lib.db.schema import setup_schema
+from lib.db.schema import setup_schema, create_magazine_key
 
 @pytest.fixture(autouse=True)
 def setup_db():
@@ -150,4 +151,129 @@ def test_find_with_multiple_authors():
     assert "Magazine A" in magazine_names
     assert "Magazine B" in magazine_names
     assert "Magazine C" not in magazine_names
-    assert all(isinstance(m, Magazine) for m in magazines)
\ No newline at end of file
+    assert all(isinstance(m, Magazine) for m in magazines)
+
+def test_save_many():
+    magazines = Magazine.save_many([Magazine("Bulk A", "Cat"), Magazine("Bulk B", "Cat")])
+    assert all(m.id for m in magazines)
+    assert Magazine.find_by_id(magazines[0].id).name == "Bulk A"
+
+def test_articles_include_author(sample_magazine):
+    authors = Author.save_many([Author(f"Eager {i}") for i in range(5)])
+    Article.save_many([Article(f"Eager {i}", a.id, sample_magazine.id)
+                       for i, a in enumerate(authors * 3)])
+
+    statements = []
+    with get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            articles = sample_magazine.articles(include=['author', 'magazine'])
+            names = {a.title: a.author().name for a in articles}
+            magazines = {a.magazine().id for a in articles}
+        finally:
+            conn.set_trace_callback(None)
+
+    assert len(articles) == 15
+    assert names["Eager 7"] == "Eager 2"
+    assert magazines == {sample_magazine.id}
+    assert sum(s.lstrip().startswith('SELECT') for s in statements) == 3
+
+def test_articles_include_rejects_unknown_relation(sample_magazine):
+    with pytest.raises(ValueError, match="Unknown relation"):
+        sample_magazine.articles(include=['publisher'])
+
+def test_iter_articles_keyset(sample_magazine):
+    author = Author("Streamer").save()
+    articles = Article.save_many([Article(f"Stream {i}", author.id, sample_magazine.id) for i in range(7)])
+
+    streamed = sample_magazine.iter_articles(batch_size=2)
+    assert [a.id for a in streamed] == [a.id for a in articles]
+
+    page = list(sample_magazine.iter_articles(after_id=articles[2].id, limit=3))
+    assert [a.title for a in page] == ["Stream 3", "Stream 4", "Stream 5"]
+
+def test_iter_contributors(sample_magazine):
+    authors = Author.save_many([Author("Iter A"), Author("Iter B"), Author("Iter C")])
+    Article.save_many([Article("One", a.id, sample_magazine.id) for a in authors + authors])
+
+    contributors = list(sample_magazine.iter_contributors(batch_size=1))
+    assert [c.id for c in contributors] == [a.id for a in authors]
+    assert [c.name for c in sample_magazine.iter_contributors(after_id=authors[0].id, limit=1)] == ["Iter B"]
+
+def test_iter_with_multiple_authors():
+    single, multi = Magazine.save_many([Magazine("Solo", "A"), Magazine("Group", "B")])
+    a1, a2 = Author.save_many([Author("Iter 1"), Author("Iter 2")])
+    Article.save_many([
+        Article("S1", a1.id, single.id),
+        Article("S2", a1.id, single.id),
+        Article("G1", a1.id, multi.id),
+        Article("G2", a2.id, multi.id),
+    ])
+    assert [m.name for m in Magazine.iter_with_multiple_authors()] == ["Group"]
+
+def test_tuple_results(sample_magazine):
+    author = Author("Tuple Author").save()
+    article = Article("Tuple Article", author.id, sample_magazine.id).save()
+
+    rows = sample_magazine.articles(tuples=True)
+    assert rows == [ArticleRow(article.id, "Tuple Article", author.id, sample_magazine.id)]
+    assert list(sample_magazine.iter_articles(tuples=True)) == rows
+    assert sample_magazine.contributors(tuples=True) == [AuthorRow(author.id, "Tuple Author")]
+    with pytest.raises(ValueError):
+        sample_magazine.articles(include=['author'], tuples=True)
+
+def test_batch_relationships_match_single_queries():
+    magazines = Magazine.save_many([Magazine(f"Batch {i}", "Batch") for i in range(3)])
+    alice, bob = Author.save_many([Author("Batch Alice"), Author("Batch Bob")])
+    Article.save_many([Article(f"A{i}", alice.id, magazines[0].id) for i in range(3)] + [
+        Article("B1", bob.id, magazines[0].id),
+        Article("B2", bob.id, magazines[1].id),
+    ])
+    ids = [m.id for m in magazines]
+
+    contributors = Magazine.contributors_for(ids)
+    contributing = Magazine.contributing_authors_for(ids)
+    for magazine in magazines:
+        assert sorted(a.id for a in contributors[magazine.id]) == sorted(
+            a.id for a in magazine.contributors())
+        assert [a.id for a in contributing[magazine.id]] == [
+            a.id for a in magazine.contributing_authors()]
+    assert contributors[magazines[2].id] == []
+    assert Magazine.contributors_for([magazines[1].id], tuples=True) == {
+        magazines[1].id: [AuthorRow(bob.id, "Batch Bob")]}
+
+def test_delete_where_purges_category():
+    spam1, spam2, kept = Magazine.save_many([
+        Magazine("Spam 1", "Spam"), Magazine("Spam 2", "Spam"), Magazine("Real", "News")])
+    author = Author("Writer").save()
+    Article.save_many([Article("S", author.id, spam1.id), Article("R", author.id, kept.id)])
+
+    assert Magazine.delete_where(category="Spam") == 2
+    assert Magazine.find_by_id(spam2.id) is None
+    assert [a.title for a in author.articles()] == ["R"]
+    assert author.article_count() == 1
+
+@pytest.fixture
+def magazine_key():
+    create_magazine_key()
+    yield
+    with get_connection() as conn:
+        conn.execute("DROP INDEX idx_magazines_name_category")
+
+def test_upsert_by_name_and_category(magazine_key, sample_magazine):
+    assert Magazine("National Geographic", "Nature").upsert().id == sample_magazine.id
+    other = Magazine.find_or_create("National Geographic", "Travel")
+    assert other.id != sample_magazine.id
+
+    magazines = Magazine.upsert_many([
+        Magazine("National Geographic", "Travel"),
+        Magazine("Wired", "Technology"),
+        Magazine("National Geographic", "Nature"),
+    ])
+    assert [m.id for m in magazines[::2]] == [other.id, sample_magazine.id]
+    assert Magazine.find_by_id(magazines[1].id).name == "Wired"
+
+def test_magazine_key_rejects_duplicates():
+    Magazine.save_many([Magazine("Twin", "Same"), Magazine("Twin", "Same")])
+    with pytest.raises(sqlite3.IntegrityError):
+        create_magazine_key()
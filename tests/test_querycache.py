@@ -0,0 +1,127 @@
+import pytest
+from lib.models.author import Author, AuthorRow
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db import connection, querycache, statements
+from lib.db.connection import get_connection, transaction
+from lib.db.querycache import DiskCache, configure_query_cache, query_cache_stats
+from lib.db.schema import setup_schema
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+@pytest.fixture(params=['memory', 'disk'])
+def query_cache(request, tmp_path):
+    previous = querycache._backend
+    backend = 'memory' if request.param == 'memory' else f"disk:{tmp_path / 'cache.db'}"
+    yield configure_query_cache(backend)
+    querycache._backend = previous
+
+@pytest.fixture
+def sample_data():
+    alice, bob = Author.save_many([Author("Alice"), Author("Bob")])
+    magazine = Magazine("Cache Weekly", "Caching").save()
+    Article.save_many([Article(f"A{i}", alice.id, magazine.id) for i in range(3)]
+                      + [Article("B1", bob.id, magazine.id)])
+    return alice, bob, magazine
+
+def calls(name):
+    return statements.stats().get(name, {}).get('calls', 0)
+
+def test_repeated_calls_hit_the_cache(query_cache, sample_data):
+    alice, bob, magazine = sample_data
+    statements.reset_stats()
+
+    first = Magazine.find_with_multiple_authors()
+    second = Magazine.find_with_multiple_authors()
+    assert [m.id for m in first] == [m.id for m in second] == [magazine.id]
+    assert second[0] is not first[0]
+    assert calls('magazines.find_with_multiple_authors') == 1
+    assert [a.name for a in magazine.contributing_authors()] == ["Alice"]
+    assert [a.name for a in magazine.contributing_authors()] == ["Alice"]
+    assert magazine.contributors(tuples=True) == magazine.contributors(tuples=True)
+    assert set(magazine.contributors(tuples=True)) == {AuthorRow(alice.id, "Alice"), AuthorRow(bob.id, "Bob")}
+
+    stats = query_cache_stats()
+    assert stats['hits'] == 4 and stats['misses'] == 3
+    assert stats['statements']['magazines.contributing_authors']['hit_rate'] == 0.5
+
+def test_writes_invalidate_results(query_cache, sample_data):
+    alice, bob, magazine = sample_data
+    assert alice.magazines()[0].name == "Cache Weekly"
+
+    magazine.name = "Renamed Weekly"
+    magazine.save()
+    assert alice.magazines()[0].name == "Renamed Weekly"
+
+    Article("B2", bob.id, magazine.id).save()
+    Article("B3", bob.id, magazine.id).save()
+    assert sorted(a.name for a in magazine.contributing_authors()) == ["Alice", "Bob"]
+
+    bob.delete()
+    assert [a.name for a in magazine.contributing_authors()] == ["Alice"]
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles WHERE author_id=?", (alice.id,))
+    assert alice.magazines() == []
+    assert Magazine.find_with_multiple_authors() == []
+
+def test_results_inside_a_transaction_are_not_stored(query_cache, sample_data):
+    alice, bob, magazine = sample_data
+    with pytest.raises(RuntimeError):
+        with transaction():
+            Magazine("Doomed", "Caching").save()
+            assert "Doomed" in Magazine.article_counts()
+            raise RuntimeError
+    assert "Doomed" not in Magazine.article_counts()
+    Magazine("Other", "Caching").save()
+    assert "Doomed" not in Magazine.article_counts()
+
+def test_disk_cache_is_shared_between_instances(tmp_path, sample_data):
+    alice, bob, magazine = sample_data
+    path = str(tmp_path / 'shared.db')
+    previous = querycache._backend
+    try:
+        configure_query_cache(DiskCache(path))
+        alice.topic_areas()
+        other = configure_query_cache(DiskCache(path))
+        statements.reset_stats()
+        assert alice.topic_areas() == ["Caching"]
+        assert calls('authors.topic_areas') == 0
+        assert other.stats()['hits'] == 1
+    finally:
+        querycache._backend = previous
+
+def test_disabled_cache_passes_through(sample_data):
+    alice, bob, magazine = sample_data
+    previous = querycache._backend
+    configure_query_cache(None)
+    statements.reset_stats()
+    alice.magazines()
+    alice.magazines()
+    querycache._backend = previous
+    assert calls('authors.magazines') == 2
+    assert calls('table_versions.all') == 0
+
+def test_databases_with_equal_versions_do_not_share_results(tmp_path, query_cache):
+    previous = connection.DATABASE
+    try:
+        topics = []
+        for name, category in (('a.db', 'Astronomy'), ('b.db', 'Botany')):
+            connection.configure_pool(database=str(tmp_path / name))
+            setup_schema()
+            author = Author("Same").save()
+            magazine = Magazine("Same Mag", category).save()
+            Article("Same title", author.id, magazine.id).save()
+            topics.append(author.topic_areas())
+        assert topics == [['Astronomy'], ['Botany']]
+    finally:
+        connection.configure_pool(database=previous)
@@ -0,0 +1,136 @@
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db.connection import get_connection
+from lib.db.schema import (
+    setup_schema, migrate, schema_version, rebuild_aggregates, aggregate_drift, MIGRATIONS,
+)
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+@pytest.fixture
+def sample_data():
+    author = Author("Planner").save()
+    magazine = Magazine("Query Plans", "Databases").save()
+    Article("Indexes 101", author.id, magazine.id).save()
+    return author, magazine
+
+def traced_statements(call):
+    """
+    Runs `call` and returns the expanded SELECT statements it issued.
+    """
+    statements = []
+    with get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith('SELECT')]
+
+def test_migrations_are_versioned():
+    latest = MIGRATIONS[-1][0]
+    with get_connection() as conn:
+        assert schema_version(conn) == latest
+        assert migrate(conn) == latest
+        indexes = {row['name'] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {'idx_articles_author_magazine',
+            'idx_articles_magazine_author',
+            'idx_magazines_category'} <= indexes
+
+@pytest.mark.parametrize("method", [
+    lambda a, m: a.articles(),
+    lambda a, m: a.magazines(),
+    lambda a, m: a.topic_areas(),
+    lambda a, m: Author.most_published(),
+    lambda a, m: m.articles(),
+    lambda a, m: m.contributors(),
+    lambda a, m: m.contributing_authors(),
+    lambda a, m: Magazine.article_counts(),
+    lambda a, m: Magazine.find_with_multiple_authors(),
+    lambda a, m: Author.magazines_for([a.id]),
+    lambda a, m: Author.topic_areas_for([a.id]),
+    lambda a, m: Author.article_counts_for([a.id]),
+    lambda a, m: Magazine.contributors_for([m.id]),
+    lambda a, m: Magazine.contributing_authors_for([m.id]),
+    lambda a, m: list(a.iter_articles(after_id=1, limit=10)),
+    lambda a, m: list(m.iter_articles(after_id=1, limit=10)),
+    lambda a, m: list(m.iter_contributors(after_id=1, limit=10)),
+    lambda a, m: list(Magazine.iter_with_multiple_authors(after_id=1, limit=10)),
+])
+def test_model_queries_use_indexes(sample_data, method):
+    author, magazine = sample_data
+    statements = traced_statements(lambda: method(author, magazine))
+    assert statements
+    with get_connection() as conn:
+        for statement in statements:
+            plan = [row['detail'] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+            if 'ORDER BY id' in statement:
+                assert not any('TEMP B-TREE' in step for step in plan), f"{statement!r} sorts: {plan}"
+            for step in plan:
+                if 'articles' in step and step.startswith(('SCAN', 'SEARCH')):
+                    assert 'INDEX' in step, f"{statement!r} scans articles: {plan}"
+
+def test_summary_tables_follow_article_writes():
+    author1, author2 = Author.save_many([Author("Counter A"), Author("Counter B")])
+    magazine1, magazine2 = Magazine.save_many([Magazine("Counter 1", "C"), Magazine("Counter 2", "C")])
+    articles = Article.save_many([
+        Article("One", author1.id, magazine1.id),
+        Article("Two", author1.id, magazine1.id),
+        Article("Three", author2.id, magazine1.id),
+    ])
+    assert author1.article_count() == 2
+    assert magazine1.article_count() == 3
+    assert magazine1.author_count() == 2
+
+    articles[2].magazine_id = magazine2.id
+    articles[2].save()
+    assert magazine1.author_count() == 1
+    assert magazine2.article_count() == 1
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles WHERE author_id=?", (author1.id,))
+    assert author1.article_count() == 0
+    assert magazine1.article_count() == 0
+    assert magazine1.author_count() == 0
+    assert Author.most_published().id == author2.id
+
+    with get_connection() as conn:
+        assert aggregate_drift() == []
+
+def test_rebuild_repairs_drift(sample_data):
+    author, magazine = sample_data
+    with get_connection() as conn:
+        conn.execute("UPDATE author_stats SET article_count = 99")
+        conn.execute("DELETE FROM magazine_stats")
+    assert aggregate_drift()
+    rebuild_aggregates()
+    assert aggregate_drift() == []
+    assert author.article_count() == 1
+    assert Magazine.article_counts() == {"Query Plans": 1}
+
+def test_drift_covers_magazine_authors_and_empty_magazines(sample_data):
+    author, magazine = sample_data
+    empty = Magazine("Empty", "Databases").save()
+    with get_connection() as conn:
+        conn.execute("UPDATE magazine_authors SET article_count = 5")
+        conn.execute("INSERT INTO magazine_authors VALUES (?, ?, 1)", (empty.id, author.id))
+        conn.execute("INSERT INTO magazine_stats VALUES (?, 3, 1)", (empty.id,))
+    assert sorted(row[:2] for row in aggregate_drift()) == sorted([
+        ('magazine_authors', f"{empty.id}/{author.id}"),
+        ('magazine_authors', f"{magazine.id}/{author.id}"),
+        ('magazine_stats', empty.id),
+    ])
+    rebuild_aggregates()
+    assert aggregate_drift() == []
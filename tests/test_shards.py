@@ -0,0 +1,316 @@
+import sqlite3
+import threading
+import pytest
+from lib.db import cache, connection, shards
+from lib.db.changes import ChangeFeed, compact
+from lib.db.connection import transaction
+from lib.db.generate import generate
+from lib.db.schema import setup_schema
+from lib.db.shards import BUCKETS, bucket_of, configure_shards
+from lib.models.article import Article
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+
+@pytest.fixture
+def catalog(tmp_path):
+    """
+    Shards are separate files, so the catalog is one too rather than the
+    session's in-memory database.
+    """
+    previous = connection.DATABASE
+    connection.configure_pool(database=str(tmp_path / 'catalog.db'))
+    setup_schema()
+    generate(30, 5, 400, seed=5)
+    cache.clear()
+    yield tmp_path
+    configure_shards(False)
+    cache.clear()
+    connection.configure_pool(database=previous)
+
+def ids(instances):
+    return sorted(instance.id for instance in instances)
+
+def snapshot():
+    authors = [Author.find_by_id(id) for id in range(1, 31)]
+    magazines = [Magazine.find_by_id(id) for id in range(1, 6)]
+    author_ids = [a.id for a in authors]
+    magazine_ids = [m.id for m in magazines]
+    first = Article.find_by_id(1)
+    word = first.title.split()[0]
+    return {
+        'author_articles': {a.id: sorted(x.id for x in a.articles()) for a in authors},
+        'author_iter_articles': {a.id: [x.id for x in a.iter_articles(batch_size=3)] for a in authors},
+        'author_counts': {a.id: a.article_count() for a in authors},
+        'author_counts_for': Author.article_counts_for(author_ids),
+        'author_magazines': {a.id: ids(a.magazines()) for a in authors},
+        'magazines_for': {id: ids(ms) for id, ms in Author.magazines_for(author_ids).items()},
+        'topic_areas': {a.id: sorted(a.topic_areas()) for a in authors},
+        'topic_areas_for': {id: sorted(ts) for id, ts in Author.topic_areas_for(author_ids).items()},
+        'magazine_articles': {m.id: [x.id for x in m.articles()] for m in magazines},
+        'magazine_iter_articles': {m.id: [x.id for x in m.iter_articles(batch_size=7)] for m in magazines},
+        'magazine_titles': {m.id: sorted(m.article_titles()) for m in magazines},
+        'magazine_stats': {m.id: (m.article_count(), m.author_count()) for m in magazines},
+        'contributors': {m.id: ids(m.contributors()) for m in magazines},
+        'contributors_for': {id: ids(a) for id, a in Magazine.contributors_for(magazine_ids).items()},
+        'iter_contributors': {m.id: [a.id for a in m.iter_contributors(batch_size=4)] for m in magazines},
+        'contributing_authors': {m.id: ids(m.contributing_authors()) for m in magazines},
+        'contributing_authors_for': {
+            id: ids(a) for id, a in Magazine.contributing_authors_for(magazine_ids).items()},
+        'multiple_authors': ids(Magazine.find_with_multiple_authors()),
+        'iter_multiple_authors': [m.id for m in Magazine.iter_with_multiple_authors(after_id=1, limit=3)],
+        'article_counts': Magazine.article_counts(),
+        'most_published': Author.most_published().id,
+        'search': sorted(hit.article.id for hit in Article.search(word, limit=1000)),
+        'author_search': [hit.article.id for hit in Article.search(word, author_id=first.author_id, limit=1000)],
+        'preloaded': [(x.id, x.author().name) for x in magazines[0].articles(include=('author',))],
+    }
+
+def count(path, sql="SELECT COUNT(*) FROM articles"):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_catalog_starts_as_the_only_shard(catalog):
+    before = snapshot()
+    router = configure_shards()
+    assert [shard.is_catalog for shard in router.shards.values()] == [True]
+    assert snapshot() == before
+    assert router.next_id() == 401
+
+def test_reshard_splits_articles_by_author(catalog):
+    before = snapshot()
+    router = configure_shards()
+    paths = [str(catalog / f'shard-{i}.db') for i in range(3)]
+    assert router.reshard(paths) == 400
+
+    assert count(str(catalog / 'catalog.db')) == 0
+    assert sum(count(path) for path in paths) == 400
+    assert [shard.path for shard in router.shards.values()] == paths
+    for shard in router.shards.values():
+        with shard.connection() as conn:
+            author_ids = [row[0] for row in conn.execute("SELECT DISTINCT author_id FROM articles")]
+        assert all(router.shard_for(id) is shard for id in author_ids)
+
+    cache.clear()
+    assert snapshot() == before
+    for path in paths:
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+        conn.close()
+
+def test_reads_route_to_one_or_all_shards(catalog):
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    author = Author.find_by_id(1)
+    home = router.shard_for(author.id)
+
+    def calls():
+        return {shard.id: shard.pool.stats()['hits'] + shard.pool.stats()['misses']
+                for shard in router.shards.values()}
+
+    start = calls()
+    author.articles()
+    after = calls()
+    assert [id for id in after if after[id] != start[id]] == [home.id]
+
+    Magazine.find_by_id(1).articles()
+    assert all(calls()[id] > after[id] for id in after)
+
+def test_writes_go_to_the_author_shard(catalog):
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    first, second = (Author.find_by_id(id) for id in (1, 2))
+    while router.shard_for(second.id) is router.shard_for(first.id):
+        second = Author.find_by_id(second.id + 1)
+    magazine = Magazine.find_by_id(1)
+
+    article = first.add_article(magazine, "Routed")
+    assert article.id == 401
+    assert article.id in [a.id for a in first.articles()]
+    assert router.shard_for(first.id).fetchall('articles.find_by_id', (article.id,))
+
+    article.author_id = second.id
+    article.save()
+    assert not router.shard_for(first.id).fetchall('articles.find_by_id', (article.id,))
+    cache.clear()
+    assert Article.find_by_id(article.id).author_id == second.id
+    assert article.id in [a.id for a in magazine.articles()]
+
+    assert article.delete()
+    assert Article.find_by_id(article.id) is None
+
+def test_save_many_takes_ids_from_the_sequence(catalog):
+    router = configure_shards()
+    magazine = Magazine.find_by_id(1)
+    first = Article.save_many([Article(f"Batch {i}", i % 30 + 1, magazine.id) for i in range(10)])
+    # Before resharding the catalog is the shard, and its AUTOINCREMENT must not hand out 401 again.
+    assert [a.id for a in first] == list(range(401, 411))
+    assert Article("Single", 1, magazine.id).save().id == 411
+
+    paths = [str(catalog / f'shard-{i}.db') for i in range(2)]
+    router.reshard(paths)
+    second = Article.save_many([Article(f"Later {i}", i % 30 + 1, magazine.id) for i in range(10)])
+    assert [a.id for a in second] == list(range(412, 422))
+    assert count(str(catalog / 'catalog.db')) == 0
+    assert sum(count(path) for path in paths) == 421
+    for article in second:
+        assert router.shard_for(article.author_id).fetchall('articles.find_by_id', (article.id,))
+
+    second[0].title = "Later, revised"
+    Article.save_many(second[:1])
+    cache.clear()
+    assert Article.find_by_id(second[0].id).title == "Later, revised"
+
+def test_catalog_edits_reach_the_shards(catalog):
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    author = Author.find_by_id(1)
+    magazine = author.magazines()[0]
+    magazine.category = "Renamed"
+    magazine.save()
+    assert "Renamed" in author.topic_areas()
+    author.name = "Someone Else"
+    Author.save_many([author])
+    assert author.id in [a.id for a in magazine.contributors() if a.name == "Someone Else"]
+
+def test_transactions_are_refused_while_sharded(catalog):
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    author = Author.find_by_id(1)
+    before = len(author.articles())
+    article = Article("Uncommitted", author.id, 1)
+    with pytest.raises(RuntimeError, match="sharded"):
+        with transaction():
+            article.save()
+    assert article.id is None
+    assert len(author.articles()) == before
+
+def test_catalog_only_tools_are_refused_while_sharded(catalog):
+    from lib.db.export import export
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    with pytest.raises(RuntimeError, match="sharded"):
+        generate(1, 1, 10)
+    with pytest.raises(RuntimeError, match="sharded"):
+        export(str(catalog / 'export'))
+    analytics = pytest.importorskip("lib.db.analytics")
+    with pytest.raises(RuntimeError, match="sharded"):
+        analytics.Snapshot.load()
+    assert count(str(catalog / 'catalog.db')) == 0
+
+def test_deleting_an_author_cascades_on_its_shard(catalog):
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    author = Author.find_by_id(Author.most_published().id)
+    shard = router.shard_for(author.id)
+    assert author.articles()
+    assert author.delete()
+    assert not shard.fetchall('authors.articles', (author.id,))
+
+def test_reshard_back_to_the_catalog(catalog):
+    before = snapshot()
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(3)])
+    router.reshard([str(catalog / 'shard-0.db'), str(catalog / 'shard-3.db')])
+    assert count(str(catalog / 'shard-1.db')) == count(str(catalog / 'shard-2.db')) == 0
+    moved = router.reshard([connection.DATABASE])
+    assert moved == count(str(catalog / 'catalog.db')) == 400
+    assert len(router.shards) == 1
+    cache.clear()
+    assert snapshot() == before
+
+def test_writes_during_reshard_are_not_lost(catalog):
+    router = configure_shards()
+    magazine = Magazine.find_by_id(1)
+    written = []
+    errors = []
+
+    def writer():
+        try:
+            for i in range(200):
+                written.append(Article(f"Live {i}", i % 30 + 1, magazine.id).save().id)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(3)])
+    thread.join()
+    assert not errors
+    assert len(set(written)) == 200
+    assert count(str(catalog / 'catalog.db')) == 0
+    assert sum(len(rows) for rows in router.fan_out('magazines.articles', (magazine.id,))) == \
+        len(magazine.articles())
+    assert sum(count(str(catalog / f'shard-{i}.db')) for i in range(3)) == 600
+
+def test_most_published_breaks_ties_the_same_way_when_sharded(catalog):
+    top = Author.most_published()
+    tie = Author("Tied Author").save()
+    Article.save_many([Article(f"Tie {i}", tie.id, 1) for i in range(top.article_count())])
+    assert Author.most_published().id == top.id
+    router = configure_shards()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    assert Author.most_published().id == top.id
+
+def test_change_feed_tails_every_shard(catalog):
+    router = configure_shards()
+    feed = ChangeFeed('sync')
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    moves = [change for batch in feed.batches() for change in batch]
+    assert sum(change.op == 'delete' for change in moves) == 400
+    assert sum(change.op == 'insert' and change.shard is not None for change in moves) == 400
+
+    magazine = Magazine.find_by_id(1)
+    ids = [Article(f"Fed {i}", i + 1, magazine.id).save().id for i in range(6)]
+    Article.delete_many(ids[:1])
+    assert feed.lag() == 7
+    seen = [change for batch in feed.batches() for change in batch]
+    assert sorted(c.row_id for c in seen if c.op == 'insert') == ids
+    assert [c.row_id for c in seen if c.op == 'delete'] == ids[:1]
+    assert {c.table for c in seen} == {'articles'}
+    assert {c.shard for c in seen} == set(router.shards)
+    assert feed.lag() == 0
+    assert ChangeFeed('sync').read() == []
+
+def test_reads_during_reshard_see_every_article(catalog):
+    router = configure_shards()
+    magazine = Magazine.find_by_id(1)
+    expected = [a.id for a in magazine.articles()]
+    done = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            while not done.is_set():
+                assert [a.id for a in magazine.articles()] == expected
+                Magazine.article_counts()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(3)])
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(1, 4)])
+    done.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def test_compact_keeps_new_shards_for_consumers_yet_to_read_them(catalog):
+    router = configure_shards()
+    slow = ChangeFeed('slow')
+    fast = ChangeFeed('fast')
+    router.reshard([str(catalog / f'shard-{i}.db') for i in range(2)])
+    for _ in fast.batches():
+        pass
+    compact()
+    moved = [change for batch in slow.batches() for change in batch if change.shard is not None]
+    assert sum(change.op == 'insert' for change in moved) == 400
+
+def test_bucket_of_spreads_sequential_ids():
+    buckets = {bucket_of(id) for id in range(1, 1001)}
+    assert len(buckets) == BUCKETS
+    assert shards.active() is None
@@ -0,0 +1,49 @@
+import logging
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.models.article import Article
+from lib.db import statements
+from lib.db.connection import get_connection
+from lib.db.schema import setup_schema
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    statements.reset_stats()
+    yield
+    statements.configure(slow_query_ms=None)
+
+def test_stats_count_calls_and_rows():
+    author = Author("Counted").save()
+    magazine = Magazine("Counted Mag", "Stats").save()
+    Article.save_many([Article(f"Counted {i}", author.id, magazine.id) for i in range(3)])
+
+    author.articles()
+    author.articles()
+    list(magazine.iter_articles(batch_size=2))
+
+    stats = statements.stats()
+    assert stats['authors.articles']['calls'] == 2
+    assert stats['authors.articles']['rows'] == 6
+    assert stats['magazines.iter_articles']['rows'] == 3
+    assert stats['articles.insert']['rows'] == 3
+    assert stats['authors.articles']['p99_ms'] >= stats['authors.articles']['p50_ms'] >= 0
+
+def test_partial_updates_are_accounted_under_update():
+    author = Author("Renamed").save()
+    author.name = "Renamed Again"
+    author.save()
+    assert statements.stats()['authors.update']['calls'] == 1
+
+def test_slow_query_log(caplog):
+    statements.configure(slow_query_ms=0)
+    with caplog.at_level(logging.WARNING, logger='lib.db.statements'):
+        Author.most_published()
+    assert any('authors.most_published' in record.getMessage() for record in caplog.records)
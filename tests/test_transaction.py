@@ -0,0 +1,86 @@
+import pytest
+from lib.models.author import Author
+from lib.models.magazine import Magazine
+from lib.db import transaction
+from lib.db.connection import get_connection
+from lib.db.schema import setup_schema
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    setup_schema()
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM articles")
+        conn.execute("DELETE FROM authors")
+        conn.execute("DELETE FROM magazines")
+        conn.commit()
+    yield
+
+def count_commits(call):
+    statements = []
+    with get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+    return sum(s.strip().upper() == 'COMMIT' for s in statements)
+
+def test_transaction_commits_once():
+    def writes():
+        with transaction():
+            author = Author("Unit Author").save()
+            magazine = Magazine("Unit Mag", "Unit").save()
+            author.add_article(magazine, "First")
+            author.add_article(magazine, "Second")
+
+    assert count_commits(writes) == 1
+    assert len(Author.find_by_name("Unit Author").articles()) == 2
+
+def test_transaction_rolls_back_on_error():
+    doomed = Author("Doomed")
+    with pytest.raises(RuntimeError):
+        with transaction():
+            doomed.save()
+            raise RuntimeError("boom")
+    assert Author.find_by_name("Doomed") is None
+    assert doomed.id is None
+
+    doomed.save()
+    assert Author.find_by_name("Doomed").id == doomed.id
+
+def test_rollback_restores_pending_changes():
+    author = Author("Before").save()
+    author.name = "After"
+    with pytest.raises(RuntimeError):
+        with transaction():
+            author.save()
+            raise RuntimeError("boom")
+    assert author._dirty == {'name'}
+
+    author.save()
+    assert Author.find_by_id(author.id).name == "After"
+
+def test_nested_transaction_uses_savepoint():
+    inner = Author("Inner")
+    with transaction():
+        outer = Author("Outer").save()
+        with pytest.raises(RuntimeError):
+            with transaction():
+                inner.save()
+                raise RuntimeError("inner failure")
+        Author("After").save()
+
+    assert Author.find_by_name("Outer") is not None
+    assert Author.find_by_name("Inner") is None
+    assert outer.id is not None and inner.id is None
+    assert Author.find_by_name("After") is not None
+
+def test_add_flushes_pending_objects():
+    with transaction() as tx:
+        author = tx.add(Author("Pending"))
+        magazines = tx.add(Magazine("Pending A", "P"), Magazine("Pending B", "P"))
+        assert author.id is None
+    assert author.id is not None
+    assert all(m.id for m in magazines)
+    assert Author.find_by_name("Pending").id == author.id